@@ -1,11 +1,35 @@
-from flask import Blueprint, jsonify, request
-import os
-import requests
-from models import User, UserMovie, Movie, db
+import time
+from itertools import islice
+
+from flask import Blueprint, current_app, jsonify, request
+from indexes import GenreQueryError, cached_user_list, get_genre_index
+from indexes import get_suggest_index, in_ids, serialize_user_movie
+from models import User, Movie, UserMovie, db, get_or_create
+from models import change_floor, changes_since, current_tenant, format_position
+from models import parse_position, tenant_changes_since, tenant_floor
+from omdb import OMDbError, QuotaExhausted, get_client, local_search, movie_fields
+from omdb import upsert_movie
+from sqlalchemy.orm import joinedload
+from omdb import init_app as init_omdb
+from stats import global_stats, user_stats
+from web import admission_status, conditional, format_event, memory_profile
+from web import optional_admission, sse_response, template_timings
 
 api = Blueprint("api", __name__)
 
 
+@api.record_once
+def setup(state):
+    """Create the shared OMDb client used by the import endpoints."""
+    init_omdb(state.app)
+    # /api/changes long polling and streaming
+    state.app.config.setdefault("CHANGES_MAX_WAIT", 30.0)
+    state.app.config.setdefault("CHANGES_POLL_INTERVAL", 0.5)
+    state.app.config.setdefault("CHANGES_STREAM_SECONDS", 300.0)
+    # /api/movies/suggest: ask OMDb only below this many local matches
+    state.app.config.setdefault("SUGGEST_MIN_LOCAL", 3)
+
+
 @api.route("/message", methods=["GET"])
 def get_message():
     """Return a simple JSON greeting message."""
@@ -26,6 +50,7 @@ def greet_user(name):
 
 
 @api.route("/users", methods=["GET"])
+@conditional("users")
 def get_users():
     """Retrieve all users in JSON format.
 
@@ -42,34 +67,359 @@ def get_users():
 
 
 @api.route("/users/<int:user_id>/movies", methods=["GET"])
+@conditional("catalogue", "user:{user_id}")
 def get_user_movies(user_id):
     """Retrieve a specific user's favorite movies.
 
     Args:
         user_id (int): ID of the user whose movies to fetch.
 
+    Query Args:
+        genres (str): Optional genre query, e.g. "Action AND NOT Horror".
+
     Returns:
         Response: JSON list of the user's movies or error if user not found.
     """
-    user = User.query.get(user_id)
-    if not user:
+    genre_query = request.args.get("genres", "").strip()
+
+    def build():
+        if not User.query.get(user_id):
+            return None
+        # only the columns serialize_user_movie reads, not plots
+        query = UserMovie.query.filter_by(user_id=user_id).options(
+            joinedload(UserMovie.movie).load_only(
+                Movie.id,
+                Movie.title,
+                Movie.director,
+                Movie.year,
+                Movie.omdb_id,
+                Movie.poster_url,
+            )
+        )
+        if genre_query:
+            movie_ids, _ = get_genre_index().query(genre_query, user_id=user_id)
+            query = query.filter(in_ids(UserMovie.movie_id, movie_ids))
+        return [serialize_user_movie(um) for um in query]
+
+    # Polls are served from the list cache until the list or catalogue changes
+    try:
+        movies = cached_user_list(user_id, ("api", genre_query), build)
+    except GenreQueryError as e:
+        return jsonify({"error": str(e)}), 400
+    if movies is None:
         return jsonify({"error": "User not found"}), 404
+    return jsonify(movies)
+
+
+@api.route("/movies/genre-query", methods=["GET"])
+def query_genres():
+    """Evaluate a boolean genre query on the genre bitmap index.
+
+    Query Args:
+        q (str): Genre query, e.g. "(Drama OR Romance) AND NOT War".
+        user_id (int): Only movies in this user's list.
+        offset (int): Matching ids to skip (default 0).
+        limit (int): Maximum ids to return (default 1000).
+
+    Returns:
+        Response: JSON object with the canonical query, the number of
+        matching movies and one page of their ids in ascending order, or
+        an error for a malformed query.
+    """
+    user_id = request.args.get("user_id", type=int)
+    if user_id is not None and not User.query.get(user_id):
+        return jsonify({"error": "User not found"}), 404
+    offset = max(request.args.get("offset", 0, type=int), 0)
+    limit = max(request.args.get("limit", 1000, type=int), 0)
+    try:
+        movie_ids, canonical = get_genre_index().query(
+            request.args.get("q", ""), user_id=user_id
+        )
+    except GenreQueryError as e:
+        return jsonify({"error": str(e)}), 400
+    page = list(islice(movie_ids, offset, offset + limit))
+    return jsonify({"query": canonical, "count": len(movie_ids), "movie_ids": page})
+
+
+@api.route("/movies/suggest", methods=["GET"])
+def suggest_movies():
+    """Suggest movies for a partly typed title or director name.
+
+    Answered from the in-memory prefix index, best IMDb rating first. Only
+    when fewer than SUGGEST_MIN_LOCAL local movies match (and ``q`` has at
+    least 3 characters) is OMDb searched for more; those entries have no
+    ``id`` and are added through ``/add_movie/<imdb_id>``.
+
+    Query Args:
+        q (str): Typed text.
+        limit (int): Maximum suggestions (default 8, max 25).
+        omdb (str): "0" never asks OMDb.
+
+    Returns:
+        Response: JSON object with the ``query`` and ``suggestions``, each
+        with its ``source`` ("local" or "omdb").
+    """
+    query = request.args.get("q", "").strip()
+    limit = min(max(request.args.get("limit", 8, type=int), 1), 25)
+    if not query:
+        return jsonify({"query": query, "suggestions": []})
+
+    ids = get_suggest_index().suggest(query, limit)
+    movies = {m.id: m for m in Movie.query.filter(Movie.id.in_(ids))} if ids else {}
+    suggestions = [
+        {
+            "source": "local",
+            "id": movie.id,
+            "title": movie.title,
+            "year": movie.year,
+            "director": movie.director,
+            "imdb_rating": movie.imdb_rating,
+            "imdb_id": movie.omdb_id,
+            "poster_url": movie.poster_url,
+        }
+        # keep the index's rating order; skip rows deleted meanwhile
+        for movie in (movies.get(movie_id) for movie_id in ids)
+        if movie is not None
+    ]
+
+    if (
+        len(suggestions) < current_app.config["SUGGEST_MIN_LOCAL"]
+        and len(query) >= 3
+        and request.args.get("omdb") != "0"
+        and current_app.config.get("OMDB_API_KEY")
+    ):
+        known = {s["imdb_id"] for s in suggestions}
+        results = []
+        # a slot of the OMDb class and the user's suggestion budget, else
+        # local suggestions only: this runs on keystrokes
+        with optional_admission("omdb_suggest", "omdb") as admitted:
+            if admitted:
+                try:
+                    # cached and shared with concurrent identical searches
+                    results = get_client().search(query)
+                except OMDbError:
+                    # out of quota or unreachable: local suggestions only
+                    pass
+        for result in results:
+            if len(suggestions) >= limit:
+                break
+            if result.get("imdbID") in known:
+                continue
+            suggestions.append(
+                {
+                    "source": "omdb",
+                    "id": None,
+                    "title": result.get("Title"),
+                    "year": result.get("Year"),
+                    "director": None,
+                    "imdb_rating": None,
+                    "imdb_id": result.get("imdbID"),
+                    "poster_url": (
+                        None
+                        if result.get("Poster") in (None, "N/A")
+                        else result["Poster"]
+                    ),
+                }
+            )
+    return jsonify({"query": query, "suggestions": suggestions})
+
+
+@api.route("/stats", methods=["GET"])
+def get_stats():
+    """Retrieve catalogue-wide statistics from the rollup tables.
+
+    Query Args:
+        weeks (int): Number of recent weeks of additions to include (default 12).
+
+    Returns:
+        Response: JSON object with counts, ratios, genres and weekly additions.
+    """
+    weeks = request.args.get("weeks", 12, type=int)
+    return jsonify(global_stats(weeks=weeks))
+
+
+@api.route("/users/<int:user_id>/stats", methods=["GET"])
+@conditional("catalogue", "user:{user_id}")
+def get_user_stats(user_id):
+    """Retrieve statistics for a single user's list.
+
+    Args:
+        user_id (int): ID of the user whose statistics to fetch.
+
+    Returns:
+        Response: JSON object with the user's statistics or error if not found.
+    """
+    if not User.query.get(user_id):
+        return jsonify({"error": "User not found"}), 404
+    weeks = request.args.get("weeks", 12, type=int)
+    return jsonify(user_stats(user_id, weeks=weeks))
+
+
+@api.route("/omdb/quota", methods=["GET"])
+def get_omdb_quota():
+    """Report the remaining OMDb request budget for the configured key.
+
+    Returns:
+        Response: JSON with today's usage, remaining requests per priority
+        and the current token bucket level.
+    """
+    status = get_client().quota_status()
+    if status is None:
+        return jsonify({"error": "OMDb rate limiting is not configured"}), 404
+    return jsonify(status)
 
+
+@api.route("/debug/templates", methods=["GET"])
+def get_template_timings():
+    """Report template render timings aggregated by this worker process.
+
+    Returns:
+        Response: JSON list of per-template and per-block timings, or 404
+        unless TEMPLATE_PROFILING is enabled.
+    """
+    if not current_app.config.get("TEMPLATE_PROFILING"):
+        return jsonify({"error": "Template profiling is not enabled"}), 404
+    return jsonify(template_timings())
+
+
+@api.route("/debug/memory", methods=["GET"])
+def get_memory_profile():
+    """Report per-endpoint memory peaks and allocation sites of this process.
+
+    Returns:
+        Response: JSON list of per-endpoint peaks and top allocation sites,
+        or 404 unless MEMORY_PROFILING is enabled.
+    """
+    if not current_app.config.get("MEMORY_PROFILING"):
+        return jsonify({"error": "Memory profiling is not enabled"}), 404
+    return jsonify(memory_profile(current_app.config["MEMORY_PROFILING_TOP"]))
+
+
+@api.route("/debug/admission", methods=["GET"])
+def get_admission_status():
+    """Report admission control counters of this worker process.
+
+    Returns:
+        Response: JSON with per-class concurrency, queue and rejection
+        counts and per-rule rate limit refusals, or 404 if disabled.
+    """
+    status = admission_status()
+    if status is None:
+        return jsonify({"error": "Admission control is not enabled"}), 404
+    return jsonify(status)
+
+
+@api.route("/changes", methods=["GET"])
+def get_changes():
+    """Return change log entries after a sequence number.
+
+    Long polls with ``wait``; streams Server-Sent Events when the client
+    asks for ``text/event-stream`` (``EventSource``) or passes ``stream=1``.
+
+    In a tenant, the feed merges the catalogue's log (movies, genres) and
+    the tenant's (users, lists). Positions there are
+    ``"<catalogue seq>:<tenant seq>"`` and every entry carries the
+    ``log`` it comes from and the ``position`` to resume from.
+
+    Query Args:
+        since (int): Last sequence number the consumer applied (default 0;
+            a stream resumes from the ``Last-Event-ID`` header instead).
+        limit (int): Maximum entries per response (default 500, max 5000).
+        tables (str): Comma-separated tables to include, e.g.
+            "movies,movie_genre".
+        wait (float): Seconds to wait for new entries if there are none
+            (capped by CHANGES_MAX_WAIT).
+
+    Returns:
+        Response: JSON object with the entries, ``last_seq`` to pass as the
+        next ``since`` and the compaction ``floor``; 410 if ``since`` is
+        below the floor, meaning the consumer must re-read the tables; 400
+        for a malformed tenant position.
+    """
+    config = current_app.config
+    limit = min(max(request.args.get("limit", 500, type=int), 1), 5000)
+    tables = [t for t in request.args.get("tables", "").split(",") if t] or None
+    wait = min(
+        max(request.args.get("wait", 0, type=float), 0), config["CHANGES_MAX_WAIT"]
+    )
+    poll = config["CHANGES_POLL_INTERVAL"]
+
+    if current_tenant() is not None:
+        try:
+            since = parse_position(
+                request.headers.get("Last-Event-ID") or request.args.get("since")
+            )
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        floor = tenant_floor()
+        compacted = since[0] < floor[0] or since[1] < floor[1]
+        floor_value = format_position(floor)
+
+        def read(position, wait):
+            return tenant_changes_since(
+                position, limit, tables, wait=wait, poll_interval=poll
+            )
+
+        def cursor(position):
+            return format_position(position)
+
+    else:
+        since = request.headers.get("Last-Event-ID", type=int)
+        if since is None:
+            since = request.args.get("since", 0, type=int)
+        floor = floor_value = change_floor()
+        compacted = since < floor
+
+        def read(position, wait):
+            entries = changes_since(
+                position, limit, tables, wait=wait, poll_interval=poll
+            )
+            return entries, entries[-1]["seq"] if entries else position
+
+        def cursor(position):
+            return position
+
+    if compacted:
+        return (
+            jsonify(
+                {
+                    "error": "Changes were compacted; re-read the tables",
+                    "floor": floor_value,
+                }
+            ),
+            410,
+        )
+
+    if (
+        request.args.get("stream") == "1"
+        or request.accept_mimetypes.best == "text/event-stream"
+    ):
+
+        def events():
+            position = since
+            deadline = time.monotonic() + config["CHANGES_STREAM_SECONDS"]
+            while time.monotonic() < deadline:
+                entries, after = read(position, poll)
+                if not entries:
+                    yield None
+                for entry in entries:
+                    yield format_event(
+                        entry,
+                        event="change",
+                        id=entry.get("position", entry["seq"]),
+                    )
+                position = after
+            # the client reconnects with Last-Event-ID
+
+        return sse_response(events())
+
+    entries, after = read(since, wait)
     return jsonify(
-        [
-            {
-                "id": um.movie.id,
-                "title": um.movie.title,
-                "director": um.movie.director,
-                "year": um.movie.year,
-                "omdb_id": um.movie.omdb_id,
-                "poster_url": um.movie.poster_url,
-                "rating": um.rating,
-                "watched": um.watched,
-                "added_on": um.added_on.isoformat(),
-            }
-            for um in user.favorites
-        ]
+        {
+            "changes": entries,
+            "last_seq": cursor(after),
+            "floor": floor_value,
+        }
     )
 
 
@@ -95,8 +445,8 @@ def add_favorite_movies(user_id):
         return jsonify({"error": "Request body required"}), 400
 
     items = data if isinstance(data, list) else [data]
-    api_key = os.environ.get("OMDB_API_KEY")
-    if not api_key:
+    client = get_client()
+    if not client.api_key:
         return jsonify({"error": "OMDB API key not configured"}), 500
 
     added, errors = [], []
@@ -108,59 +458,36 @@ def add_favorite_movies(user_id):
             errors.append({"movie": item, "error": "title or imdb_id required"})
             continue
         try:
-            # If title provided, search OMDb to get imdb_id
+            # If title provided, search OMDb to get imdb_id. Bulk imports
+            # run at "bulk" priority so they cannot starve interactive searches.
             if title and not imdb_id:
-                resp = requests.get(
-                    "http://www.omdbapi.com/",
-                    params={"s": title, "apikey": api_key, "type": "movie"},
-                )
-                resp.raise_for_status()
-                sd = resp.json()
-                if sd.get("Response") != "True" or not sd.get("Search"):
-                    raise ValueError(sd.get("Error", "No results"))
-                imdb_id = sd["Search"][0].get("imdbID")
-
-            # Fetch full details from OMDb
-            resp = requests.get(
-                "http://www.omdbapi.com/",
-                params={"i": imdb_id, "apikey": api_key, "plot": "short"},
-            )
-            resp.raise_for_status()
-            details = resp.json()
-            if details.get("Response") != "True":
-                raise ValueError(details.get("Error", "Detail fetch failed"))
-
-            # Parse year
-            year_val = None
-            yr = details.get("Year")
-            if yr:
-                if "-" in yr:
-                    yr = yr.split("-")[0]
-                if yr.isdigit():
-                    year_val = int(yr)
-
-            # Create or get movie
+                try:
+                    results = client.search(title, priority="bulk")
+                except QuotaExhausted:
+                    # Out of budget: a movie already in the catalogue will do
+                    results = local_search(title, limit=1)
+                    if not results:
+                        raise
+                if not results:
+                    raise ValueError("No results")
+                imdb_id = results[0].get("imdbID")
+
             movie = Movie.query.filter_by(omdb_id=imdb_id).first()
             if not movie:
-                poster = details.get("Poster")
-                poster_url = poster if poster != "N/A" else None
-                movie = Movie(
-                    title=details.get("Title"),
-                    director=details.get("Director"),
-                    year=year_val,
-                    omdb_id=imdb_id,
-                    plot_short=details.get("Plot", ""),
-                    imdb_rating=details.get("imdbRating"),
-                    poster_url=poster_url,
-                )
-                db.session.add(movie)
+                # Fetch full details from OMDb (cached and coalesced)
+                details = client.details(imdb_id, priority="bulk")
+
+                # Create or get movie (idempotent insert keyed on omdb_id)
+                movie, _ = upsert_movie(movie_fields(imdb_id, details))
                 db.session.commit()
 
-            # Link to user
-            link = UserMovie.query.get((user_id, movie.id))
-            if not link:
-                link = UserMovie(user_id=user_id, movie_id=movie.id)
-                db.session.add(link)
+            # Link to user (idempotent insert keyed on the primary key)
+            _, linked = get_or_create(
+                UserMovie,
+                ("user_id", "movie_id"),
+                {"user_id": user_id, "movie_id": movie.id},
+            )
+            if linked:
                 db.session.commit()
 
             added.append(
@@ -0,0 +1,535 @@
+"""Flask CLI commands (``flask --app app.py <command>``)."""
+
+import datetime
+import time
+
+import click
+from sqlalchemy import func, select
+from sqlalchemy.engine import make_url
+
+from indexes import CatalogueSnapshot, get_snapshot
+from media import deletion_status, get_admin_api, purge_deletions, sweep_orphans
+from media import init_app as init_media
+from models import db, Genre, Movie, User, compact_changes, get_or_create, get_router
+from models import get_tenants, read_assignments, split_tenants, sync_sqlite_replica
+from models import use_tenant
+from omdb import FixtureBackend, detail_response, get_client, make_standin_server
+from omdb import init_app as init_omdb
+from omdb import refresh_catalogue, write_fixture
+from stats import check_rollups, rebuild_rollups
+from web import build_assets, compile_templates, warm_up
+
+
+def register_commands(app):
+    """Attach the maintenance commands to ``app.cli``."""
+
+    @app.cli.command("init-db")
+    def init_db():
+        """Drop all tables and recreate them to initialize the database."""
+        db.drop_all()
+        db.create_all()
+        print(f"✅ Database initialized at {db.engine.url.database}")
+
+    @app.cli.command("seed-genres")
+    def seed_genres():
+        """Seed the database with a predefined list of movie genres."""
+        genres_to_add = [
+            "Action",
+            "Adventure",
+            "Animation",
+            "Biography",
+            "Comedy",
+            "Crime",
+            "Documentary",
+            "Drama",
+            "Family",
+            "Fantasy",
+            "Film Noir",
+            "History",
+            "Horror",
+            "Music",
+            "Musical",
+            "Mystery",
+            "Romance",
+            "Sci-Fi",
+            "Short Film",
+            "Sport",
+            "Superhero",
+            "Thriller",
+            "War",
+            "Western",
+        ]
+        # Genres that already exist (case-insensitive), in one query
+        existing = set(db.session.scalars(select(func.lower(Genre.name))))
+        count = 0
+        for genre_name in genres_to_add:
+            if genre_name.lower() in existing:
+                continue
+            try:
+                # ON CONFLICT DO NOTHING: a concurrent seed cannot collide
+                _, created = get_or_create(Genre, ("name",), {"name": genre_name})
+                db.session.commit()
+                count += created
+            except Exception as e:
+                db.session.rollback()
+                print(f"Error adding genre '{genre_name}': {e}")
+
+        if count > 0:
+            print(f"✅ Added {count} new genres to the database.")
+        else:
+            print("ℹ️ All predefined genres already exist in the database.")
+
+    @app.cli.command("rebuild-stats")
+    @click.option(
+        "--check", is_flag=True, help="Only report drift, do not rewrite rollups."
+    )
+    def rebuild_stats(check):
+        """Recompute the statistics rollup tables from the base tables."""
+        if check:
+            problems = check_rollups()
+            for problem in problems:
+                print(f"❌ {problem}")
+            if problems:
+                raise SystemExit(1)
+            print("✅ Statistics rollups are consistent.")
+            return
+        written = rebuild_rollups()
+        for table, rows in written.items():
+            print(f"✅ Rebuilt {table}: {rows} rows")
+
+    @app.cli.command("build-assets")
+    def build_assets_command():
+        """Fingerprint, minify and precompress static files into static/dist."""
+        manifest = build_assets(app.static_folder)
+        for name, target in sorted(manifest.items()):
+            print(f"✅ {name} -> {target}")
+
+    @app.cli.command("compile-templates")
+    def compile_templates_command():
+        """Compile all templates into the shared Jinja bytecode cache."""
+        compiled, failed = compile_templates(app)
+        for problem in failed:
+            print(f"❌ {problem}")
+        print(
+            f"✅ Compiled {len(compiled)} templates into "
+            f"{app.config['TEMPLATE_CACHE_DIR']}"
+        )
+        if failed:
+            raise SystemExit(1)
+
+    @app.cli.command("refresh-catalogue")
+    @click.option("--limit", type=int, default=None, help="Maximum movies per run.")
+    @click.option("--batch-size", type=int, default=50, show_default=True)
+    @click.option("--workers", type=int, default=4, show_default=True)
+    @click.option(
+        "--max-age-days",
+        type=float,
+        default=30,
+        show_default=True,
+        help="Refresh movies not refreshed for this many days.",
+    )
+    @click.option("--loop", is_flag=True, help="Keep running as a worker.")
+    @click.option(
+        "--interval",
+        type=int,
+        default=3600,
+        show_default=True,
+        help="Seconds between runs with --loop.",
+    )
+    def refresh_catalogue_command(
+        limit, batch_size, workers, max_age_days, loop, interval
+    ):
+        """Re-fetch stale OMDb fields (rating, poster, plot) for movies."""
+        # the OMDb client is normally set up by the blueprints that use it
+        init_omdb(app)
+        if not app.config["OMDB_API_KEY"]:
+            print("❌ OMDB_API_KEY is not set.")
+            raise SystemExit(1)
+
+        def report(totals):
+            print(
+                f"  batch {totals['batches']}: {totals['processed']} movies, "
+                f"{totals['changed']} changed, {totals['failed']} failed, "
+                f"{totals['per_second']} movies/s"
+            )
+
+        while True:
+            totals = refresh_catalogue(
+                get_client(),
+                limit=limit,
+                batch_size=batch_size,
+                workers=workers,
+                max_age=datetime.timedelta(days=max_age_days),
+                progress=report,
+            )
+            print(
+                f"✅ Refreshed {totals['processed']} movies "
+                f"({totals['changed']} changed, {totals['failed']} failed) "
+                f"in {totals['elapsed']}s"
+            )
+            if totals["stopped"]:
+                print(f"⚠️ Stopped early: {totals['stopped']}")
+            if not loop:
+                break
+            try:
+                time.sleep(interval)
+            except KeyboardInterrupt:
+                break
+
+    @app.cli.command("export-omdb-fixtures")
+    @click.option(
+        "--dir",
+        "directory",
+        type=click.Path(file_okay=False),
+        help="Fixture directory (default: OMDB_FIXTURES_DIR).",
+    )
+    def export_omdb_fixtures(directory):
+        """Write OMDb detail fixtures for the movies in the catalogue."""
+        init_omdb(app)
+        directory = directory or app.config["OMDB_FIXTURES_DIR"]
+        count = 0
+        for movie in db.session.scalars(select(Movie).where(Movie.omdb_id.isnot(None))):
+            write_fixture(
+                directory, {"i": movie.omdb_id, "plot": "short"}, detail_response(movie)
+            )
+            count += 1
+        print(f"✅ Wrote {count} OMDb fixtures to {directory}")
+
+    @app.cli.command("omdb-standin")
+    @click.option("--host", default="127.0.0.1", show_default=True)
+    @click.option("--port", type=int, default=8079, show_default=True)
+    @click.option(
+        "--dir",
+        "directory",
+        type=click.Path(file_okay=False),
+        help="Fixture directory (default: OMDB_FIXTURES_DIR).",
+    )
+    @click.option("--latency-ms", type=float, default=0, show_default=True)
+    @click.option(
+        "--jitter-ms",
+        type=float,
+        default=0,
+        show_default=True,
+        help="Up to this much extra latency, uniformly random.",
+    )
+    @click.option(
+        "--error-rate",
+        type=click.FloatRange(0, 1),
+        default=0,
+        show_default=True,
+        help="Share of lookups answered with --error-status.",
+    )
+    @click.option("--error-status", type=int, default=503, show_default=True)
+    @click.option("--seed", type=int, default=None, help="For repeatable runs.")
+    def omdb_standin(
+        host, port, directory, latency_ms, jitter_ms, error_rate, error_status, seed
+    ):
+        """Serve recorded OMDb fixtures over HTTP, as a local OMDb."""
+        init_omdb(app)
+        backend = FixtureBackend(
+            directory or app.config["OMDB_FIXTURES_DIR"],
+            latency=latency_ms / 1000,
+            jitter=jitter_ms / 1000,
+            error_rate=error_rate,
+            error_status=error_status,
+            seed=seed,
+        )
+        if not len(backend):
+            print("⚠️ No fixtures found; run export-omdb-fixtures or record some.")
+        server = make_standin_server(backend, host, port)
+        url = f"http://{server.server_address[0]}:{server.server_address[1]}/"
+        print(f"ℹ️ Serving {len(backend)} OMDb fixtures at {url}")
+        print(f"ℹ️ Start the app with OMDB_URL={url}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        status = backend.status()
+        print(
+            f"✅ Answered {status['lookups']} lookups "
+            f"({status['errors']} injected errors, {status['misses']} not found)"
+        )
+
+    @app.cli.command("sync-replica")
+    @click.option("--loop", is_flag=True, help="Keep copying every --interval.")
+    @click.option("--interval", type=float, default=2.0, show_default=True)
+    def sync_replica(loop, interval):
+        """Copy the SQLite primary onto the SQLite replica (local testing)."""
+        replica_uri = app.config["SQLALCHEMY_REPLICA_URI"]
+        if not replica_uri:
+            print("❌ SQLALCHEMY_REPLICA_URI is not set.")
+            raise SystemExit(1)
+        primary, replica = db.engine.url, make_url(replica_uri)
+        if (
+            primary.get_backend_name() != "sqlite"
+            or replica.get_backend_name() != "sqlite"
+        ):
+            print("❌ sync-replica only copies SQLite files; use real replication.")
+            raise SystemExit(1)
+        while True:
+            sync_sqlite_replica(primary.database, replica.database)
+            print(f"✅ Copied {primary.database} -> {replica.database}")
+            if not loop:
+                break
+            try:
+                time.sleep(interval)
+            except KeyboardInterrupt:
+                break
+
+    @app.cli.command("replica-status")
+    def replica_status():
+        """Check the read replica's health and replication lag."""
+        router = get_router()
+        if router is None:
+            print("ℹ️ No read replica configured (SQLALCHEMY_REPLICA_URI).")
+            return
+        healthy = router.check()
+        status = router.status()
+        icon = "✅" if healthy else "❌"
+        print(
+            f"{icon} {status['replica']}: lag {status['lag_seconds']}s "
+            f"(max {status['max_lag_seconds']}s)"
+        )
+        if status["error"]:
+            print(f"   {status['error']}")
+        if not healthy:
+            raise SystemExit(1)
+
+    @app.cli.command("snapshot-stats")
+    def snapshot_stats():
+        """Build the in-memory catalogue snapshot and report its footprint."""
+        snapshot = get_snapshot()
+        if snapshot is None:
+            # report what enabling CATALOGUE_SNAPSHOT would cost
+            snapshot = CatalogueSnapshot(db.engine)
+        started = time.perf_counter()
+        snapshot.refresh(force=True)
+        elapsed = time.perf_counter() - started
+        # sort orders are built on first use; include them in the figures
+        for sort_by in ("title", "release_date", "rating"):
+            snapshot.query(sort_by=sort_by, limit=1)
+        status = snapshot.status()
+        usage = snapshot.memory_usage()
+        print(
+            f"✅ {status['movies']} movies, {status['genres']} genres "
+            f"(change log seq {status['seq']}), loaded in {elapsed:.2f}s"
+        )
+        for column, size in usage.items():
+            if column not in ("total", "per_100k"):
+                print(f"   {column:12} {size / 1024:10.1f} KiB")
+        print(f"   {'total':12} {usage['total'] / 1024:10.1f} KiB")
+        print(f"ℹ️ ~{usage['per_100k'] / 2**20:.1f} MiB per 100k movies")
+
+    @app.cli.command("warmup")
+    @click.option(
+        "--route",
+        "routes",
+        multiple=True,
+        help="Route to replay (repeatable; default: WARMUP_ROUTES or the hot set).",
+    )
+    @click.option(
+        "--access-log",
+        type=click.Path(dir_okay=False, exists=True),
+        help="Replay the most requested pages of this access log.",
+    )
+    @click.option(
+        "--top",
+        type=int,
+        default=None,
+        help="Routes taken from the log, or movie pages (default WARMUP_TOP).",
+    )
+    @click.option("--skip-omdb", is_flag=True, help="Spend no OMDb quota.")
+    def warmup(routes, access_log, top, skip_omdb):
+        """Prime caches and report hot-route latency before and after."""
+        # the OMDb client is normally set up by the blueprints that use it
+        if not skip_omdb:
+            init_omdb(app)
+        report = warm_up(
+            app,
+            routes=list(routes),
+            access_log=access_log,
+            top=top,
+            omdb=not skip_omdb,
+        )
+        print(f"{'route':40} {'status':>6} {'before ms':>10} {'after ms':>9}")
+        for route, result in report["routes"].items():
+            print(
+                f"{route[:40]:40} {result['status']:>6} "
+                f"{result['before_ms']:10.1f} {result['after_ms']:9.1f}"
+            )
+        for name, result in report["steps"].items():
+            details = ", ".join(f"{k} {v}" for k, v in result.items() if k != "ms")
+            print(f"ℹ️ {name}: {result['ms']:.0f} ms ({details})")
+        print(
+            f"✅ Warmed up {len(report['routes'])} routes in "
+            f"{report['elapsed_ms'] / 1000:.1f}s: {report['before_ms']:.0f} ms "
+            f"cold, {report['after_ms']:.0f} ms warm"
+        )
+        for route, result in report["routes"].items():
+            if result["status"] >= 500:
+                print(f"⚠️ {route} answered {result['status']}")
+
+    @app.cli.command("compact-changes")
+    @click.option(
+        "--collapse-after",
+        type=float,
+        default=1.0,
+        show_default=True,
+        help="Merge entries for the same row once older than this many hours.",
+    )
+    @click.option(
+        "--retain-days",
+        type=float,
+        default=7.0,
+        show_default=True,
+        help="Drop entries older than this; 0 keeps everything.",
+    )
+    def compact_changes_command(collapse_after, retain_days):
+        """Collapse and truncate the change log (of every tenant, too)."""
+        registry = get_tenants()
+        # the catalogue database's log, then each tenant's own
+        databases = [None] + (registry.keys() if registry is not None else [])
+        for key in databases:
+            with use_tenant(key):
+                result = compact_changes(
+                    collapse_age=datetime.timedelta(hours=collapse_after),
+                    retain=(
+                        datetime.timedelta(days=retain_days) if retain_days else None
+                    ),
+                )
+                db.session.commit()
+            where = f" of tenant {key}" if key else ""
+            print(
+                f"✅ Collapsed {result['collapsed']} and dropped "
+                f"{result['truncated']} change log entries{where}; consumers "
+                f"need since >= {result['floor']}"
+            )
+
+    @app.cli.command("create-tenant")
+    @click.argument("key")
+    def create_tenant(key):
+        """Create the database of a new community (tenant)."""
+        registry = get_tenants()
+        if registry is None:
+            raise click.ClickException("Tenant sharding is off (WEBFLIX_TENANTS=1).")
+        if registry.create(key.lower()):
+            # start from consistent (empty) rollups
+            with use_tenant(key.lower()):
+                rebuild_rollups()
+            print(f"✅ Created tenant {key.lower()} at {registry.path(key.lower())}")
+        else:
+            print(f"ℹ️ Tenant {key.lower()} already exists.")
+
+    @app.cli.command("tenants")
+    def list_tenants():
+        """List the tenant databases and their user counts."""
+        registry = get_tenants()
+        if registry is None:
+            raise click.ClickException("Tenant sharding is off (WEBFLIX_TENANTS=1).")
+        keys = registry.keys()
+        for key in keys:
+            with use_tenant(key):
+                users = db.session.scalar(select(func.count()).select_from(User))
+            print(f"   {key:32} {users:8} users")
+        print(f"ℹ️ {len(keys)} tenants in {registry.directory}")
+
+    @app.cli.command("split-tenants")
+    @click.option("--default", "default", help="Tenant of users not in --map.")
+    @click.option(
+        "--map",
+        "map_path",
+        type=click.Path(exists=True, dir_okay=False),
+        help="CSV of user (id or name), tenant rows.",
+    )
+    @click.option("--keep", is_flag=True, help="Copy users without removing them here.")
+    def split_tenants_command(default, map_path, keep):
+        """Move users and their lists from the main database into tenants."""
+        registry = get_tenants()
+        if registry is None:
+            raise click.ClickException("Tenant sharding is off (WEBFLIX_TENANTS=1).")
+        if not (default or map_path):
+            raise click.UsageError("Give --default, --map or both.")
+        try:
+            assignments = read_assignments(map_path) if map_path else {}
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        default = default.lower() if default else None
+        moved = split_tenants(assignments, default=default, keep=keep)
+        for key, count in moved.items():
+            # rollups are per database: recompute both sides of the move
+            with use_tenant(key):
+                rebuild_rollups()
+            print(f"✅ Moved {count} users to tenant {key}")
+        if not keep and moved:
+            with use_tenant(None):
+                rebuild_rollups()
+        if not moved:
+            print("ℹ️ No users to move.")
+
+    @app.cli.command("purge-media")
+    @click.option("--batch-size", type=click.IntRange(1, 100), default=100)
+    @click.option("--loop", is_flag=True, help="Keep running as a worker.")
+    @click.option("--interval", type=int, default=60, show_default=True)
+    def purge_media(batch_size, loop, interval):
+        """Delete queued profile pictures from Cloudinary in batches."""
+        # media is normally set up by the users blueprint
+        init_media(app)
+        while True:
+            totals = purge_deletions(get_admin_api(), batch_size=batch_size)
+            print(
+                f"✅ Deleted {totals['deleted']} assets "
+                f"({totals['not_found']} already gone, {totals['failed']} failed) "
+                f"in {totals['batches']} batches"
+            )
+            if totals["next_retry"] is not None:
+                print(f"ℹ️ Failed deletions are retried from {totals['next_retry']}")
+            if not loop:
+                break
+            try:
+                time.sleep(interval)
+            except KeyboardInterrupt:
+                break
+        status = deletion_status()
+        for row in status["abandoned"]:
+            print(
+                f"⚠️ Gave up on {row.public_id} after {row.attempts} attempts: "
+                f"{row.last_error}"
+            )
+        if status["abandoned"]:
+            raise SystemExit(1)
+
+    @app.cli.command("sweep-media")
+    @click.option(
+        "--min-age-hours",
+        type=float,
+        default=1.0,
+        show_default=True,
+        help="Leave younger assets alone (uploads still being saved).",
+    )
+    @click.option("--dry-run", is_flag=True, help="Only report orphans.")
+    def sweep_media(min_age_hours, dry_run):
+        """Queue Cloudinary assets no user references for deletion."""
+        init_media(app)
+        folder = app.config["MEDIA_FOLDER"]
+        totals = sweep_orphans(
+            get_admin_api(),
+            folder,
+            min_age=datetime.timedelta(hours=min_age_hours),
+            dry_run=dry_run,
+        )
+        print(
+            f"✅ {totals['listed']} assets in {folder}/: "
+            f"{totals['referenced']} in use, {totals['queued']} already queued, "
+            f"{totals['recent']} too recent, {len(totals['orphans'])} orphaned"
+        )
+        for public_id in totals["orphans"]:
+            print(f"   {public_id}")
+        if totals["orphans"]:
+            action = "Would queue" if dry_run else "Queued"
+            print(f"ℹ️ {action} {len(totals['orphans'])} for flask purge-media")
+        if totals["backfilled"]:
+            print(f"ℹ️ Stored the public_id of {totals['backfilled']} users")
+        for public_id in totals["missing"]:
+            print(f"⚠️ {public_id} is used by a user but missing from {folder}/")
@@ -1,21 +1,60 @@
+import functools
+
+from sqlalchemy import inspect
+
 from datamanager.data_manager_interface import DataManagerInterface
-from models import db, User, Movie, Genre, UserMovie
+from models import db, User, Movie, Genre, UserMovie, get_or_create
+from models import MOVIE_TITLE_YEAR
+from models import current_tenant, use_tenant
+
+
+def _in_tenant(method):
+    """Run a data manager method against the manager's tenant, if it has one.
+
+    The session is closed when the tenant block ends, so returned objects
+    are loaded first; they come back detached, without lazy relationships.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.tenant is None or self.tenant == current_tenant():
+            return method(self, *args, **kwargs)
+        with use_tenant(self.tenant):
+            result = method(self, *args, **kwargs)
+            for obj in result if isinstance(result, list) else [result]:
+                if isinstance(obj, db.Model) and inspect(obj).expired_attributes:
+                    db.session.refresh(obj)
+            return result
+    return wrapper
 
 
 class SQLiteDataManager(DataManagerInterface):
+    """Data access through ``db.session``.
+
+    Args:
+        tenant (str): With tenant sharding, the tenant whose users and lists
+            to use; None uses the tenant of the current request.
+    """
+
+    def __init__(self, tenant=None):
+        self.tenant = tenant
+
     # — User CRUD —
+    @_in_tenant
     def add_user(self, name, profile_pic_url=None):
         u = User(name=name, profile_pic_url=profile_pic_url)
         db.session.add(u)
         db.session.commit()
         return u
 
+    @_in_tenant
     def get_user(self, user_id):
         return User.query.get(user_id)
 
+    @_in_tenant
     def get_all_users(self):
         return User.query.all()
 
+    @_in_tenant
     def update_user(self, user_id, **kw):
         u = User.query.get(user_id)
         if not u:
@@ -26,6 +65,7 @@ class SQLiteDataManager(DataManagerInterface):
         db.session.commit()
         return u
 
+    @_in_tenant
     def delete_user(self, user_id):
         u = User.query.get(user_id)
         if not u:
@@ -35,20 +75,28 @@ class SQLiteDataManager(DataManagerInterface):
         return True
 
     # — Movie CRUD —
+    @_in_tenant
     def add_movie(self, title, director, year):
-        m = Movie.query.filter_by(title=title, year=year).first()
-        if not m:
-            m = Movie(title=title, director=director, year=year)
-            db.session.add(m)
+        # one INSERT ... ON CONFLICT DO NOTHING RETURNING for a new movie;
+        # an existing one with this title and year (OMDb imports included,
+        # with or without a year) is found by the conflict
+        m, created = get_or_create(
+            Movie, ('title', 'year'),
+            dict(title=title, director=director, year=year),
+            index_elements=MOVIE_TITLE_YEAR)
+        if created:
             db.session.commit()
         return m
 
+    @_in_tenant
     def get_movie(self, movie_id):
         return Movie.query.get(movie_id)
 
+    @_in_tenant
     def get_all_movies(self):
         return Movie.query.all()
 
+    @_in_tenant
     def update_movie(self, movie_id, **kw):
         m = Movie.query.get(movie_id)
         if not m:
@@ -59,6 +107,7 @@ class SQLiteDataManager(DataManagerInterface):
         db.session.commit()
         return m
 
+    @_in_tenant
     def delete_movie(self, movie_id):
         m = Movie.query.get(movie_id)
         if not m:
@@ -68,21 +117,23 @@ class SQLiteDataManager(DataManagerInterface):
         return True
 
     # — User–Movie linkage —
+    @_in_tenant
     def get_user_movies(self, user_id):
         u = User.query.get(user_id)
         return [link.movie for link in u.favorites] if u else []
 
+    @_in_tenant
     def add_movie_for_user(self, user_id, title, director, year, rating):
         m = self.add_movie(title, director, year)
-        link = UserMovie.query.get((user_id, m.id))
-        if link:
+        link, created = get_or_create(
+            UserMovie, ('user_id', 'movie_id'),
+            dict(user_id=user_id, movie_id=m.id, rating=rating))
+        if not created:
             link.rating = rating
-        else:
-            link = UserMovie(user_id=user_id, movie_id=m.id, rating=rating)
-            db.session.add(link)
         db.session.commit()
         return link
 
+    @_in_tenant
     def update_movie_for_user(self, user_id, movie_id, **kw):
         link = UserMovie.query.get((user_id, movie_id))
         if not link:
@@ -93,6 +144,7 @@ class SQLiteDataManager(DataManagerInterface):
         db.session.commit()
         return link
 
+    @_in_tenant
     def delete_movie_for_user(self, user_id, movie_id):
         link = UserMovie.query.get((user_id, movie_id))
         if not link:
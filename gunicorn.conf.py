@@ -0,0 +1,44 @@
+"""Gunicorn settings for WEBFLIX.
+
+In preload mode (``WEBFLIX_PRELOAD=1``, the default) the application is
+built once in the master process and workers are forked from it, sharing
+the imported modules, compiled templates and configuration copy-on-write
+instead of each repeating the start-up work.
+"""
+import gc
+import os
+
+bind = os.environ.get("WEBFLIX_BIND", "127.0.0.1:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", 4))
+preload_app = os.environ.get("WEBFLIX_PRELOAD", "1") == "1"
+
+
+def when_ready(server):
+    """Finish warming the master before the first worker is forked."""
+    if not preload_app:
+        return
+    from media import preload_sdks
+
+    # lazily imported everywhere else; import once here so workers share them
+    preload_sdks()
+    # objects built so far live for the whole process: keep the garbage
+    # collector from touching (and so copying) their pages in every worker
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    """Drop database connections inherited from the master."""
+    if not preload_app:
+        return
+    from models import db, get_tenants
+    from wsgi import app
+
+    with app.app_context():
+        # the child must open its own connections; close=False leaves the
+        # parent's sockets/files alone. Every engine: the replica bind and
+        # tenant databases may be open too (e.g. after WEBFLIX_WARMUP=1)
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+        registry = get_tenants()
+        if registry is not None:
+            registry.dispose(close=False)
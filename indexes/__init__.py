@@ -0,0 +1,22 @@
+from .bitmap import Bitmap
+from .genres import (
+    GenreIndex,
+    GenreQueryError,
+    get_genre_index,
+    in_ids,
+    user_movie_ids,
+)
+from .lists import (
+    ListCache,
+    cached_user_list,
+    get_list_cache,
+    serialize_user_movie,
+)
+from .snapshot import (
+    CatalogueSnapshot,
+    MovieRecord,
+    get_snapshot,
+    init_app as init_snapshot,
+)
+from .suggest import SuggestIndex, get_suggest_index, normalize
+from .tracking import CatalogueIndex
@@ -0,0 +1,209 @@
+"""Compressed bitmaps of non-negative integer ids (a small roaring bitmap).
+
+An id is split into a high part (``id >> 16``), which selects a container,
+and the low 16 bits stored in it. Containers holding at most
+:data:`ARRAY_MAX` values are sorted ``array('H')`` (2 bytes per id); denser
+ones are 65536-bit Python ints (8 KiB), so AND/OR/AND NOT between dense
+containers are single big-integer operations. Containers switch form as
+they grow and shrink.
+
+Containers are never modified once built (``add`` and ``discard`` replace
+them), so the results of set operations can share containers with their
+operands.
+"""
+from array import array
+from bisect import bisect_left
+
+ARRAY_MAX = 4096
+CONTAINER_BITS = 1 << 16
+CONTAINER_BYTES = CONTAINER_BITS // 8
+
+# byte value -> positions of its set bits
+_BYTE_BITS = tuple(
+    tuple(bit for bit in range(8) if value >> bit & 1) for value in range(256)
+)
+
+
+def _to_int(container):
+    if isinstance(container, int):
+        return container
+    bits = bytearray(CONTAINER_BYTES)
+    for low in container:
+        bits[low >> 3] |= 1 << (low & 7)
+    return int.from_bytes(bits, "little")
+
+
+def _int_values(bits):
+    for index, byte in enumerate(bits.to_bytes(CONTAINER_BYTES, "little")):
+        if byte:
+            base = index << 3
+            for bit in _BYTE_BITS[byte]:
+                yield base + bit
+
+
+def _normalize(container):
+    """Return ``container`` in its preferred form, or None if empty."""
+    if isinstance(container, int):
+        count = container.bit_count()
+        if count == 0:
+            return None
+        if count <= ARRAY_MAX:
+            return array("H", _int_values(container))
+        return container
+    if not container:
+        return None
+    if len(container) > ARRAY_MAX:
+        return _to_int(container)
+    return container
+
+
+def _and(a, b):
+    if isinstance(a, int) and isinstance(b, int):
+        return a & b
+    if isinstance(a, int):
+        a, b = b, a
+    if isinstance(b, int):
+        return array("H", (low for low in a if b >> low & 1))
+    return array("H", sorted(set(a).intersection(b)))
+
+
+def _or(a, b):
+    if isinstance(a, int) or isinstance(b, int):
+        return _to_int(a) | _to_int(b)
+    return array("H", sorted(set(a).union(b)))
+
+
+def _sub(a, b):
+    if isinstance(a, int):
+        return a & ~_to_int(b)
+    if isinstance(b, int):
+        return array("H", (low for low in a if not b >> low & 1))
+    return array("H", sorted(set(a).difference(b)))
+
+
+class Bitmap:
+    """A set of non-negative ints with fast ``&``, ``|`` and ``-``.
+
+    Args:
+        ids (iterable): Initial members.
+    """
+
+    __slots__ = ("_containers",)
+
+    def __init__(self, ids=()):
+        groups = {}
+        for value in ids:
+            groups.setdefault(value >> 16, []).append(value & 0xFFFF)
+        self._containers = {}
+        for high, lows in groups.items():
+            container = _normalize(array("H", sorted(set(lows))))
+            if container is not None:
+                self._containers[high] = container
+
+    @classmethod
+    def _wrap(cls, containers):
+        bitmap = cls.__new__(cls)
+        bitmap._containers = containers
+        return bitmap
+
+    def add(self, value):
+        high, low = value >> 16, value & 0xFFFF
+        container = self._containers.get(high)
+        if container is None:
+            self._containers[high] = array("H", (low,))
+        elif isinstance(container, int):
+            self._containers[high] = container | 1 << low
+        else:
+            index = bisect_left(container, low)
+            if index == len(container) or container[index] != low:
+                container = array("H", container)
+                container.insert(index, low)
+                self._containers[high] = _normalize(container)
+
+    def discard(self, value):
+        high, low = value >> 16, value & 0xFFFF
+        container = self._containers.get(high)
+        if container is None:
+            return
+        if isinstance(container, int):
+            container = _normalize(container & ~(1 << low))
+        else:
+            index = bisect_left(container, low)
+            if index == len(container) or container[index] != low:
+                return
+            container = _normalize(container[:index] + container[index + 1 :])
+        if container is None:
+            del self._containers[high]
+        else:
+            self._containers[high] = container
+
+    def __contains__(self, value):
+        container = self._containers.get(value >> 16)
+        if container is None:
+            return False
+        low = value & 0xFFFF
+        if isinstance(container, int):
+            return bool(container >> low & 1)
+        index = bisect_left(container, low)
+        return index < len(container) and container[index] == low
+
+    def __len__(self):
+        return sum(
+            c.bit_count() if isinstance(c, int) else len(c)
+            for c in self._containers.values()
+        )
+
+    def __bool__(self):
+        return bool(self._containers)
+
+    def __iter__(self):
+        for high in sorted(self._containers):
+            base = high << 16
+            container = self._containers[high]
+            values = _int_values(container) if isinstance(container, int) else container
+            for low in values:
+                yield base + low
+
+    def _combine(self, other, op, keep_left, keep_right):
+        result = {}
+        for high in self._containers.keys() | other._containers.keys():
+            a = self._containers.get(high)
+            b = other._containers.get(high)
+            if a is not None and b is not None:
+                container = _normalize(op(a, b))
+            elif a is not None and keep_left:
+                container = a
+            elif b is not None and keep_right:
+                container = b
+            else:
+                container = None
+            if container is not None:
+                result[high] = container
+        return self._wrap(result)
+
+    def __and__(self, other):
+        return self._combine(other, _and, False, False)
+
+    def __or__(self, other):
+        return self._combine(other, _or, True, True)
+
+    def __sub__(self, other):
+        return self._combine(other, _sub, True, False)
+
+    def __eq__(self, other):
+        if not isinstance(other, Bitmap):
+            return NotImplemented
+        return self._containers.keys() == other._containers.keys() and all(
+            _to_int(c) == _to_int(other._containers[high])
+            for high, c in self._containers.items()
+        )
+
+    def nbytes(self):
+        """Return the bytes used by the containers' payloads."""
+        return sum(
+            CONTAINER_BYTES if isinstance(c, int) else 2 * len(c)
+            for c in self._containers.values()
+        )
+
+    def __repr__(self):
+        return f"<Bitmap {len(self)} ids in {len(self._containers)} containers>"
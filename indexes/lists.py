@@ -0,0 +1,195 @@
+"""Serialized user lists, cached until the list or the catalogue changes.
+
+A user's list only changes when they add, remove, rate or toggle a movie,
+and every such write bumps the ``user:<id>`` data version (see
+:class:`models.DataVersion`); the titles, posters and genres shown with it
+change with the ``catalogue`` version. :class:`ListCache` keeps each
+serialized list, and each filtered or sorted variant of it, under
+``(tenant, user_id, filters)`` together with those two versions. A request reads
+the versions (one indexed query) and is served from the cache when they
+still match; otherwise the list is rebuilt and replaces the stale entry.
+
+The cache is a per-process LRU bounded by the size of the serialized
+entries (``USER_LIST_CACHE_BYTES``, 0 disables it). With
+``USER_LIST_CACHE_DIR`` set, entries are also written there as JSON files
+shared by all worker processes, one file per list and variant, so a list
+built by one worker is reused by the others.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+from flask import current_app
+
+from models import current_tenant, data_versions
+
+
+def serialize_user_movie(user_movie):
+    """Return the JSON-ready form of one list entry (as the API returns it)."""
+    movie = user_movie.movie
+    return {
+        "id": movie.id,
+        "title": movie.title,
+        "director": movie.director,
+        "year": movie.year,
+        "omdb_id": movie.omdb_id,
+        "poster_url": movie.poster_url,
+        "rating": user_movie.rating,
+        "watched": user_movie.watched,
+        "added_on": user_movie.added_on.isoformat(),
+    }
+
+
+def list_version(user_id):
+    """Return the versions a user's serialized list is valid for."""
+    scopes = (f"user:{user_id}", "catalogue")
+    versions = data_versions(scopes)
+    return tuple(versions[scope] for scope in scopes)
+
+
+class ListCache:
+    """Size-bounded LRU of serialized lists, validated by data versions.
+
+    Args:
+        max_bytes (int): Total size of the cached JSON at most.
+        shared_dir (str): Optional directory of entries shared between
+            processes.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, shared_dir=None):
+        self.max_bytes = max_bytes
+        self.shared_dir = shared_dir
+        self._lock = threading.Lock()
+        # (tenant, user_id, filters) -> (version, value, size)
+        self._entries = OrderedDict()
+        self.size = 0
+        self.hits = self.shared_hits = self.misses = self.evictions = 0
+
+    def _shared_path(self, slot):
+        name = hashlib.sha1(repr(slot).encode("utf-8")).hexdigest()
+        return os.path.join(self.shared_dir, f"{name}.json")
+
+    def _get_shared(self, slot, version):
+        try:
+            with open(self._shared_path(slot), encoding="utf-8") as fh:
+                stored = json.load(fh)
+        except (OSError, ValueError):
+            return None
+        if stored.get("version") != list(version):
+            return None
+        return stored["value"]
+
+    def _set_shared(self, slot, version, data):
+        os.makedirs(self.shared_dir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.shared_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as fh:
+                fh.write(f'{{"version": {json.dumps(list(version))}, "value": {data}}}')
+            os.replace(tmp, self._shared_path(slot))
+        except OSError as e:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            print(f"Warning: Could not write shared list cache entry: {e}")
+
+    def _store(self, slot, version, value, size):
+        with self._lock:
+            old = self._entries.pop(slot, None)
+            if old is not None:
+                self.size -= old[2]
+            if size > self.max_bytes:
+                return
+            self._entries[slot] = (version, value, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self.size -= evicted
+                self.evictions += 1
+
+    def get_or_build(self, user_id, filters, build):
+        """Return a user's serialized list, building it on a miss.
+
+        Args:
+            user_id (int): Owner of the list.
+            filters (tuple): Hashable description of the variant, e.g.
+                ``("html", "title", "asc", "all", None, "")``.
+            build (callable): Returns the JSON-serialisable value from the
+                database; a None result (e.g. unknown user) is not cached.
+
+        Returns:
+            The cached or freshly built value. Callers must not modify it.
+        """
+        # user ids are per tenant
+        slot = (current_tenant(), user_id, filters)
+        # read before building: the value is at least as new as its version
+        version = list_version(user_id)
+        with self._lock:
+            entry = self._entries.get(slot)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(slot)
+                self.hits += 1
+                return entry[1]
+        if self.shared_dir:
+            value = self._get_shared(slot, version)
+            if value is not None:
+                self.shared_hits += 1
+                size = len(json.dumps(value))
+                self._store(slot, version, value, size)
+                return value
+        self.misses += 1
+        value = build()
+        if value is None:
+            return None
+        data = json.dumps(value)
+        self._store(slot, version, value, len(data))
+        if self.shared_dir:
+            self._set_shared(slot, version, data)
+        return value
+
+    def clear(self):
+        """Drop every entry from this process's cache."""
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def status(self):
+        """Return sizes and hit counters."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+def get_list_cache():
+    """Return the current app's :class:`ListCache`, or None if disabled."""
+    app = current_app._get_current_object()
+    cache = app.extensions.get("list_cache")
+    if cache is None:
+        max_bytes = app.config.get("USER_LIST_CACHE_BYTES", 32 * 1024 * 1024)
+        if not max_bytes:
+            return None
+        cache = app.extensions.setdefault(
+            "list_cache",
+            ListCache(max_bytes, shared_dir=app.config.get("USER_LIST_CACHE_DIR")),
+        )
+    return cache
+
+
+def cached_user_list(user_id, filters, build):
+    """Serve a user's list through the cache (built directly if disabled).
+
+    See :meth:`ListCache.get_or_build`.
+    """
+    cache = get_list_cache()
+    if cache is None:
+        return build()
+    return cache.get_or_build(user_id, filters, build)
@@ -0,0 +1,425 @@
+"""Compact in-process snapshot of the catalogue for the hot list path.
+
+With ``CATALOGUE_SNAPSHOT`` enabled, the columns ``/all-movies`` needs (id,
+title, year, numeric rating, poster URL and genre membership) are loaded
+once at startup and kept column-wise: ``array`` columns for numbers, plain
+lists for strings, and one bitset (a ``bytearray`` over row positions) per
+genre. :meth:`CatalogueSnapshot.query` answers every sort/filter/paginate
+combination of the view from memory; pages are materialised as small
+:class:`MovieRecord` objects only for the rows shown.
+
+Refresh follows :class:`~indexes.tracking.CatalogueIndex`: only the
+movies named in new change log entries are re-read, this process's writes
+before the next query and other processes' within
+``CATALOGUE_SNAPSHOT_INTERVAL`` seconds.
+"""
+import math
+import os
+import sys
+from array import array
+from bisect import insort
+from collections import namedtuple
+
+from flask import current_app
+from sqlalchemy import select
+
+from models import db, Genre, Movie, movie_genre
+from stats.rollups import parse_rating
+from .tracking import CatalogueIndex
+
+NO_YEAR = -(2**31)
+NO_RATING = -1.0
+SORT_KEYS = ("title", "release_date", "rating", "id")
+# at most this many changed movies are re-slotted into the sort orders one
+# by one; larger batches re-sort
+RESORT_THRESHOLD = 64
+# rebuild once this share of the slots belongs to deleted movies
+MAX_DEAD_RATIO = 0.25
+CHUNK = 500
+
+GenreEntry = namedtuple("GenreEntry", ["id", "name"])
+
+
+class MovieRecord:
+    """One movie as stored in the snapshot (what the list templates use)."""
+
+    __slots__ = ("id", "title", "year", "rating", "poster_url")
+
+    def __init__(self, id, title, year, rating, poster_url):
+        self.id = id
+        self.title = title
+        self.year = year
+        self.rating = rating
+        self.poster_url = poster_url
+
+    def __repr__(self):
+        return f"<MovieRecord id={self.id} title='{self.title}' year={self.year}>"
+
+
+class CatalogueSnapshot(CatalogueIndex):
+    """Column-wise copy of the catalogue, refreshed from the change log.
+
+    Args:
+        engine (Engine): Engine to load from (the primary).
+        check_interval (float): Seconds between change log checks when this
+            process has not written.
+    """
+
+    def __init__(self, engine, check_interval=1.0):
+        self.genres = []
+        self._reset()
+        super().__init__(engine, check_interval)
+
+    def _reset(self):
+        self.ids = array("q")
+        self.years = array("i")
+        self.ratings = array("d")
+        self.titles = []
+        # poster URLs split after the last "/": the directory part is the
+        # same for nearly every poster and stored once
+        self.poster_dirs = array("H")
+        self.poster_names = []
+        self._dirs = {}
+        self._dir_list = [None]
+        self.genre_bits = {}
+        self.position = {}
+        self.dead = 0
+        self._orders = {}
+        self._filtered = {}
+
+    def __len__(self):
+        return len(self.position)
+
+    # -- loading ----------------------------------------------------------
+
+    def _needs_rebuild(self):
+        return super()._needs_rebuild() or self.dead > len(self.ids) * MAX_DEAD_RATIO
+
+    def _load_genres(self, conn):
+        self.genres = [
+            GenreEntry(*row)
+            for row in conn.execute(select(Genre.id, Genre.name).order_by(Genre.name))
+        ]
+
+    def _rebuild(self, conn):
+        self._reset()
+        self._load_genres(conn)
+        rows = conn.execute(
+            select(
+                Movie.id, Movie.title, Movie.year, Movie.imdb_rating, Movie.poster_url
+            ).order_by(Movie.id)
+        )
+        for row in rows:
+            self._append(*row)
+        size = len(self.ids)
+        for movie_id, genre_id in conn.execute(select(movie_genre)):
+            pos = self.position.get(movie_id)
+            if pos is not None:
+                self._set_bit(genre_id, pos, size)
+        return "rebuilt"
+
+    def _patch(self, conn, movie_ids, genres_changed):
+        if genres_changed:
+            self._load_genres(conn)
+        if len(movie_ids) > RESORT_THRESHOLD:
+            # cheaper to sort again on the next query than to re-slot each
+            self._orders.clear()
+        ids = sorted(movie_ids)
+        found = set()
+        for start in range(0, len(ids), CHUNK):
+            chunk = ids[start : start + CHUNK]
+            for row in conn.execute(
+                select(
+                    Movie.id,
+                    Movie.title,
+                    Movie.year,
+                    Movie.imdb_rating,
+                    Movie.poster_url,
+                ).where(Movie.id.in_(chunk))
+            ):
+                found.add(row.id)
+                self._upsert(*row)
+        for movie_id in set(ids) - found:
+            self._remove(movie_id)
+        # re-read the genre links of every surviving changed movie
+        size = len(self.ids)
+        positions = [self.position[i] for i in found]
+        for bits in self.genre_bits.values():
+            self._grow(bits, size)
+            for pos in positions:
+                bits[pos >> 3] &= ~(1 << (pos & 7)) & 0xFF
+        found = sorted(found)
+        for start in range(0, len(found), CHUNK):
+            for movie_id, genre_id in conn.execute(
+                select(movie_genre).where(
+                    movie_genre.c.movie_id.in_(found[start : start + CHUNK])
+                )
+            ):
+                self._set_bit(genre_id, self.position[movie_id], size)
+        self._reorder(positions)
+        return "patched"
+
+    def _append(self, movie_id, title, year, rating, poster_url):
+        pos = len(self.ids)
+        self.position[movie_id] = pos
+        self.ids.append(movie_id)
+        self.titles.append(title)
+        self.years.append(NO_YEAR if year is None else year)
+        rating = parse_rating(rating)
+        self.ratings.append(NO_RATING if rating is None else rating)
+        self.poster_dirs.append(0)
+        self.poster_names.append(None)
+        self._set_poster(pos, poster_url)
+        return pos
+
+    def _upsert(self, movie_id, title, year, rating, poster_url):
+        pos = self.position.get(movie_id)
+        if pos is None:
+            return self._append(movie_id, title, year, rating, poster_url)
+        self._unorder(pos)
+        self.titles[pos] = title
+        self.years[pos] = NO_YEAR if year is None else year
+        rating = parse_rating(rating)
+        self.ratings[pos] = NO_RATING if rating is None else rating
+        self._set_poster(pos, poster_url)
+        return pos
+
+    def _remove(self, movie_id):
+        pos = self.position.pop(movie_id, None)
+        if pos is None:
+            return
+        self._unorder(pos)
+        for bits in self.genre_bits.values():
+            if pos >> 3 < len(bits):
+                bits[pos >> 3] &= ~(1 << (pos & 7)) & 0xFF
+        # the slot stays (positions are stable) until the next rebuild
+        self.titles[pos] = ""
+        self._set_poster(pos, None)
+        self.dead += 1
+
+    def _set_poster(self, pos, url):
+        if not url:
+            self.poster_dirs[pos], self.poster_names[pos] = 0, None
+            return
+        cut = url.rfind("/") + 1
+        head, name = url[:cut], url[cut:]
+        index = self._dirs.get(head)
+        if index is None:
+            index = self._dirs[head] = len(self._dir_list)
+            self._dir_list.append(head)
+        self.poster_dirs[pos], self.poster_names[pos] = index, name
+
+    def _poster(self, pos):
+        index = self.poster_dirs[pos]
+        if not index:
+            return None
+        return self._dir_list[index] + self.poster_names[pos]
+
+    @staticmethod
+    def _grow(bits, size):
+        missing = (size + 7) // 8 - len(bits)
+        if missing > 0:
+            bits.extend(bytes(missing))
+
+    def _set_bit(self, genre_id, pos, size):
+        bits = self.genre_bits.get(genre_id)
+        if bits is None:
+            bits = self.genre_bits[genre_id] = bytearray()
+        self._grow(bits, size)
+        bits[pos >> 3] |= 1 << (pos & 7)
+
+    # -- ordering ---------------------------------------------------------
+
+    def _sort_key(self, sort_by):
+        ids = self.ids
+        if sort_by == "title":
+            titles = self.titles
+            # case-insensitive like the database's lower(title); computed
+            # while sorting rather than stored for every movie
+            return lambda pos: (titles[pos].lower(), ids[pos])
+        if sort_by == "release_date":
+            keys = self.years
+        elif sort_by == "rating":
+            keys = self.ratings
+        else:
+            return ids.__getitem__
+        # ties fall back to id order, as SQLite's rowid scan would
+        return lambda pos: (keys[pos], ids[pos])
+
+    def _order(self, sort_by):
+        order = self._orders.get(sort_by)
+        if order is None:
+            order = self._orders[sort_by] = array(
+                "l", sorted(self.position.values(), key=self._sort_key(sort_by))
+            )
+        return order
+
+    def _unorder(self, pos):
+        # take a movie out of the sort orders before its values change
+        self._filtered.clear()
+        for order in self._orders.values():
+            order.remove(pos)
+
+    def _reorder(self, positions):
+        self._filtered.clear()
+        for sort_by, order in self._orders.items():
+            key = self._sort_key(sort_by)
+            for pos in positions:
+                insort(order, pos, key=key)
+
+    # -- queries ----------------------------------------------------------
+
+    def query(
+        self,
+        genre_id=None,
+        sort_by="title",
+        sort_dir="asc",
+        offset=0,
+        limit=None,
+        movie_ids=None,
+        movie_ids_key=None,
+    ):
+        """Return one page of movies, sorted and filtered like the list view.
+
+        ``NULL`` years and ratings sort first ascending and last descending,
+        as in SQLite. Ratings sort numerically.
+
+        Args:
+            genre_id (int): Only movies in this genre (default all).
+            sort_by (str): ``"title"``, ``"release_date"``, ``"rating"`` or
+                anything else for id order.
+            sort_dir (str): ``"asc"`` or ``"desc"``.
+            offset (int): Rows to skip.
+            limit (int): Page size (default all remaining rows).
+            movie_ids: Only movies with these ids, e.g. the
+                :class:`~indexes.bitmap.Bitmap` of a genre query.
+            movie_ids_key: Hashable identity of ``movie_ids`` under which the
+                filtered order may be cached until the next refresh.
+
+        Returns:
+            tuple: ``(records, total)`` with the page's :class:`MovieRecord`
+            objects and the number of matching movies.
+        """
+        self.refresh()
+        if sort_by not in SORT_KEYS:
+            sort_by = "id"
+        with self._lock:
+            positions = self._matching(genre_id, sort_by, movie_ids, movie_ids_key)
+            total = len(positions)
+            stop = total if limit is None else min(total, offset + limit)
+            # without a sort key the database ignores the direction too
+            if sort_dir == "desc" and sort_by != "id":
+                page = (
+                    positions[total - stop : total - offset][::-1]
+                    if offset < total
+                    else []
+                )
+            else:
+                page = positions[offset:stop]
+            return [self._record(pos) for pos in page], total
+
+    def _matching(self, genre_id, sort_by, movie_ids, movie_ids_key):
+        if genre_id is None and movie_ids is None:
+            return self._order(sort_by)
+        key = (genre_id, movie_ids_key, sort_by)
+        cacheable = movie_ids is None or movie_ids_key is not None
+        if cacheable and key in self._filtered:
+            return self._filtered[key]
+        positions = self._order(sort_by)
+        if genre_id is not None:
+            bits = self.genre_bits.get(genre_id, b"")
+            size = len(bits) * 8
+            positions = [
+                pos
+                for pos in positions
+                if pos < size and bits[pos >> 3] >> (pos & 7) & 1
+            ]
+        if movie_ids is not None:
+            wanted = {self.position[i] for i in movie_ids if i in self.position}
+            positions = [pos for pos in positions if pos in wanted]
+        positions = array("l", positions)
+        if cacheable:
+            self._filtered[key] = positions
+        return positions
+
+    def _record(self, pos):
+        year = self.years[pos]
+        rating = self.ratings[pos]
+        return MovieRecord(
+            self.ids[pos],
+            self.titles[pos],
+            None if year == NO_YEAR else year,
+            None if rating == NO_RATING else rating,
+            self._poster(pos),
+        )
+
+    # -- reporting --------------------------------------------------------
+
+    def memory_usage(self):
+        """Return the approximate bytes held by each column.
+
+        Strings are counted in full; small ints and ``None`` shared by the
+        interpreter are not.
+
+        Returns:
+            dict: Column name to bytes, plus ``total`` and ``per_100k``
+            (``total`` scaled to 100,000 movies).
+        """
+        with self._lock:
+
+            def strings(values):
+                return sys.getsizeof(values) + sum(
+                    sys.getsizeof(v) for v in values if v is not None
+                )
+
+            usage = {
+                "ids": sys.getsizeof(self.ids),
+                "years": sys.getsizeof(self.years),
+                "ratings": sys.getsizeof(self.ratings),
+                "titles": strings(self.titles),
+                "posters": sys.getsizeof(self.poster_dirs)
+                + strings(self.poster_names)
+                + strings(self._dir_list),
+                "genre_bits": sum(sys.getsizeof(b) for b in self.genre_bits.values()),
+                "position": sys.getsizeof(self.position)
+                + sum(sys.getsizeof(k) for k in self.position),
+                "orders": sum(sys.getsizeof(o) for o in self._orders.values()),
+            }
+            usage["total"] = sum(usage.values())
+            movies = len(self.position)
+            usage["per_100k"] = (
+                math.ceil(usage["total"] * 100_000 / movies) if movies else 0
+            )
+            return usage
+
+    def status(self):
+        """Return size, change log position and refresh counters."""
+        return {
+            "movies": len(self.position),
+            "dead_slots": self.dead,
+            "genres": len(self.genres),
+            "seq": self.seq,
+            "rebuilds": self.rebuilds,
+            "patches": self.patches,
+        }
+
+
+def get_snapshot():
+    """Return the current app's :class:`CatalogueSnapshot`, or None if disabled."""
+    return current_app.extensions.get("catalogue_snapshot")
+
+
+def init_app(app):
+    """Build the snapshot at startup if ``CATALOGUE_SNAPSHOT`` is enabled."""
+    app.config.setdefault(
+        "CATALOGUE_SNAPSHOT", os.environ.get("WEBFLIX_CATALOGUE_SNAPSHOT") == "1"
+    )
+    app.config.setdefault("CATALOGUE_SNAPSHOT_INTERVAL", 1.0)
+    if not app.config["CATALOGUE_SNAPSHOT"]:
+        return
+    with app.app_context():
+        snapshot = CatalogueSnapshot(
+            db.engine, check_interval=app.config["CATALOGUE_SNAPSHOT_INTERVAL"]
+        )
+        snapshot.refresh(force=True)
+    app.extensions["catalogue_snapshot"] = snapshot
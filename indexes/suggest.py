@@ -0,0 +1,206 @@
+"""Prefix index over movie titles and directors for typeahead suggestions.
+
+Every movie contributes a few search terms: its normalised title
+(lower-case, accents and punctuation removed), the title from each later
+word on ("matrix reloaded", "reloaded"; not from "the", "a", ...) and the
+same for each director's name. The terms live in one sorted list with a
+parallel ``array`` of movie ids, so the movies whose terms start with a
+prefix are one contiguous range found with two bisections.
+
+:meth:`SuggestIndex.suggest` returns the best-rated matches: small ranges
+are ranked directly; for very common prefixes the movies are walked in
+rating order instead until enough of them match, so both stay within a
+few milliseconds. Refresh follows :class:`~indexes.tracking.CatalogueIndex`,
+so new movies become suggestions without a rebuild.
+"""
+import heapq
+import re
+import unicodedata
+from array import array
+from bisect import bisect_left, insort
+
+from flask import current_app
+from sqlalchemy import select
+
+from models import db, Movie
+from stats.rollups import parse_rating
+from .tracking import CatalogueIndex
+
+CHUNK = 500
+NO_RATING = -1.0
+# ranges longer than this are answered by walking movies in rating order
+SCAN_LIMIT = 4000
+# patches touching more movies re-sort all terms instead of moving each
+RESORT_THRESHOLD = 256
+STOPWORDS = frozenset(("a", "an", "and", "of", "the"))
+_NOT_WORD = re.compile(r"[\W_]+")
+_LAST = "\U0010ffff"
+
+
+def normalize(text):
+    """Lower-case ``text`` and drop accents and punctuation."""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(_NOT_WORD.sub(" ", text.lower()).split())
+
+
+def _suffixes(text):
+    words = normalize(text).split()
+    for start, word in enumerate(words):
+        if start == 0 or word not in STOPWORDS:
+            yield " ".join(words[start:])
+
+
+def search_terms(title, director):
+    """Return the terms a movie is found by."""
+    terms = set(_suffixes(title))
+    # OMDb lists several directors as "Lana Wachowski, Lilly Wachowski"
+    for name in (director or "").split(","):
+        if name.strip() and name.strip() != "N/A":
+            terms.update(_suffixes(name))
+    terms.discard("")
+    return tuple(sorted(terms))
+
+
+class SuggestIndex(CatalogueIndex):
+    """Sorted search terms of every movie, ranked by numeric IMDb rating."""
+
+    def __init__(self, engine, check_interval=1.0):
+        self._reset()
+        super().__init__(engine, check_interval)
+
+    def _reset(self):
+        self.keys = []
+        self.key_ids = array("q")
+        # movie id -> its terms and its rating
+        self.terms = {}
+        self.ratings = {}
+        # (-rating, id) of every movie, best first
+        self.by_rating = []
+
+    def _rank(self, movie_id):
+        return (-self.ratings[movie_id], movie_id)
+
+    def _rebuild(self, conn):
+        self._reset()
+        for row in conn.execute(
+            select(Movie.id, Movie.title, Movie.director, Movie.imdb_rating)
+        ):
+            self._set(*row)
+        self._resort()
+        return "rebuilt"
+
+    def _resort(self):
+        entries = sorted(
+            (term, movie_id) for movie_id, terms in self.terms.items() for term in terms
+        )
+        self.keys = [term for term, _ in entries]
+        self.key_ids = array("q", (movie_id for _, movie_id in entries))
+        self.by_rating = sorted(self._rank(movie_id) for movie_id in self.terms)
+
+    def _set(self, movie_id, title, director, rating):
+        rating = parse_rating(rating)
+        self.terms[movie_id] = search_terms(title, director)
+        self.ratings[movie_id] = NO_RATING if rating is None else rating
+
+    def _patch(self, conn, movie_ids, genres_changed):
+        ids = sorted(movie_ids)
+        resort = len(ids) > RESORT_THRESHOLD
+        if not resort:
+            for movie_id in ids:
+                self._unplace(movie_id)
+        for movie_id in ids:
+            self.terms.pop(movie_id, None)
+            self.ratings.pop(movie_id, None)
+        for start in range(0, len(ids), CHUNK):
+            for row in conn.execute(
+                select(Movie.id, Movie.title, Movie.director, Movie.imdb_rating).where(
+                    Movie.id.in_(ids[start : start + CHUNK])
+                )
+            ):
+                self._set(*row)
+                if not resort:
+                    self._place(row.id)
+        if resort:
+            self._resort()
+        return "patched"
+
+    def _place(self, movie_id):
+        for term in self.terms[movie_id]:
+            index = bisect_left(self.keys, term)
+            while (
+                index < len(self.keys)
+                and self.keys[index] == term
+                and self.key_ids[index] < movie_id
+            ):
+                index += 1
+            self.keys.insert(index, term)
+            self.key_ids.insert(index, movie_id)
+        insort(self.by_rating, self._rank(movie_id))
+
+    def _unplace(self, movie_id):
+        if movie_id not in self.terms:
+            return
+        for term in self.terms[movie_id]:
+            index = bisect_left(self.keys, term)
+            while self.key_ids[index] != movie_id:
+                index += 1
+            del self.keys[index]
+            del self.key_ids[index]
+        rank = self._rank(movie_id)
+        del self.by_rating[bisect_left(self.by_rating, rank)]
+
+    def suggest(self, text, limit=8):
+        """Return ids of the best-rated movies matching a typed prefix.
+
+        Args:
+            text (str): What the user typed so far; matched against the
+                start of the title, of any later title word, or of a
+                director's first or last name.
+            limit (int): Maximum number of ids.
+
+        Returns:
+            list[int]: Movie ids, best IMDb rating first (unrated last).
+        """
+        self.refresh()
+        prefix = normalize(text)
+        if not prefix:
+            return []
+        with self._lock:
+            lo = bisect_left(self.keys, prefix)
+            hi = bisect_left(self.keys, prefix + _LAST, lo)
+            if hi - lo <= SCAN_LIMIT:
+                matches = set(self.key_ids[lo:hi])
+                return heapq.nsmallest(limit, matches, key=self._rank)
+            found = []
+            for _, movie_id in self.by_rating:
+                if any(term.startswith(prefix) for term in self.terms[movie_id]):
+                    found.append(movie_id)
+                    if len(found) == limit:
+                        break
+            return found
+
+    def status(self):
+        """Return sizes and refresh counters."""
+        return {
+            "movies": len(self.terms),
+            "terms": len(self.keys),
+            "seq": self.seq,
+            "rebuilds": self.rebuilds,
+            "patches": self.patches,
+        }
+
+
+def get_suggest_index():
+    """Return the current app's :class:`SuggestIndex`, built on first use."""
+    app = current_app._get_current_object()
+    index = app.extensions.get("suggest_index")
+    if index is None:
+        index = app.extensions.setdefault(
+            "suggest_index",
+            SuggestIndex(
+                db.engine,
+                check_interval=app.config.get("SUGGEST_INDEX_INTERVAL", 1.0),
+            ),
+        )
+    return index
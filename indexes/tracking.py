@@ -0,0 +1,159 @@
+"""Keeping in-process catalogue indexes in step with the database.
+
+A :class:`CatalogueIndex` is loaded from the primary and then follows the
+change log (:mod:`models.changelog`): each refresh reads the entries for
+``movies``, ``movie_genre`` and ``genres`` after the last one it applied
+and patches just those movies. Writes committed by this process mark its
+indexes stale at once, so they are applied before the next query; other
+processes' writes are picked up within ``check_interval`` seconds. An index
+rebuilds from scratch when it is new, when the log was truncated past its
+position, or when more than ``REBUILD_AFTER`` entries are waiting.
+"""
+
+import json
+import threading
+import time
+import weakref
+from abc import ABC, abstractmethod
+
+from sqlalchemy import event, func, select
+from sqlalchemy.engine import Engine
+
+from models import ChangeLog, on_change
+from models.changelog import CATALOGUE_TABLES, FLOOR_SCOPE
+from models.tenants import catalogue_engine
+from models.versions import DataVersion
+
+WRITTEN_KEY = "catalogue_written"
+REBUILD_AFTER = 5000
+
+# engine -> indexes loaded from it
+_indexes = weakref.WeakKeyDictionary()
+
+
+class CatalogueIndex(ABC):
+    """Base class for in-memory structures derived from the catalogue.
+
+    Subclasses implement ``_rebuild(conn)`` and
+    ``_patch(conn, movie_ids, genres_changed)``.
+
+    Args:
+        engine (Engine): Engine to load from (the primary).
+        check_interval (float): Seconds between checks of the change log
+            when this process has not written.
+    """
+
+    def __init__(self, engine, check_interval=1.0):
+        self.engine = engine
+        self.check_interval = check_interval
+        # last change log entry applied
+        self.seq = None
+        self.rebuilds = 0
+        self.patches = 0
+        self._checked_at = None
+        self._stale = False
+        self._lock = threading.RLock()
+        _indexes.setdefault(engine, weakref.WeakSet()).add(self)
+
+    def _needs_rebuild(self):
+        return self.seq is None
+
+    def refresh(self, force=False):
+        """Bring the index up to date if it may be stale.
+
+        Args:
+            force (bool): Read the change log even if it was read less than
+                ``check_interval`` seconds ago.
+
+        Returns:
+            str: ``"rebuilt"``, ``"patched"`` or ``"current"``.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if not (
+                force
+                or self._stale
+                or self._checked_at is None
+                or now - self._checked_at >= self.check_interval
+            ):
+                return "current"
+            self._checked_at = now
+            self._stale = False
+            with self.engine.connect() as conn:
+                # read the position first: anything committed while loading
+                # is applied again next time, which is harmless
+                latest = conn.scalar(select(func.max(ChangeLog.seq))) or 0
+                floor = (
+                    conn.scalar(
+                        select(DataVersion.version).where(
+                            DataVersion.scope == FLOOR_SCOPE
+                        )
+                    )
+                    or 0
+                )
+                # an emptied log still has its floor: no entry up to it is left
+                latest = max(latest, floor)
+                if self._needs_rebuild() or self.seq < floor:
+                    outcome = self._rebuild(conn)
+                elif latest == self.seq:
+                    outcome = "current"
+                else:
+                    outcome = self._follow(conn, latest)
+            if outcome == "rebuilt":
+                self.rebuilds += 1
+            elif outcome == "patched":
+                self.patches += 1
+            self.seq = latest
+            return outcome
+
+    def _follow(self, conn, latest):
+        rows = conn.execute(
+            select(ChangeLog.table_name, ChangeLog.row_key)
+            .where(
+                ChangeLog.seq > self.seq,
+                ChangeLog.seq <= latest,
+                ChangeLog.table_name.in_(CATALOGUE_TABLES),
+            )
+            .limit(REBUILD_AFTER + 1)
+        ).all()
+        if len(rows) > REBUILD_AFTER:
+            return self._rebuild(conn)
+        movie_ids, genres_changed = set(), False
+        for table_name, row_key in rows:
+            if table_name == "genres":
+                genres_changed = True
+            else:
+                movie_ids.add(json.loads(row_key)[0])
+        if not (movie_ids or genres_changed):
+            return "current"
+        return self._patch(conn, movie_ids, genres_changed)
+
+    @abstractmethod
+    def _rebuild(self, conn):
+        """Load the index from scratch; return ``"rebuilt"``."""
+
+    @abstractmethod
+    def _patch(self, conn, movie_ids, genres_changed):
+        """Reload ``movie_ids`` (and all genres); return ``"patched"``."""
+
+
+# on every engine: catalogue writes also commit through tenant databases
+@event.listens_for(Engine, "commit")
+def _on_commit(conn):
+    if conn.info.pop(WRITTEN_KEY, False):
+        for index in list(_indexes.get(catalogue_engine(conn.engine), ())):
+            index._stale = True
+
+
+@event.listens_for(Engine, "rollback")
+def _on_rollback(conn):
+    conn.info.pop(WRITTEN_KEY, None)
+
+
+@on_change
+def track_catalogue_writes(connection, changes):
+    """Mark this process's indexes stale once a catalogue write commits."""
+    if catalogue_engine(connection.engine) in _indexes and any(
+        change.table in CATALOGUE_TABLES for change in changes
+    ):
+        connection.info[WRITTEN_KEY] = True
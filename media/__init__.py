@@ -0,0 +1,26 @@
+from .avatars import (
+    AVATAR_VARIANTS,
+    AvatarError,
+    avatar_url,
+    cached_variant,
+    forget_variants,
+    sniff,
+    upload_avatar,
+    user_variant_url,
+)
+from .uploads import (
+    get_admin_api,
+    get_uploader,
+    init_app,
+    preload_sdks,
+)
+from .lifecycle import (
+    DeletionWorker,
+    deletion_status,
+    public_id_from_url,
+    purge_deletions,
+    release_upload,
+    sweep_orphans,
+    user_public_id,
+    wake_deletion_worker,
+)
@@ -0,0 +1,281 @@
+"""Profile pictures: validated, stripped and downsized before upload.
+
+:func:`upload_avatar` works on the uploaded file as Werkzeug saved it (a
+temporary file once it is large). It reads only the header to check the
+format and pixel count, and decodes JPEGs at a reduced scale straight to
+about ``AVATAR_MAX_SIZE`` pixels, so a 12 MB phone photo never exists in
+memory at full resolution. The image is turned upright from its EXIF
+orientation, re-encoded without EXIF, GPS or other metadata into a spooled
+temporary file, and uploaded in place of the original.
+
+Each avatar has square variants (``AVATAR_VARIANTS``, sized for where
+avatars are shown) whose Cloudinary transformation URLs are stored on the
+user. The variants are rendered locally at upload time into
+``AVATAR_CACHE_DIR``, and ``/avatars/<user_id>/<variant>`` serves them from
+there, fetching from Cloudinary only on a cache miss (e.g. on another host).
+
+Pillow is optional: without it, uploads are checked by type and size only
+and sent unchanged, and Cloudinary's transformations do the resizing.
+"""
+import hashlib
+import io
+import json
+import os
+import tempfile
+
+from flask import current_app, url_for
+
+# variant name -> edge in pixels (twice the largest CSS size it is shown at)
+AVATAR_VARIANTS = {"small": 80, "medium": 160}
+FORMATS = {"JPEG": "jpg", "PNG": "png", "GIF": "gif", "WEBP": "webp"}
+# prepared uploads stay in memory up to this size, then go to a temp file
+SPOOL_BYTES = 1024 * 1024
+# leading bytes of each accepted format -> (extension, mimetype)
+_SIGNATURES = (
+    (b"\xff\xd8\xff", "jpg", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "png", "image/png"),
+    (b"GIF87a", "gif", "image/gif"),
+    (b"GIF89a", "gif", "image/gif"),
+    (b"RIFF", "webp", "image/webp"),
+)
+
+
+class AvatarError(ValueError):
+    """An uploaded profile picture was rejected.
+
+    Args:
+        message (str): Why, for the user.
+        public_id (str): The asset, if the upload succeeded before the
+            picture was rejected; the caller must release it.
+    """
+
+    def __init__(self, message, public_id=None):
+        super().__init__(message)
+        self.public_id = public_id
+
+
+def init_app(app):
+    """Set the avatar defaults."""
+    app.config.setdefault("AVATAR_MAX_BYTES", 15 * 1024 * 1024)
+    app.config.setdefault("AVATAR_MAX_PIXELS", 40_000_000)
+    # longest edge of the uploaded master image
+    app.config.setdefault("AVATAR_MAX_SIZE", 512)
+    app.config.setdefault(
+        "AVATAR_CACHE_DIR", os.path.join(app.root_path, "data", "avatar_cache")
+    )
+
+
+def pillow():
+    """Return ``(Image, ImageOps)``, imported on first use; None without Pillow."""
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:  # optional dependency
+        return None
+    return Image, ImageOps
+
+
+def sniff(head):
+    """Return ``(extension, mimetype)`` for an image's first bytes, or None."""
+    for signature, extension, mimetype in _SIGNATURES:
+        if head.startswith(signature):
+            if extension == "webp" and head[8:12] != b"WEBP":
+                continue
+            return extension, mimetype
+    return None
+
+
+def _size(stream):
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(0)
+    return size
+
+
+def _prepare(stream, config):
+    """Decode, downsize, orient and re-encode; returns ``(file, image)``."""
+    Image, ImageOps = pillow()
+    try:
+        image = Image.open(stream)
+        if image.format not in FORMATS:
+            raise AvatarError("Profile pictures must be JPEG, PNG, GIF or WebP.")
+        if image.width * image.height > config["AVATAR_MAX_PIXELS"]:
+            raise AvatarError("The picture has too many pixels.")
+        edge = config["AVATAR_MAX_SIZE"]
+        # JPEG: let the decoder scale down by up to 8x while reading
+        image.draft("RGB", (edge, edge))
+        image.thumbnail((edge, edge), Image.Resampling.LANCZOS, reducing_gap=3.0)
+        # rotate only the small copy
+        image = ImageOps.exif_transpose(image)
+    except (Image.UnidentifiedImageError, Image.DecompressionBombError) as e:
+        raise AvatarError("The file is not a readable image.") from e
+    except OSError as e:
+        # truncated or corrupt data
+        raise AvatarError(f"The picture could not be read: {e}") from e
+
+    transparent = image.mode in ("RGBA", "LA") or "transparency" in image.info
+    image = image.convert("RGBA" if transparent else "RGB")
+    out = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+    # nothing from image.info (EXIF, XMP, ICC, comments) is passed on
+    if transparent:
+        image.save(out, "PNG", optimize=True)
+    else:
+        image.save(out, "JPEG", quality=85, optimize=True, progressive=True)
+    out.seek(0)
+    return out, image
+
+
+def _render_variants(image):
+    """Return ``{variant: bytes}`` of square crops of a prepared image."""
+    Image, ImageOps = pillow()
+    rendered = {}
+    for name, edge in AVATAR_VARIANTS.items():
+        crop = ImageOps.fit(image, (edge, edge), Image.Resampling.LANCZOS)
+        buffer = io.BytesIO()
+        if crop.mode == "RGBA":
+            crop.save(buffer, "PNG", optimize=True)
+        else:
+            crop.save(buffer, "JPEG", quality=85, optimize=True)
+        rendered[name] = buffer.getvalue()
+    return rendered
+
+
+def variant_url(url, variant):
+    """Return the Cloudinary transformation URL of one avatar variant.
+
+    URLs that are not Cloudinary delivery URLs are returned unchanged.
+    """
+    marker = "/image/upload/"
+    if marker not in url:
+        return url
+    edge = AVATAR_VARIANTS[variant]
+    transformation = f"c_fill,g_face,w_{edge},h_{edge},q_auto"
+    base, _, rest = url.partition(marker)
+    return f"{base}{marker}{transformation}/{rest}"
+
+
+def upload_avatar(file, uploader):
+    """Validate, shrink and upload a profile picture.
+
+    Args:
+        file (FileStorage): The uploaded file.
+        uploader: Cloudinary uploader (see :func:`media.get_uploader`).
+
+    Returns:
+        tuple: ``(url, public_id, variant_urls)``: the uploaded master
+        image's URL and Cloudinary ``public_id``, and a JSON string mapping
+        variant names to transformation URLs.
+
+    Raises:
+        AvatarError: If the file is too large, not an accepted image or
+            unreadable, or the upload returned no URL (with the uploaded
+            asset's ``public_id``, if any).
+    """
+    config = current_app.config
+    stream = file.stream
+    if _size(stream) > config["AVATAR_MAX_BYTES"]:
+        limit = config["AVATAR_MAX_BYTES"] // (1024 * 1024)
+        raise AvatarError(f"Profile pictures may be at most {limit} MB.")
+
+    if pillow() is None:
+        if sniff(stream.read(16)) is None:
+            raise AvatarError("Profile pictures must be JPEG, PNG, GIF or WebP.")
+        stream.seek(0)
+        prepared, rendered = stream, {}
+    else:
+        prepared, image = _prepare(stream, config)
+        rendered = _render_variants(image)
+
+    try:
+        result = uploader.upload(
+            prepared, folder=config["MEDIA_FOLDER"], resource_type="image"
+        )
+    finally:
+        prepared.close()
+    url = result.get("secure_url")
+    if not url:
+        raise AvatarError(
+            "The picture could not be uploaded.", public_id=result.get("public_id")
+        )
+    urls = {name: variant_url(url, name) for name in AVATAR_VARIANTS}
+    for name, data in rendered.items():
+        _cache_store(urls[name], data)
+    return url, result.get("public_id"), json.dumps(urls)
+
+
+# -- local variant cache ---------------------------------------------------
+
+
+def _cache_path(url):
+    digest = hashlib.sha1(url.encode("utf-8")).hexdigest()
+    return os.path.join(current_app.config["AVATAR_CACHE_DIR"], digest[:2], digest)
+
+
+def _cache_store(url, data):
+    path = _cache_path(url)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # write then rename, so readers never see a partial file
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+    return path
+
+
+def forget_variants(variant_urls):
+    """Remove a replaced or deleted avatar's variants from the local cache."""
+    for url in json.loads(variant_urls or "{}").values():
+        try:
+            os.remove(_cache_path(url))
+        except FileNotFoundError:
+            pass
+
+
+def user_variant_url(user, variant):
+    """Return the URL a user's avatar variant is stored under, or None."""
+    if not user.profile_pic_url:
+        return None
+    urls = json.loads(user.avatar_urls or "{}")
+    # users from before variants were stored: derive the transformation URL
+    return urls.get(variant) or variant_url(user.profile_pic_url, variant)
+
+
+def cached_variant(url, uploader):
+    """Return the path of a cached variant, fetching it on a miss.
+
+    Args:
+        url (str): Variant URL (see :func:`user_variant_url`).
+        uploader: Uploader whose ``open_url`` serves its own URLs (the local
+            stand-in); URLs are fetched over HTTP otherwise.
+
+    Raises:
+        AvatarError: If the fetched data is not an image.
+    """
+    path = _cache_path(url)
+    if os.path.exists(path):
+        return path
+    open_url = getattr(uploader, "open_url", None)
+    if open_url is not None:
+        data = open_url(url)
+    else:
+        import requests
+
+        response = requests.get(url, timeout=10)
+        response.raise_for_status()
+        data = response.content
+    if sniff(data[:16]) is None:
+        raise AvatarError(f"{url} did not return an image.")
+    return _cache_store(url, data)
+
+
+def avatar_url(user, variant="small"):
+    """Return the ``src`` for a user's avatar variant (for templates).
+
+    Points at the local cache route when this process serves it, with a
+    hash of the variant URL so browsers may cache it forever; at the
+    variant URL itself otherwise. None if the user has no picture.
+    """
+    url = user_variant_url(user, variant)
+    if url is None or "users.avatar" not in current_app.view_functions:
+        return url
+    version = hashlib.sha1(url.encode("utf-8")).hexdigest()[:12]
+    return url_for("users.avatar", user_id=user.id, variant=variant, v=version)
@@ -0,0 +1,330 @@
+"""Deleting hosted profile pictures, and finding the ones nobody uses.
+
+Views never delete from Cloudinary themselves. They add the replaced or
+removed picture's ``public_id`` to the ``media_deletions`` queue in the
+same transaction as the user change (:func:`models.queue_deletion`) and
+wake the per-process :class:`DeletionWorker`. The worker (or ``flask
+purge-media``) deletes queued assets up to 100 at a time with the Admin
+API's ``delete_resources``; a failed batch is retried with exponential
+backoff and its rows stay queued until the host confirms the deletion.
+
+:func:`sweep_orphans` (``flask sweep-media``) is the safety net for
+anything that still leaks, e.g. an upload whose user change never
+committed: it lists the media folder and queues every asset older than a
+grace period that no user references.
+"""
+
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app
+from sqlalchemy import func, select
+
+from models import db, MediaDeletion, User, current_tenant, get_tenants
+from models import queue_deletion, use_tenant
+
+from .uploads import get_admin_api
+
+# the Admin API deletes at most 100 public IDs per call
+BATCH_SIZE = 100
+MAX_ATTEMPTS = 8
+RETRY_BASE = timedelta(minutes=1)
+RETRY_MAX = timedelta(hours=6)
+# [transformations/]v<version>/<public_id>.<format> after ".../upload/"
+_PUBLIC_ID = re.compile(
+    r"/(?:image|video|raw)/upload/(?:(?:[^/]+/)*?v\d+/)?(?P<public_id>.+?)(?:\.\w+)?$"
+)
+
+
+def _utcnow():
+    return datetime.now(timezone.utc)
+
+
+def _naive(moment):
+    # SQLite hands DateTime columns back without a timezone
+    return moment.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def public_id_from_url(url):
+    """Return the Cloudinary ``public_id`` of a delivery URL, or None.
+
+    Used for users stored before ``profile_pic_public_id`` existed.
+    """
+    match = _PUBLIC_ID.search(url or "")
+    return match["public_id"] if match else None
+
+
+def user_public_id(user):
+    """Return the ``public_id`` of a user's picture, or None.
+
+    For users stored before the ID was, it is taken from the URL, and only
+    if the picture is in ``MEDIA_FOLDER``: the app never deletes assets
+    it did not upload.
+    """
+    if user.profile_pic_public_id:
+        return user.profile_pic_public_id
+    public_id = public_id_from_url(user.profile_pic_url)
+    if public_id and public_id.startswith(f"{current_app.config['MEDIA_FOLDER']}/"):
+        return public_id
+    return None
+
+
+def _user_databases():
+    # every tenant's users share the media folder
+    registry = get_tenants()
+    if registry is None:
+        return [current_tenant()]
+    return [None, *registry.keys()]
+
+
+def retry_delay(attempts):
+    """Return how long to wait before retrying after ``attempts`` failures."""
+    # far past the cap the doubling would overflow timedelta
+    return min(RETRY_BASE * 2 ** min(attempts - 1, 20), RETRY_MAX)
+
+
+def purge_deletions(api, batch_size=BATCH_SIZE, max_attempts=MAX_ATTEMPTS):
+    """Delete the queued assets that are due, in batches.
+
+    Each batch is committed on its own. Assets deleted or already missing
+    leave the queue; the others are retried after :func:`retry_delay`,
+    until ``max_attempts`` failures, when they stay queued for a person to
+    look at (``flask purge-media`` lists them).
+
+    Args:
+        api: Admin API with ``delete_resources`` (``cloudinary.api``, or the
+            local stand-in; see :func:`media.get_admin_api`).
+        batch_size (int): Public IDs per call, at most 100.
+        max_attempts (int): Failures after which an asset is given up on.
+
+    Returns:
+        dict: Counts of ``deleted``, ``not_found`` and ``failed`` assets, of
+        ``batches``, and ``next_retry``: when the earliest failed asset is
+        due again (None if none is waiting).
+    """
+    totals = {"deleted": 0, "not_found": 0, "failed": 0, "batches": 0}
+    now = _utcnow()
+    due = (MediaDeletion.not_before <= _naive(now)) & (
+        MediaDeletion.attempts < max_attempts
+    )
+    while True:
+        first = db.session.scalars(
+            select(MediaDeletion).where(due).order_by(MediaDeletion.id).limit(1)
+        ).first()
+        if first is None:
+            break
+        # one resource type per call
+        rows = db.session.scalars(
+            select(MediaDeletion)
+            .where(due, MediaDeletion.resource_type == first.resource_type)
+            .order_by(MediaDeletion.id)
+            .limit(batch_size)
+        ).all()
+        ids = [row.public_id for row in rows]
+        try:
+            result = api.delete_resources(ids, resource_type=first.resource_type)
+            statuses, error = result.get("deleted", {}), None
+        except Exception as e:
+            statuses, error = {}, f"{type(e).__name__}: {e}"
+        for row in rows:
+            status = statuses.get(row.public_id)
+            if status in ("deleted", "not_found"):
+                totals[status] += 1
+                db.session.delete(row)
+                continue
+            totals["failed"] += 1
+            row.attempts += 1
+            row.last_error = (error or f"status {status!r}")[:512]
+            row.not_before = _naive(now + retry_delay(row.attempts))
+        db.session.commit()
+        totals["batches"] += 1
+    totals["next_retry"] = db.session.scalar(
+        select(func.min(MediaDeletion.not_before)).where(
+            MediaDeletion.attempts.between(1, max_attempts - 1)
+        )
+    )
+    return totals
+
+
+def deletion_status(max_attempts=MAX_ATTEMPTS):
+    """Return the queue's size, its failures and the assets given up on."""
+    queued = db.session.scalar(select(func.count()).select_from(MediaDeletion))
+    retrying = db.session.scalar(
+        select(func.count()).where(MediaDeletion.attempts.between(1, max_attempts - 1))
+    )
+    abandoned = db.session.scalars(
+        select(MediaDeletion).where(MediaDeletion.attempts >= max_attempts)
+    ).all()
+    return {"queued": queued, "retrying": retrying, "abandoned": abandoned}
+
+
+def release_upload(public_id):
+    """Queue a just-uploaded asset whose user change did not commit.
+
+    Called after the rollback, in a transaction of its own. If that fails
+    too, :func:`sweep_orphans` finds the asset later.
+    """
+    if not public_id:
+        return
+    try:
+        queue_deletion([public_id])
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Warning: Could not queue deletion of {public_id}: {e}")
+        return
+    wake_deletion_worker()
+
+
+def sweep_orphans(api, folder, min_age=timedelta(hours=1), dry_run=False):
+    """Queue the assets in ``folder`` that no user references.
+
+    Also fills in ``profile_pic_public_id`` for users stored before it.
+    With tenant sharding, the users of every tenant are checked.
+
+    Args:
+        api: Admin API with ``resources`` (see :func:`purge_deletions`).
+        folder (str): Media folder to reconcile, e.g. "webflix".
+        min_age (timedelta): Grace period; younger assets may belong to a
+            user change that has not committed yet.
+        dry_run (bool): Only count; change nothing.
+
+    Returns:
+        dict: Counts of ``listed``, ``referenced``, ``recent`` and already
+        ``queued`` assets, the ``orphans`` found, users whose picture is
+        ``missing`` from the folder, and users ``backfilled``.
+    """
+    totals = dict.fromkeys(
+        ("listed", "referenced", "recent", "queued", "backfilled"), 0
+    )
+    referenced = set()
+    for tenant in _user_databases():
+        with use_tenant(tenant):
+            for user in db.session.scalars(
+                select(User).where(User.profile_pic_url.isnot(None))
+            ):
+                public_id = user_public_id(user)
+                if public_id and not user.profile_pic_public_id and not dry_run:
+                    user.profile_pic_public_id = public_id
+                    totals["backfilled"] += 1
+                if public_id and public_id.startswith(f"{folder}/"):
+                    referenced.add(public_id)
+            if dry_run:
+                db.session.rollback()
+            else:
+                db.session.commit()
+    queued = set(db.session.scalars(select(MediaDeletion.public_id)))
+    cutoff = _utcnow() - min_age
+
+    orphans, found, cursor = [], set(), None
+    while True:
+        options = {"next_cursor": cursor} if cursor else {}
+        page = api.resources(
+            type="upload",
+            resource_type="image",
+            prefix=f"{folder}/",
+            max_results=500,
+            **options,
+        )
+        for resource in page.get("resources", []):
+            public_id = resource["public_id"]
+            totals["listed"] += 1
+            if public_id in referenced:
+                found.add(public_id)
+                totals["referenced"] += 1
+            elif public_id in queued:
+                totals["queued"] += 1
+            elif datetime.fromisoformat(resource["created_at"]) > cutoff:
+                totals["recent"] += 1
+            else:
+                orphans.append(public_id)
+        cursor = page.get("next_cursor")
+        if not cursor:
+            break
+
+    totals["orphans"] = orphans
+    totals["missing"] = sorted(referenced - found)
+    if dry_run:
+        db.session.rollback()
+    else:
+        queue_deletion(orphans)
+        db.session.commit()
+    return totals
+
+
+class DeletionWorker:
+    """Drains the deletion queue on a background thread of this process.
+
+    :meth:`wake` is called after a request commits a deletion; failed
+    batches are retried by waking again when they are due.
+
+    Args:
+        app (Flask): Application whose database and media backend are used.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._queued = False
+        self._timer = None
+
+    def _pool(self):
+        # created lazily, and again after a fork: threads do not survive it
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="media-deletions"
+            )
+            self._pid = os.getpid()
+        return self._executor
+
+    def wake(self):
+        """Run a drain soon, unless one is already waiting to start."""
+        with self._lock:
+            if self._queued and self._pid == os.getpid():
+                return
+            self._queued = True
+            self._pool().submit(self._run)
+
+    def _run(self):
+        with self._lock:
+            self._queued = False
+        with self.app.app_context():
+            try:
+                totals = purge_deletions(get_admin_api())
+            except Exception as e:
+                db.session.rollback()
+                print(f"Warning: Media deletion run failed: {e}")
+                return
+            finally:
+                db.session.remove()
+        if totals["next_retry"] is not None:
+            delay = totals["next_retry"] - _naive(_utcnow())
+            self._schedule(max(delay.total_seconds(), 1.0))
+
+    def _schedule(self, seconds):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(seconds, self.wake)
+            self._timer.daemon = True
+            self._timer.start()
+
+
+def wake_deletion_worker():
+    """Start draining the deletion queue in the background.
+
+    Does nothing with ``MEDIA_DELETE_WORKER = False``; the queue is then
+    drained by ``flask purge-media`` alone.
+    """
+    app = current_app._get_current_object()
+    if not app.config.get("MEDIA_DELETE_WORKER", True):
+        return
+    worker = app.extensions.get("media_deletions")
+    if worker is None:
+        worker = app.extensions.setdefault("media_deletions", DeletionWorker(app))
+    worker.wake()
@@ -0,0 +1,183 @@
+"""A local stand-in for the Cloudinary uploader.
+
+With ``MEDIA_BACKEND = "local"`` (or ``WEBFLIX_MEDIA_BACKEND=local``),
+:func:`media.get_uploader` returns a :class:`LocalUploader` instead of
+``cloudinary.uploader``. Uploads are written under ``MEDIA_LOCAL_DIR`` and
+answered with Cloudinary-shaped results and delivery URLs; transformation
+URLs (``c_fill,w_80,h_80``) are rendered on request with Pillow. It also
+answers the two Admin API calls the media lifecycle uses (``resources`` and
+``delete_resources``, see :mod:`media.lifecycle`). The profile views and the
+deletion queue can then be exercised without credentials or network access.
+"""
+import io
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from .avatars import pillow, sniff
+
+BASE_URL = "local://media"
+EXTENSIONS = ("jpg", "png", "gif", "webp")
+# the Admin API's limit on public IDs per delete_resources call
+DELETE_LIMIT = 100
+_DELIVERY = re.compile(
+    r"/image/upload/(?:(?P<transformation>[a-z]+_[^/]+)/)?v(?P<version>\d+)/"
+    r"(?P<public_id>.+)\.(?P<format>\w+)$"
+)
+
+
+class LocalUploader:
+    """Stores uploads in a directory; the subset of the uploader API we use.
+
+    Args:
+        root (str): Directory to store uploads in.
+        base_url (str): Prefix of the delivery URLs handed out.
+    """
+
+    def __init__(self, root, base_url=BASE_URL):
+        self.root = root
+        self.base_url = base_url
+        self._lock = threading.Lock()
+
+    def _path(self, public_id, extension):
+        path = os.path.abspath(os.path.join(self.root, f"{public_id}.{extension}"))
+        if not path.startswith(os.path.abspath(self.root) + os.sep):
+            raise ValueError(f"Invalid public_id {public_id!r}")
+        return path
+
+    def upload(
+        self, file, folder=None, public_id=None, resource_type="image", **options
+    ):
+        """Store ``file`` (a path or file object) like ``cloudinary.uploader.upload``."""
+        public_id = public_id or uuid.uuid4().hex[:20]
+        if folder:
+            public_id = f"{folder}/{public_id}"
+        os.makedirs(self.root, exist_ok=True)
+        source = open(file, "rb") if isinstance(file, str) else file
+        try:
+            with tempfile.NamedTemporaryFile(dir=self.root, delete=False) as tmp:
+                # copied in chunks; never held in memory whole
+                shutil.copyfileobj(source, tmp)
+                size = tmp.tell()
+        finally:
+            if source is not file:
+                source.close()
+        with open(tmp.name, "rb") as f:
+            kind = sniff(f.read(16))
+        if kind is None:
+            os.remove(tmp.name)
+            raise ValueError("Invalid image file")
+        extension = kind[0]
+        path = self._path(public_id, extension)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp.name, path)
+        version = int(time.time())
+        url = f"{self.base_url}/image/upload/v{version}/{public_id}.{extension}"
+        return {
+            "public_id": public_id,
+            "version": version,
+            "format": extension,
+            "resource_type": resource_type,
+            "bytes": size,
+            "url": url,
+            "secure_url": url,
+        }
+
+    def destroy(self, public_id, resource_type="image", **options):
+        """Delete an upload like ``cloudinary.uploader.destroy``."""
+        with self._lock:
+            for extension in EXTENSIONS:
+                path = self._path(public_id, extension)
+                if os.path.exists(path):
+                    os.remove(path)
+                    return {"result": "ok"}
+        return {"result": "not found"}
+
+    def delete_resources(self, public_ids, resource_type="image", **options):
+        """Delete uploads like ``cloudinary.api.delete_resources``."""
+        if len(public_ids) > DELETE_LIMIT:
+            raise ValueError(f"At most {DELETE_LIMIT} public IDs per call")
+        deleted = {}
+        for public_id in public_ids:
+            result = self.destroy(public_id, resource_type=resource_type)["result"]
+            deleted[public_id] = "deleted" if result == "ok" else "not_found"
+        return {"deleted": deleted, "partial": False}
+
+    def resources(
+        self,
+        type="upload",
+        resource_type="image",
+        prefix="",
+        max_results=10,
+        next_cursor=None,
+        **options,
+    ):
+        """List uploads like ``cloudinary.api.resources``, by public_id.
+
+        ``next_cursor`` is the public_id to continue after.
+        """
+        found = []
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                public_id, dot, extension = name.rpartition(".")
+                if not dot or extension not in EXTENSIONS:
+                    continue
+                relative = os.path.relpath(
+                    os.path.join(directory, public_id), self.root
+                )
+                public_id = relative.replace(os.sep, "/")
+                if public_id.startswith(prefix) and public_id > (next_cursor or ""):
+                    found.append((public_id, extension))
+        found.sort()
+        page = []
+        for public_id, extension in found[:max_results]:
+            stat = os.stat(self._path(public_id, extension))
+            created = datetime.fromtimestamp(stat.st_mtime, timezone.utc)
+            page.append(
+                {
+                    "public_id": public_id,
+                    "format": extension,
+                    "resource_type": resource_type,
+                    "type": type,
+                    "bytes": stat.st_size,
+                    "created_at": created.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                }
+            )
+        result = {"resources": page}
+        if len(found) > max_results:
+            result["next_cursor"] = page[-1]["public_id"]
+        return result
+
+    def open_url(self, url):
+        """Return the bytes a delivery URL handed out by :meth:`upload` serves.
+
+        Raises:
+            FileNotFoundError: If the URL is unknown or the upload deleted.
+        """
+        match = _DELIVERY.search(url) if url.startswith(self.base_url) else None
+        if match is None:
+            raise FileNotFoundError(url)
+        with open(self._path(match["public_id"], match["format"]), "rb") as f:
+            data = f.read()
+        params = dict(
+            part.split("_", 1)
+            for part in (match["transformation"] or "").split(",")
+            if "_" in part
+        )
+        if pillow() is None or not ("w" in params and "h" in params):
+            return data
+        Image, ImageOps = pillow()
+        image = Image.open(io.BytesIO(data))
+        size = (int(params["w"]), int(params["h"]))
+        if params.get("c") == "fill":
+            image = ImageOps.fit(image, size, Image.Resampling.LANCZOS)
+        else:
+            image.thumbnail(size, Image.Resampling.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, "PNG" if image.mode in ("RGBA", "LA", "P") else "JPEG")
+        return buffer.getvalue()
@@ -0,0 +1,108 @@
+"""Cloudinary access, imported and configured on first use.
+
+The Cloudinary SDK and the HTTP stack under it are a noticeable share of
+start-up time, yet only the user profile views need them. Nothing is
+imported until :func:`get_uploader` is first called.
+
+``MEDIA_BACKEND = "local"`` swaps in the stand-in from :mod:`media.local`
+for both the uploader and the Admin API.
+"""
+import os
+import threading
+
+from flask import current_app
+
+from .avatars import init_app as init_avatars
+from .avatars import pillow
+from .local import LocalUploader
+
+CONFIG_KEYS = ("CLOUDINARY_CLOUD_NAME", "CLOUDINARY_API_KEY", "CLOUDINARY_API_SECRET")
+
+_lock = threading.Lock()
+
+
+def init_app(app):
+    """Read Cloudinary credentials into the config without importing the SDK."""
+    for key in CONFIG_KEYS:
+        app.config.setdefault(key, os.environ.get(key))
+    app.config.setdefault(
+        "MEDIA_BACKEND", os.environ.get("WEBFLIX_MEDIA_BACKEND", "cloudinary")
+    )
+    app.config.setdefault(
+        "MEDIA_LOCAL_DIR", os.path.join(app.root_path, "data", "media_local")
+    )
+    # Cloudinary folder uploads go to, and the one flask sweep-media reconciles
+    app.config.setdefault("MEDIA_FOLDER", "webflix")
+    # drain the deletion queue on a background thread after each request
+    # that adds to it (see media.lifecycle); off, only flask purge-media does
+    app.config.setdefault("MEDIA_DELETE_WORKER", True)
+    init_avatars(app)
+
+
+def _configure(app):
+    """Configure the Cloudinary SDK for ``app``; a stand-in if local."""
+    with _lock:
+        backend = app.extensions.get("cloudinary")
+        if backend is None and app.config["MEDIA_BACKEND"] == "local":
+            backend = app.extensions["cloudinary"] = LocalUploader(
+                app.config["MEDIA_LOCAL_DIR"]
+            )
+        elif backend is None:
+            import cloudinary
+
+            cloudinary.config(
+                cloud_name=app.config["CLOUDINARY_CLOUD_NAME"],
+                api_key=app.config["CLOUDINARY_API_KEY"],
+                api_secret=app.config["CLOUDINARY_API_SECRET"],
+                secure=True,  # Use https
+            )
+            backend = app.extensions["cloudinary"] = cloudinary
+    return backend
+
+
+def get_uploader():
+    """Return ``cloudinary.uploader``, configured from the current app.
+
+    Returns:
+        module: The Cloudinary uploader API (``upload``, ``destroy``, ...),
+        or a :class:`~media.local.LocalUploader` with ``MEDIA_BACKEND =
+        "local"``.
+    """
+    app = current_app._get_current_object()
+    backend = app.extensions.get("cloudinary") or _configure(app)
+    if isinstance(backend, LocalUploader):
+        return backend
+    import cloudinary.uploader
+
+    return cloudinary.uploader
+
+
+def get_admin_api():
+    """Return ``cloudinary.api`` (listing, bulk deletion), configured.
+
+    Returns:
+        module: The Cloudinary Admin API (``resources``,
+        ``delete_resources``, ...), or the :class:`~media.local.LocalUploader`
+        with ``MEDIA_BACKEND = "local"``.
+    """
+    app = current_app._get_current_object()
+    backend = app.extensions.get("cloudinary") or _configure(app)
+    if isinstance(backend, LocalUploader):
+        return backend
+    import cloudinary.api
+
+    return cloudinary.api
+
+
+def preload_sdks():
+    """Import the lazily loaded client libraries right away.
+
+    Used in preload mode, where importing them once in the master process
+    lets every forked worker share the loaded modules.
+    """
+    import cloudinary.api  # noqa: F401
+    import cloudinary.uploader  # noqa: F401
+    import requests  # noqa: F401
+
+    if pillow() is not None:
+        import PIL.ImageOps  # noqa: F401
@@ -5,4 +5,58 @@ from .models import (
     Genre,
     UserMovie,
     movie_genre,
-)
\ No newline at end of file
+    MOVIE_TITLE_YEAR,
+)
+from .stats import (
+    GlobalStats,
+    UserStats,
+    GenreStats,
+    WeeklyAdditions,
+)
+from .schema import upgrade_schema
+from .events import (
+    Change,
+    on_change,
+    publish,
+)
+from .versions import (
+    DataVersion,
+    data_versions,
+)
+from .routing import (
+    get_router,
+    init_app as init_routing,
+    sync_sqlite_replica,
+    use_primary,
+)
+from .upserts import (
+    get_or_create,
+    supports_upsert_returning,
+)
+from .changelog import (
+    ChangeLog,
+    change_floor,
+    changes_since,
+    compact_changes,
+    format_position,
+    latest_seq,
+    parse_position,
+    tenant_changes_since,
+    tenant_floor,
+)
+from .assets import (
+    MediaDeletion,
+    queue_deletion,
+)
+from .tenants import (
+    TENANT_TABLES,
+    TenantRegistry,
+    UnknownTenant,
+    catalogue_table,
+    current_tenant,
+    get_tenants,
+    init_app as init_tenants,
+    read_assignments,
+    split_tenants,
+    use_tenant,
+)
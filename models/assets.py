@@ -0,0 +1,64 @@
+"""Durable queue of hosted media (Cloudinary assets) awaiting deletion.
+
+Replacing or removing a profile picture adds its ``public_id`` here in the
+same transaction as the user change, so the asset is deleted if and only
+if the change commits. The deletions themselves run later, in batches and
+with retries (see :mod:`media.lifecycle`); a row stays until the host has
+confirmed the asset is gone.
+"""
+from datetime import datetime, timezone
+
+from sqlalchemy import select
+
+from .models import db
+
+
+def _utcnow():
+    return datetime.now(timezone.utc)
+
+
+class MediaDeletion(db.Model):
+    """One hosted asset that is no longer referenced."""
+    __tablename__ = 'media_deletions'
+    __table_args__ = (
+        db.UniqueConstraint('public_id', 'resource_type',
+                            name='uq_media_deletions_asset'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    public_id = db.Column(db.String(255), nullable=False)
+    resource_type = db.Column(db.String(16), nullable=False, default='image')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.String(512))
+    # not retried before this time (backoff after a failed attempt)
+    not_before = db.Column(db.DateTime, nullable=False, index=True,
+                           default=_utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, default=_utcnow)
+
+    def __repr__(self):
+        return (f"<MediaDeletion id={self.id} public_id='{self.public_id}' "
+                f"attempts={self.attempts}>")
+
+
+def queue_deletion(public_ids, resource_type='image'):
+    """Add assets to the deletion queue in the current transaction.
+
+    Args:
+        public_ids (iterable): Public IDs; None and IDs already queued are
+            skipped.
+        resource_type (str): Cloudinary resource type of the assets.
+
+    Returns:
+        int: Number of rows added; they are written when the session commits.
+    """
+    ids = {p for p in public_ids if p}
+    if not ids:
+        return 0
+    queued = set(db.session.scalars(
+        select(MediaDeletion.public_id).where(
+            MediaDeletion.public_id.in_(ids),
+            MediaDeletion.resource_type == resource_type)))
+    added = sorted(ids - queued)
+    db.session.add_all(MediaDeletion(public_id=public_id,
+                                     resource_type=resource_type)
+                       for public_id in added)
+    return len(added)
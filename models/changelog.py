@@ -0,0 +1,339 @@
+"""Change-data feed: every tracked write, in commit order.
+
+The change handler below appends one ``change_log`` row per
+:class:`~models.events.Change` inside the flushing transaction, so an entry
+commits or rolls back together with the write it describes. ``seq`` is an
+AUTOINCREMENT key: it only grows and is never reused, even after
+compaction. SQLite serialises writers, so sequence order is commit order.
+
+Consumers remember the last ``seq`` they applied and ask for what came
+after it (:func:`changes_since`, ``GET /api/changes``). Two kinds of
+compaction keep the log small (:func:`compact_changes`):
+
+* collapsing: older entries for the same row are merged into its newest
+  entry (insert and update values are combined, a delete wins), so
+  replaying the compacted log still converges on the current rows;
+* truncation: entries older than the retention window are dropped and the
+  floor raised. A consumer whose position is below the floor has missed
+  entries and must re-read the tables.
+
+With tenant sharding there are two logs: the tenant's own (users, lists)
+and the catalogue database's (movies, genres), each with its own
+sequence. A tenant's feed reads both (:func:`tenant_changes_since`); its
+position is the pair ``"<catalogue seq>:<tenant seq>"``.
+"""
+import heapq
+import json
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+
+from sqlalchemy import delete, event, func, insert, or_, select, update
+from sqlalchemy.engine import Engine
+
+from .models import db
+from .events import on_change
+from .tenants import catalogue_table
+from .versions import DataVersion
+
+FLOOR_SCOPE = 'change_log:floor'
+WRITTEN_KEY = 'change_log_written'
+# logged in the catalogue database even when written from a tenant's
+CATALOGUE_TABLES = ('movies', 'movie_genre', 'genres')
+
+# woken when this process commits new entries
+_appended = threading.Condition()
+
+
+class ChangeLog(db.Model):
+    """One row-level write to a tracked table."""
+    __tablename__ = 'change_log'
+    __table_args__ = (
+        db.Index('ix_change_log_row', 'table_name', 'row_key'),
+        {'sqlite_autoincrement': True},
+    )
+    seq = db.Column(db.Integer, primary_key=True)
+    op = db.Column(db.String(8), nullable=False)
+    table_name = db.Column(db.String(32), nullable=False)
+    # primary key as a JSON list, e.g. "[3, 17]" for a user_movies row
+    row_key = db.Column(db.String(64), nullable=False)
+    # JSON of the new values: the whole row for inserts, the changed
+    # columns for updates, NULL for deletes
+    data = db.Column(db.Text)
+    created_at = db.Column(
+        db.DateTime, nullable=False, index=True,
+        default=lambda: datetime.now(timezone.utc))
+
+    def to_dict(self):
+        return _entry(self)
+
+    def __repr__(self):
+        return (f"<ChangeLog seq={self.seq} op='{self.op}' "
+                f"table='{self.table_name}' key={self.row_key}>")
+
+
+def _entry(row):
+    return {
+        'seq': row.seq,
+        'op': row.op,
+        'table': row.table_name,
+        'key': json.loads(row.row_key),
+        'data': json.loads(row.data) if row.data else None,
+        'at': row.created_at.isoformat(),
+    }
+
+
+def _log(catalogue=False):
+    """Return the change log table: the catalogue's or this database's."""
+    table = ChangeLog.__table__
+    return catalogue_table(table) if catalogue else table
+
+
+def _encode(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serialisable')
+
+
+def _dumps(value):
+    return json.dumps(value, default=_encode, sort_keys=True)
+
+
+@on_change
+def log_changes(connection, changes):
+    """Append the flushed changes to the change log."""
+    now = datetime.now(timezone.utc)
+    rows = {}
+    for change in changes:
+        table = ChangeLog.__table__
+        if change.table in CATALOGUE_TABLES:
+            table = catalogue_table(table, connection)
+        rows.setdefault(table, []).append({
+            'op': change.op,
+            'table_name': change.table,
+            'row_key': _dumps(list(change.key)),
+            'data': None if change.op == 'delete' else _dumps(change.new),
+            'created_at': now,
+        })
+    for table, entries in rows.items():
+        connection.execute(insert(table), entries)
+    connection.info[WRITTEN_KEY] = True
+
+
+@event.listens_for(Engine, 'commit')
+def _wake_waiters(conn):
+    if conn.info.pop(WRITTEN_KEY, False):
+        with _appended:
+            _appended.notify_all()
+
+
+@event.listens_for(Engine, 'rollback')
+def _forget_written(conn):
+    conn.info.pop(WRITTEN_KEY, None)
+
+
+def change_floor(catalogue=False):
+    """Return the highest sequence number removed by truncation (0 if none).
+
+    Args:
+        catalogue (bool): Of the catalogue's log, in a tenant.
+    """
+    versions = DataVersion.__table__
+    if catalogue:
+        versions = catalogue_table(versions)
+    return db.session.scalar(
+        select(versions.c.version).where(versions.c.scope == FLOOR_SCOPE)) or 0
+
+
+def latest_seq(catalogue=False):
+    """Return the sequence number of the newest entry (0 if the log is empty)."""
+    return db.session.scalar(select(func.max(_log(catalogue).c.seq))) or 0
+
+
+def _wait_for_entries(deadline, poll_interval):
+    """Wait for new entries until ``deadline``; False once it has passed."""
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        return False
+    # end the read transaction so the next poll sees new commits
+    db.session.rollback()
+    with _appended:
+        _appended.wait(min(poll_interval, remaining))
+    return True
+
+
+def changes_since(since, limit=500, tables=None, wait=0, poll_interval=0.5,
+                  key_prefix=None, catalogue=False):
+    """Return entries after ``since``, oldest first.
+
+    Args:
+        since (int): Last sequence number the caller has applied.
+        limit (int): Maximum number of entries.
+        tables (list): Only entries for these tables.
+        wait (float): If nothing is there yet, wait up to this many seconds
+            for new entries (long polling). Commits in this process wake
+            the waiter at once; other processes' are seen on the next poll.
+        poll_interval (float): Seconds between polls while waiting.
+        key_prefix (tuple): Only entries whose key starts with these values,
+            e.g. ``(user_id,)`` for one user's ``user_movies`` rows.
+        catalogue (bool): Read the catalogue's log, in a tenant.
+
+    Returns:
+        list[dict]: Entries as returned by :meth:`ChangeLog.to_dict`.
+    """
+    log = _log(catalogue)
+    stmt = select(log).where(log.c.seq > since).order_by(log.c.seq).limit(limit)
+    if tables:
+        stmt = stmt.where(log.c.table_name.in_(tables))
+    if key_prefix:
+        # "[3" matches "[3]" and "[3, 17]" but not "[31, 17]"
+        prefix = _dumps(list(key_prefix))[:-1]
+        stmt = stmt.where(or_(log.c.row_key == prefix + ']',
+                              log.c.row_key.like(prefix + ', %')))
+    deadline = time.monotonic() + wait
+    while True:
+        entries = [_entry(row) for row in db.session.execute(stmt)]
+        if entries or not _wait_for_entries(deadline, poll_interval):
+            return entries
+
+
+def parse_position(value):
+    """Return ``(catalogue seq, tenant seq)`` from a tenant feed position.
+
+    Accepts ``"<catalogue seq>:<tenant seq>"``, and ``"0"`` or None for
+    the start of both logs.
+
+    Raises:
+        ValueError: For anything else.
+    """
+    if value in (None, '', '0'):
+        return 0, 0
+    catalogue, sep, tenant = value.partition(':')
+    if not sep:
+        raise ValueError(f'{value!r} is not a "<catalogue>:<tenant>" position')
+    return int(catalogue), int(tenant)
+
+
+def format_position(position):
+    """Return ``(catalogue seq, tenant seq)`` as a tenant feed position."""
+    catalogue, tenant = position
+    return f'{catalogue}:{tenant}'
+
+
+def tenant_floor():
+    """Return the compaction floors of a tenant feed's two logs."""
+    return change_floor(catalogue=True), change_floor()
+
+
+def tenant_changes_since(position, limit=500, tables=None, wait=0,
+                         poll_interval=0.5):
+    """Return a tenant's entries after ``position`` from both its logs.
+
+    Entries carry ``log`` (``"catalogue"`` or ``"tenant"``) and the
+    ``position`` a consumer resumes from after applying them. The logs are
+    merged by time, each in its own sequence order.
+
+    Args:
+        position (tuple): ``(catalogue seq, tenant seq)`` last applied.
+        limit, tables, wait, poll_interval: As for :func:`changes_since`.
+
+    Returns:
+        tuple: ``(entries, position after the last entry)``.
+    """
+    logs = []
+    for catalogue, since in ((True, position[0]), (False, position[1])):
+        subset = tables
+        if tables:
+            subset = [t for t in tables
+                      if (t in CATALOGUE_TABLES) == catalogue]
+            if not subset:
+                continue
+        logs.append((catalogue, since, subset))
+    deadline = time.monotonic() + wait
+    while True:
+        parts = [
+            [dict(entry, log='catalogue' if catalogue else 'tenant')
+             for entry in changes_since(since, limit, subset,
+                                        catalogue=catalogue)]
+            for catalogue, since, subset in logs
+        ]
+        entries = list(heapq.merge(*parts, key=lambda entry: entry['at']))
+        if entries or not _wait_for_entries(deadline, poll_interval):
+            break
+    seqs = list(position)
+    for entry in entries[:limit]:
+        seqs[entry['log'] == 'tenant'] = entry['seq']
+        entry['position'] = format_position(seqs)
+    return entries[:limit], tuple(seqs)
+
+
+def _merge(entries):
+    """Collapse one row's entries (oldest first) into ``(op, data)``."""
+    op, data = None, None
+    for entry in entries:
+        values = json.loads(entry.data) if entry.data else None
+        if entry.op == 'delete':
+            op, data = 'delete', None
+        elif entry.op == 'insert' or op in (None, 'delete'):
+            op, data = entry.op, values
+        else:
+            # update after insert/update: newer values win, the op stays
+            data = {**(data or {}), **values}
+    return op, data
+
+
+def compact_changes(collapse_age=timedelta(hours=1), retain=timedelta(days=7)):
+    """Collapse and truncate old change log entries. The caller commits.
+
+    Args:
+        collapse_age (timedelta): Merge entries for the same row once they
+            are older than this (consumers keeping up have read them).
+        retain (timedelta): Drop entries older than this and raise the
+            floor; None keeps everything.
+
+    Returns:
+        dict: ``collapsed`` and ``truncated`` entry counts and the ``floor``.
+    """
+    now = datetime.now(timezone.utc)
+    table = ChangeLog.__table__
+    collapsed = truncated = 0
+
+    if collapse_age is not None:
+        cutoff = now - collapse_age
+        rows = db.session.execute(
+            select(table.c.table_name, table.c.row_key)
+            .where(table.c.created_at < cutoff)
+            .group_by(table.c.table_name, table.c.row_key)
+            .having(func.count() > 1)).all()
+        for table_name, row_key in rows:
+            entries = db.session.execute(
+                select(table).where(table.c.table_name == table_name,
+                                    table.c.row_key == row_key,
+                                    table.c.created_at < cutoff)
+                .order_by(table.c.seq)).all()
+            op, data = _merge(entries)
+            newest = entries[-1].seq
+            db.session.execute(
+                update(table).where(table.c.seq == newest)
+                .values(op=op, data=None if data is None else _dumps(data)))
+            db.session.execute(delete(table).where(
+                table.c.seq.in_([entry.seq for entry in entries[:-1]])))
+            collapsed += len(entries) - 1
+
+    floor = change_floor()
+    if retain is not None:
+        cutoff = now - retain
+        dropped = db.session.scalar(
+            select(func.max(table.c.seq)).where(table.c.created_at < cutoff))
+        if dropped:
+            truncated = db.session.execute(
+                delete(table).where(table.c.seq <= dropped)).rowcount
+            floor = max(floor, dropped)
+            versions = DataVersion.__table__
+            result = db.session.execute(
+                update(versions).where(versions.c.scope == FLOOR_SCOPE)
+                .values(version=floor))
+            if result.rowcount == 0:
+                db.session.execute(
+                    insert(versions).values(scope=FLOOR_SCOPE, version=floor))
+    return {'collapsed': collapsed, 'truncated': truncated, 'floor': floor}
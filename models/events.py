@@ -0,0 +1,150 @@
+from collections import namedtuple
+
+from sqlalchemy import event, inspect, select
+
+from .models import db, User, Movie, Genre, UserMovie
+
+# One row-level write, normalised from the ORM unit of work.
+# op is 'insert', 'update' or 'delete'; key is the primary key tuple;
+# old/new hold column values (full rows for insert/delete, changed
+# columns only for update).
+Change = namedtuple('Change', ['op', 'table', 'key', 'old', 'new'])
+
+# models whose writes are reported to change handlers
+TRACKED_MODELS = (User, Movie, Genre, UserMovie)
+
+_handlers = []
+
+
+def on_change(handler):
+    """Register ``handler(connection, changes)`` to run after every flush.
+
+    Handlers run inside the flushing transaction, so anything they write
+    commits or rolls back together with the change itself.
+    """
+    _handlers.append(handler)
+    return handler
+
+
+def publish(session, changes):
+    """Dispatch changes made outside the ORM unit of work (Core statements)."""
+    if not changes:
+        return
+    connection = session.connection()
+    for handler in _handlers:
+        handler(connection, changes)
+
+
+def _table(obj):
+    return inspect(obj).mapper.local_table.name
+
+
+def _key(obj):
+    state = inspect(obj)
+    return tuple(state.mapper.primary_key_from_instance(obj))
+
+
+def _row(obj):
+    state = inspect(obj)
+    return {attr.key: state.dict.get(attr.key)
+            for attr in state.mapper.column_attrs}
+
+
+def _genre_change(op, movie_id, genre_id):
+    row = {'movie_id': movie_id, 'genre_id': genre_id}
+    return Change(op, 'movie_genre', (movie_id, genre_id),
+                  row if op == 'delete' else None,
+                  row if op == 'insert' else None)
+
+
+def _genre_changes(movie, deleted=False):
+    hist = inspect(movie).attrs.genres.history
+    if deleted:
+        # every link that existed in the database goes with the movie
+        return [_genre_change('delete', movie.id, g.id)
+                for g in list(hist.unchanged or ()) + list(hist.deleted or ())]
+    return ([_genre_change('insert', movie.id, g.id) for g in hist.added or ()] +
+            [_genre_change('delete', movie.id, g.id) for g in hist.deleted or ()])
+
+
+def _updated(obj, preimages):
+    state = inspect(obj)
+    before = preimages.get(id(obj), {})
+    old, new = {}, {}
+    for attr in state.mapper.column_attrs:
+        hist = state.attrs[attr.key].history
+        if hist.added:
+            old[attr.key] = (hist.deleted[0] if hist.deleted
+                             else before.get(attr.key))
+            new[attr.key] = hist.added[0]
+    return old, new
+
+
+def _preimage(session, obj):
+    """Read the stored row for attributes that were set without being loaded.
+
+    Assigning to an expired attribute records no previous value, so fetch
+    those columns while the database still holds them.
+    """
+    state = inspect(obj)
+    blind = [attr for attr in state.mapper.column_attrs
+             if state.attrs[attr.key].history.added
+             and not state.attrs[attr.key].history.deleted]
+    if not blind or state.key is None:
+        return {}
+    pk = state.mapper.primary_key
+    stmt = select(*(attr.columns[0] for attr in blind)).where(
+        *(col == val for col, val in zip(pk, state.key[1])))
+    row = session.connection().execute(stmt).first()
+    if row is None:
+        return {}
+    return {attr.key: value for attr, value in zip(blind, row)}
+
+
+@event.listens_for(db.session, 'before_flush')
+def _capture_preimages(session, flush_context, instances):
+    """Load what change handlers need while the old rows still exist."""
+    if not _handlers:
+        return
+    preimages = session.info['change_preimages'] = {}
+    for obj in session.dirty:
+        if isinstance(obj, TRACKED_MODELS):
+            preimages[id(obj)] = _preimage(session, obj)
+    for obj in session.deleted:
+        if isinstance(obj, TRACKED_MODELS):
+            for attr in inspect(obj).mapper.column_attrs:
+                getattr(obj, attr.key)
+            if isinstance(obj, Movie):
+                list(obj.genres)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _dispatch_changes(session, flush_context):
+    if not _handlers:
+        return
+    preimages = session.info.pop('change_preimages', {})
+    changes = []
+    for obj in session.new:
+        if isinstance(obj, TRACKED_MODELS):
+            changes.append(
+                Change('insert', _table(obj), _key(obj), None, _row(obj)))
+            if isinstance(obj, Movie):
+                changes.extend(_genre_changes(obj))
+    for obj in session.dirty:
+        if isinstance(obj, TRACKED_MODELS):
+            old, new = _updated(obj, preimages)
+            if new:
+                changes.append(
+                    Change('update', _table(obj), _key(obj), old, new))
+            if isinstance(obj, Movie):
+                changes.extend(_genre_changes(obj))
+    for obj in session.deleted:
+        if isinstance(obj, TRACKED_MODELS):
+            if isinstance(obj, Movie):
+                changes.extend(_genre_changes(obj, deleted=True))
+            changes.append(
+                Change('delete', _table(obj), _key(obj), _row(obj), None))
+    if changes:
+        connection = session.connection()
+        for handler in _handlers:
+            handler(connection, changes)
@@ -2,8 +2,10 @@ from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime, timezone
 from sqlalchemy import UniqueConstraint
 
-# single shared db instance
-db = SQLAlchemy()
+from .routing import RoutingSession
+
+# single shared db instance; reads may be routed to a replica
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 # many-to-many join table for Movie ↔ Genre
 movie_genre = db.Table(
@@ -20,6 +22,10 @@ class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(128), nullable=False, unique=True)
     profile_pic_url = db.Column(db.String(512))
+    # Cloudinary public_id of the picture, e.g. "webflix/upvtenzei5k7g82kbv8d"
+    profile_pic_public_id = db.Column(db.String(255))
+    # JSON: avatar variant name -> transformation URL (see media.avatars)
+    avatar_urls = db.Column(db.Text)
     favorites = db.relationship(
         'UserMovie',
         back_populates='user',
@@ -40,6 +46,8 @@ class Movie(db.Model):
     plot_short = db.Column(db.Text)
     imdb_rating = db.Column(db.String(8))
     poster_url = db.Column(db.String, nullable=True)  # Added poster URL field
+    # when OMDb fields were last fetched; NULL means never since insert
+    last_refreshed_at = db.Column(db.DateTime, index=True)
     genres = db.relationship(
         'Genre', secondary=movie_genre, back_populates='movies')
     users = db.relationship(
@@ -49,6 +57,14 @@ class Movie(db.Model):
         return f"<Movie id={self.id} title='{self.title}' year={self.year}>"
 
 
+# one movie per title and year; a missing year counts as one value (-1),
+# where plain NULLs would all be distinct. The -1 is inlined, not bound:
+# an ON CONFLICT target must repeat the index expression word for word.
+MOVIE_TITLE_YEAR = (
+    Movie.title, db.func.coalesce(Movie.year, db.literal_column('-1')))
+db.Index('uq_movies_title_year', *MOVIE_TITLE_YEAR, unique=True)
+
+
 class Genre(db.Model):
     __tablename__ = 'genres'
     id = db.Column(db.Integer, primary_key=True)
@@ -0,0 +1,254 @@
+"""Read-replica routing for ``db.session``.
+
+With ``SQLALCHEMY_REPLICA_URI`` set, the default bind gets a ``replica``
+companion. :class:`RoutingSession` sends reads made while handling a GET or
+HEAD request to the replica and everything else to the primary:
+
+* flushes and INSERT/UPDATE/DELETE statements (the upserts and bulk
+  updates bypass the flush), and every statement after either in the
+  same session;
+* non-GET requests and code outside a request (CLI commands, jobs);
+* read-your-writes: for ``DB_STICKY_SECONDS`` after a request of this
+  browser session wrote, its reads stay on the primary;
+* a replica that lags by more than ``DB_REPLICA_MAX_LAG`` seconds or
+  failed recently.
+
+Lag is measured with ``pg_last_xact_replay_timestamp()`` on PostgreSQL.
+Elsewhere (e.g. two SQLite files kept in sync by ``flask sync-replica``)
+the replica counts as lagging from the moment its ``data_versions``
+counters are first seen behind the primary's.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from flask import current_app, g, has_app_context, has_request_context, request
+from flask import session as http_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+from sqlalchemy.exc import DBAPIError
+
+from .tenants import current_tenant, get_tenants
+
+log = logging.getLogger(__name__)
+
+REPLICA_BIND = 'replica'
+STICKY_KEY = 'db_primary_until'
+
+PG_LAG = text(
+    'SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+    'ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END'
+)
+VERSION_SUM = text('SELECT coalesce(sum(version), 0) FROM data_versions')
+
+
+class ReplicaRouter:
+    """Tracks whether the replica is fit to serve reads.
+
+    The replica is re-checked at most every ``check_interval`` seconds per
+    process; a failed statement on it takes it out of rotation until the
+    next check.
+
+    Args:
+        primary (Engine): Engine of the default bind.
+        replica (Engine): Engine of the replica.
+        max_lag (float): Largest acceptable replication lag in seconds.
+        check_interval (float): Seconds between lag checks.
+    """
+
+    def __init__(self, primary, replica, max_lag=5.0, check_interval=1.0):
+        self.primary = primary
+        self.replica = replica
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.lag = None
+        self.error = None
+        self._healthy = False
+        self._checked_at = None
+        self._behind_since = None
+        self._lock = threading.Lock()
+        event.listen(replica, 'handle_error', self._on_error)
+
+    def available(self):
+        """Return True if reads may go to the replica right now."""
+        now = time.monotonic()
+        if self._checked_at is None or now - self._checked_at >= self.check_interval:
+            with self._lock:
+                if self._checked_at is None or now - self._checked_at >= self.check_interval:
+                    self.check()
+        return self._healthy
+
+    def check(self):
+        """Measure replication lag and update the replica's health."""
+        try:
+            self.lag = self._measure_lag()
+            self.error = None
+        except DBAPIError as e:
+            self.lag, self.error = None, str(e.orig)
+        self._healthy = self.lag is not None and self.lag <= self.max_lag
+        self._checked_at = time.monotonic()
+        if not self._healthy:
+            log.warning(
+                'Read replica unavailable (lag=%s, error=%s); reading from primary',
+                self.lag,
+                self.error,
+            )
+        return self._healthy
+
+    def _measure_lag(self):
+        if self.replica.dialect.name == 'postgresql':
+            with self.replica.connect() as conn:
+                return float(conn.execute(PG_LAG).scalar() or 0)
+        with self.primary.connect() as conn:
+            primary_version = conn.execute(VERSION_SUM).scalar()
+        with self.replica.connect() as conn:
+            replica_version = conn.execute(VERSION_SUM).scalar()
+        now = time.monotonic()
+        if replica_version >= primary_version:
+            self._behind_since = None
+            return 0.0
+        if self._behind_since is None:
+            self._behind_since = now
+        return now - self._behind_since
+
+    def _on_error(self, context):
+        # connection trouble or a missing table: stop using the replica
+        # until the next successful check
+        self._healthy = False
+        self._checked_at = time.monotonic()
+        self.error = str(context.original_exception)
+
+    def status(self):
+        """Return the router's current view of the replica."""
+        return {
+            'replica': self.replica.url.render_as_string(hide_password=True),
+            'healthy': self._healthy,
+            'lag_seconds': None if self.lag is None else round(self.lag, 3),
+            'max_lag_seconds': self.max_lag,
+            'error': self.error,
+        }
+
+
+_router_lock = threading.Lock()
+
+
+def get_router():
+    """Return the current app's :class:`ReplicaRouter`, or None.
+
+    Created on first use, once the app's engines exist.
+    """
+    app = current_app._get_current_object()
+    if not app.config.get('SQLALCHEMY_REPLICA_URI'):
+        return None
+    router = app.extensions.get('db_router')
+    if router is None:
+        with _router_lock:
+            router = app.extensions.get('db_router')
+            if router is None:
+                engines = app.extensions['sqlalchemy'].engines
+                router = app.extensions['db_router'] = ReplicaRouter(
+                    engines[None],
+                    engines[REPLICA_BIND],
+                    max_lag=app.config['DB_REPLICA_MAX_LAG'],
+                    check_interval=app.config['DB_REPLICA_CHECK_INTERVAL'],
+                )
+    return router
+
+
+def use_primary():
+    """Pin the rest of this request's reads to the primary."""
+    g.db_use_primary = True
+
+
+def _reads_may_use_replica():
+    if not has_request_context() or request.method not in ('GET', 'HEAD'):
+        return False
+    if g.get('db_use_primary'):
+        return False
+    sticky_until = http_session.get(STICKY_KEY)
+    return not (sticky_until and sticky_until > time.time())
+
+
+class RoutingSession(Session):
+    """``db.session`` class that sends eligible reads to the read replica.
+
+    With tenant sharding, everything in a tenant's context goes to that
+    tenant's database instead (see :mod:`models.tenants`).
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        tenant = current_tenant() if bind is None else None
+        if tenant is not None:
+            # everything, the catalogue included, through the tenant's file
+            return get_tenants().engine(tenant)
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if (
+            bind is not None
+            or self._flushing
+            or self.info.get('wrote')
+            or not has_app_context()
+        ):
+            return engine
+        if engine is not self._db.engines.get(None) or not _reads_may_use_replica():
+            return engine
+        router = get_router()
+        if router is None or not router.available():
+            return engine
+        return router.replica
+
+
+def _mark_written(session):
+    session.info['wrote'] = True
+    if has_request_context():
+        g.db_wrote = True
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _mark_flush_written(session, flush_context):
+    _mark_written(session)
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _mark_dml_written(orm_execute_state):
+    # runs before the statement picks its bind, so the write itself goes
+    # to the primary too
+    if (orm_execute_state.is_insert or orm_execute_state.is_update
+            or orm_execute_state.is_delete):
+        _mark_written(orm_execute_state.session)
+
+
+def sync_sqlite_replica(primary_path, replica_path):
+    """Copy a SQLite primary onto its replica file with the backup API.
+
+    Stands in for real replication when testing locally with two files.
+    """
+    source = sqlite3.connect(primary_path)
+    target = sqlite3.connect(replica_path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+
+def init_app(app):
+    """Configure the replica bind; call before ``db.init_app(app)``."""
+    app.config.setdefault(
+        'SQLALCHEMY_REPLICA_URI', os.environ.get('SQLALCHEMY_REPLICA_URI'))
+    app.config.setdefault('DB_STICKY_SECONDS', 5.0)
+    app.config.setdefault('DB_REPLICA_MAX_LAG', 5.0)
+    app.config.setdefault('DB_REPLICA_CHECK_INTERVAL', 1.0)
+    if not app.config['SQLALCHEMY_REPLICA_URI']:
+        return
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    binds[REPLICA_BIND] = app.config['SQLALCHEMY_REPLICA_URI']
+    app.config['SQLALCHEMY_BINDS'] = binds
+
+    @app.after_request
+    def stick_to_primary_after_write(response):
+        if g.get('db_wrote'):
+            http_session[STICKY_KEY] = time.time() + app.config['DB_STICKY_SECONDS']
+        return response
+
@@ -0,0 +1,89 @@
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import IntegrityError
+
+from .models import db
+
+# indexes of earlier versions that the models' indexes replace
+RETIRED_INDEXES = {
+    # by uq_movies_title_year: it skipped OMDb imports and NULL years
+    "movies": ("uq_movies_manual_title_year",),
+}
+
+
+def upgrade_schema(engine=None, tables=None):
+    """Bring an existing database up to the current models.
+
+    Creates missing tables, adds missing nullable columns, creates missing
+    indexes and drops the retired ones they replace. This covers the
+    additive changes the app makes; it never drops or alters existing
+    columns.
+
+    Args:
+        engine (Engine): Database to upgrade (default: the main database).
+        tables (tuple): Only these table names (e.g. a tenant's tables).
+
+    Returns:
+        list[str]: Descriptions of the changes that were applied.
+    """
+    engine = engine or db.engine
+    inspector = inspect(engine)
+    existing = set(inspector.get_table_names())
+    applied = []
+    sorted_tables = [t for t in db.metadata.sorted_tables
+                     if tables is None or t.name in tables]
+
+    missing_tables = [t for t in sorted_tables if t.name not in existing]
+    if missing_tables:
+        db.metadata.create_all(engine, tables=missing_tables)
+        applied.extend(f"created table {t.name}" for t in missing_tables)
+
+    preparer = engine.dialect.identifier_preparer
+    with engine.begin() as conn:
+        for table in sorted_tables:
+            if table.name not in existing:
+                continue
+            columns = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in columns:
+                    continue
+                if not column.nullable:
+                    raise RuntimeError(
+                        f"Cannot add NOT NULL column {table.name}.{column.name} "
+                        "automatically; migrate it by hand."
+                    )
+                col_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(
+                    f"ALTER TABLE {preparer.quote(table.name)} "
+                    f"ADD COLUMN {preparer.quote(column.name)} {col_type}"
+                ))
+                applied.append(f"added column {table.name}.{column.name}")
+            indexes = _index_names(conn, inspector, table.name)
+            for name in RETIRED_INDEXES.get(table.name, ()):
+                if name in indexes:
+                    conn.execute(text(f"DROP INDEX {preparer.quote(name)}"))
+                    applied.append(f"dropped index {name}")
+            for index in table.indexes:
+                if index.name not in indexes:
+                    try:
+                        with conn.begin_nested():
+                            index.create(conn)
+                    except IntegrityError as e:
+                        raise RuntimeError(
+                            f"Cannot create unique index {index.name}: "
+                            "existing rows violate it; deduplicate them by hand."
+                        ) from e
+                    applied.append(f"created index {index.name}")
+    return applied
+
+
+def _index_names(conn, inspector, table_name):
+    """Return the names of the indexes on a table, expression indexes included.
+
+    SQLAlchemy skips expression indexes when reflecting SQLite databases, so
+    they are read from ``PRAGMA index_list`` there.
+    """
+    if conn.dialect.name == "sqlite":
+        quoted = conn.dialect.identifier_preparer.quote(table_name)
+        rows = conn.exec_driver_sql(f"PRAGMA index_list({quoted})")
+        return {row[1] for row in rows}
+    return {i["name"] for i in inspector.get_indexes(table_name)}
@@ -0,0 +1,54 @@
+from .models import db
+
+# Rollup tables maintained incrementally by stats.rollups. They hold no
+# foreign keys on purpose: rows are adjusted from inside the flush that
+# changes the base tables and can always be rebuilt from scratch.
+
+
+class GlobalStats(db.Model):
+    __tablename__ = 'stats_global'
+    id = db.Column(db.Integer, primary_key=True)  # single row, id=1
+    user_count = db.Column(db.Integer, nullable=False, default=0)
+    movie_count = db.Column(db.Integer, nullable=False, default=0)
+    rated_movie_count = db.Column(db.Integer, nullable=False, default=0)
+    rating_sum = db.Column(db.Float, nullable=False, default=0.0)
+    list_count = db.Column(db.Integer, nullable=False, default=0)
+    watched_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return (f"<GlobalStats users={self.user_count} "
+                f"movies={self.movie_count} lists={self.list_count}>")
+
+
+class UserStats(db.Model):
+    __tablename__ = 'stats_users'
+    user_id = db.Column(db.Integer, primary_key=True)
+    movie_count = db.Column(db.Integer, nullable=False, default=0)
+    watched_count = db.Column(db.Integer, nullable=False, default=0)
+    rated_count = db.Column(db.Integer, nullable=False, default=0)
+    rating_sum = db.Column(db.Float, nullable=False, default=0.0)
+
+    def __repr__(self):
+        return (f"<UserStats user_id={self.user_id} "
+                f"movies={self.movie_count} watched={self.watched_count}>")
+
+
+class GenreStats(db.Model):
+    __tablename__ = 'stats_genres'
+    genre_id = db.Column(db.Integer, primary_key=True)
+    movie_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return (f"<GenreStats genre_id={self.genre_id} "
+                f"movies={self.movie_count}>")
+
+
+class WeeklyAdditions(db.Model):
+    __tablename__ = 'stats_weekly_additions'
+    user_id = db.Column(db.Integer, primary_key=True)
+    week_start = db.Column(db.Date, primary_key=True)  # Monday of the week
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return (f"<WeeklyAdditions user_id={self.user_id} "
+                f"week={self.week_start} count={self.count}>")
@@ -0,0 +1,351 @@
+"""Tenant sharding: each community's users and lists in its own SQLite file.
+
+With ``TENANT_SHARDING`` enabled, every request belongs to a tenant, named
+by the ``TENANT_HEADER`` request header (default ``X-Tenant``) or by the
+host's first label under ``TENANT_DOMAIN`` (``film-club.webflix.example``),
+else ``TENANT_DEFAULT``. The tenant's users, lists, statistics, data
+versions and change log live in ``TENANT_DIR/<tenant>.db``; the movie and
+genre catalogue stays in the main database (``SQLALCHEMY_DATABASE_URI``),
+shared by all tenants. Each tenant has its own writer lock, so adding and
+ticking off movies in one community never waits for another.
+
+Tenant engines attach the catalogue database as ``catalogue``. SQLite
+resolves an unqualified table name in the tenant file first and in the
+catalogue after it, so the models, joins between lists and movies, and the
+change handlers work unchanged, in one transaction. Only the bookkeeping
+for catalogue writes (the ``catalogue`` data version and the catalogue's
+change log entries) is addressed to the catalogue explicitly, through
+:func:`catalogue_table`, so every tenant and the in-memory catalogue
+indexes see it.
+
+The statistics rollups of users and lists are kept per tenant; the
+catalogue-wide figures (movie, rating and genre counts) are kept in the
+catalogue database and addressed there too. ``flask rebuild-stats`` with
+``WEBFLIX_TENANT`` set rebuilds one tenant's rollups, without it the
+catalogue's.
+"""
+import csv
+import os
+import re
+import threading
+import weakref
+from contextlib import contextmanager
+
+from flask import abort, current_app, g, has_app_context
+from flask import request, session as http_session
+from sqlalchemy import MetaData, create_engine, delete, event, insert, select
+
+CATALOGUE_SCHEMA = 'catalogue'
+# tables stored in each tenant's file
+TENANT_TABLES = (
+    'users', 'user_movies', 'stats_global', 'stats_users', 'stats_genres',
+    'stats_weekly_additions', 'data_versions', 'change_log',
+)
+TENANT_KEY = re.compile(r'^[a-z0-9][a-z0-9_-]{0,62}$')
+CHUNK = 500
+
+# tenant engine -> the catalogue engine it attaches
+_catalogue_of = weakref.WeakKeyDictionary()
+# (table name) -> copy of the table addressed to the catalogue schema
+_catalogue_tables = {}
+_UNSET = object()
+
+
+def _db():
+    # models.models imports this module (through routing) before ``db`` exists
+    return current_app.extensions['sqlalchemy']
+
+
+class UnknownTenant(LookupError):
+    """No tenant database exists under this key."""
+
+
+def catalogue_engine(engine):
+    """Return the engine holding the catalogue ``engine`` reads from."""
+    return _catalogue_of.get(engine, engine)
+
+
+def is_tenant_connection(connection):
+    """Return True if ``connection`` is to a tenant database."""
+    return connection.engine in _catalogue_of
+
+
+def catalogue_table(table, connection=None):
+    """Return ``table`` as it must be addressed for catalogue bookkeeping.
+
+    On tenant connections (or, without one, in a tenant context) that is a
+    copy qualified with the ``catalogue`` schema; elsewhere ``table`` itself.
+    """
+    tenant = (is_tenant_connection(connection) if connection is not None
+              else current_tenant() is not None)
+    if not tenant:
+        return table
+    copy = _catalogue_tables.get(table.name)
+    if copy is None:
+        copy = _catalogue_tables.setdefault(
+            table.name, table.to_metadata(MetaData(), schema=CATALOGUE_SCHEMA))
+    return copy
+
+
+class TenantRegistry:
+    """Opens tenant databases and creates new ones.
+
+    Args:
+        directory (str): Directory of the ``<tenant>.db`` files.
+        catalogue (Engine): Engine of the shared catalogue database.
+    """
+
+    def __init__(self, directory, catalogue):
+        if catalogue.dialect.name != 'sqlite':
+            raise RuntimeError('Tenant sharding needs a SQLite catalogue database.')
+        self.directory = directory
+        self.catalogue = catalogue
+        self._engines = {}
+        self._lock = threading.Lock()
+
+    def path(self, key):
+        if not TENANT_KEY.match(key or ''):
+            raise UnknownTenant(f'Invalid tenant key {key!r}')
+        return os.path.join(self.directory, f'{key}.db')
+
+    def keys(self):
+        """Return the keys of all tenant databases."""
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name[:-3] for name in os.listdir(self.directory)
+                      if name.endswith('.db') and TENANT_KEY.match(name[:-3]))
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def create(self, key):
+        """Create a tenant database with the tenant tables, if missing.
+
+        Returns:
+            bool: True if it was created.
+        """
+        path = self.path(key)
+        if os.path.exists(path):
+            return False
+        os.makedirs(self.directory, exist_ok=True)
+        self._upgrade(path)
+        return True
+
+    def _upgrade(self, path):
+        from .schema import upgrade_schema
+
+        # without the catalogue attached: DDL must never reach it
+        engine = create_engine(f'sqlite:///{path}')
+        try:
+            upgrade_schema(engine, tables=TENANT_TABLES)
+        finally:
+            engine.dispose()
+
+    def engine(self, key):
+        """Return the engine of an existing tenant database.
+
+        Raises:
+            UnknownTenant: If there is no database for ``key``.
+        """
+        engine = self._engines.get(key)
+        if engine is not None:
+            return engine
+        with self._lock:
+            engine = self._engines.get(key)
+            if engine is None:
+                path = self.path(key)
+                if not os.path.exists(path):
+                    raise UnknownTenant(f'No tenant database for {key!r}')
+                # bring tenant files created by older versions up to date
+                self._upgrade(path)
+                engine = create_engine(f'sqlite:///{path}')
+                event.listen(engine, 'connect', self._attach())
+                _catalogue_of[engine] = self.catalogue
+                self._engines[key] = engine
+        return engine
+
+    def _attach(self):
+        catalogue_path = self.catalogue.url.database
+
+        def attach(dbapi_connection, connection_record):
+            dbapi_connection.execute(
+                f'ATTACH DATABASE ? AS {CATALOGUE_SCHEMA}', (catalogue_path,))
+
+        return attach
+
+    def dispose(self, close=True):
+        """Drop the tenant engines; ``close=False`` in a forked child."""
+        with self._lock:
+            for engine in self._engines.values():
+                engine.dispose(close=close)
+            self._engines.clear()
+
+
+def get_tenants():
+    """Return the current app's :class:`TenantRegistry`, or None if disabled."""
+    app = current_app._get_current_object()
+    if not app.config.get('TENANT_SHARDING'):
+        return None
+    registry = app.extensions.get('tenants')
+    if registry is None:
+        registry = app.extensions.setdefault('tenants', TenantRegistry(
+            app.config['TENANT_DIR'], _db().engines[None]))
+    return registry
+
+
+def current_tenant():
+    """Return the key of the tenant being served, or None for the catalogue."""
+    if not has_app_context() or not current_app.config.get('TENANT_SHARDING'):
+        return None
+    tenant = g.get('tenant', _UNSET)
+    if tenant is _UNSET:
+        # commands and background work: WEBFLIX_TENANT / TENANT_DEFAULT
+        return current_app.config['TENANT_DEFAULT']
+    return tenant
+
+
+@contextmanager
+def use_tenant(key):
+    """Run the block against tenant ``key`` (None: the catalogue database).
+
+    ``db.session`` is closed on entry and exit: its objects belong to the
+    database they were loaded from.
+    """
+    previous = g.get('tenant', _UNSET)
+    session = _db().session
+    session.close()
+    g.tenant = key
+    try:
+        yield
+    finally:
+        session.close()
+        if previous is _UNSET:
+            g.pop('tenant', None)
+        else:
+            g.tenant = previous
+
+
+def resolve_tenant():
+    """Return the tenant key named by the current request, or the default."""
+    config = current_app.config
+    key = None
+    if config['TENANT_HEADER']:
+        key = request.headers.get(config['TENANT_HEADER'])
+    if not key and config['TENANT_DOMAIN']:
+        host = request.host.partition(':')[0].lower()
+        suffix = '.' + config['TENANT_DOMAIN'].lower()
+        if host.endswith(suffix):
+            key = host[:-len(suffix)]
+    return (key or config['TENANT_DEFAULT'] or '').strip().lower() or None
+
+
+def split_tenants(assignments, default=None, keep=False):
+    """Move users and their lists from the main database into tenant files.
+
+    User ids are kept, so links and avatar URLs stay valid. The tenants'
+    change logs start empty; their rollups must be rebuilt afterwards, and
+    so must the main database's unless ``keep`` is set.
+
+    Args:
+        assignments (dict): User id -> tenant key.
+        default (str): Tenant of users not in ``assignments``; None leaves
+            them in the main database.
+        keep (bool): Copy only; leave the rows in the main database.
+
+    Returns:
+        dict: Tenant key -> number of users moved there.
+    """
+    from .models import User, UserMovie
+    from .versions import DataVersion
+
+    registry = get_tenants()
+    users_table, lists_table = User.__table__, UserMovie.__table__
+    versions_table = DataVersion.__table__
+    with registry.catalogue.connect() as conn:
+        user_ids = conn.scalars(select(users_table.c.id)).all()
+    plan = {}
+    for user_id in user_ids:
+        tenant = assignments.get(user_id, default)
+        if tenant is not None:
+            plan.setdefault(tenant, []).append(user_id)
+
+    moved = {}
+    for tenant, ids in sorted(plan.items()):
+        registry.create(tenant)
+        with registry.catalogue.connect() as source, \
+                registry.engine(tenant).begin() as target:
+            for start in range(0, len(ids), CHUNK):
+                chunk = ids[start:start + CHUNK]
+                scopes = [f'user:{user_id}' for user_id in chunk]
+                for table, where in (
+                        (users_table, users_table.c.id.in_(chunk)),
+                        (lists_table, lists_table.c.user_id.in_(chunk)),
+                        (versions_table, versions_table.c.scope.in_(scopes))):
+                    rows = [dict(row) for row in
+                            source.execute(select(table).where(where)).mappings()]
+                    if rows:
+                        target.execute(insert(table), rows)
+        moved[tenant] = len(ids)
+
+    if not keep:
+        with registry.catalogue.begin() as conn:
+            for ids in plan.values():
+                for start in range(0, len(ids), CHUNK):
+                    chunk = ids[start:start + CHUNK]
+                    conn.execute(delete(lists_table).where(
+                        lists_table.c.user_id.in_(chunk)))
+                    conn.execute(delete(users_table).where(
+                        users_table.c.id.in_(chunk)))
+    return moved
+
+
+def read_assignments(path):
+    """Read ``user,tenant`` rows (user id or name) from a CSV file."""
+    from .models import User
+
+    with open(path, newline='', encoding='utf-8') as f:
+        rows = [row for row in csv.reader(f) if row and not row[0].startswith('#')]
+    with use_tenant(None):
+        by_name = dict(_db().session.execute(select(User.name, User.id)).all())
+    assignments = {}
+    for user, tenant in ((r[0].strip(), r[1].strip().lower()) for r in rows):
+        user_id = int(user) if user.isdigit() else by_name.get(user)
+        if user_id is None:
+            raise ValueError(f'Unknown user {user!r} in {path}')
+        if not TENANT_KEY.match(tenant):
+            raise ValueError(f'Invalid tenant key {tenant!r} in {path}')
+        assignments[user_id] = tenant
+    return assignments
+
+
+def init_app(app):
+    """Configure tenant sharding; call after ``db.init_app(app)``."""
+    app.config.setdefault(
+        'TENANT_SHARDING', os.environ.get('WEBFLIX_TENANTS') == '1')
+    app.config.setdefault(
+        'TENANT_DIR', os.path.join(app.root_path, 'data', 'tenants'))
+    app.config.setdefault('TENANT_HEADER', 'X-Tenant')
+    app.config.setdefault('TENANT_DOMAIN', None)
+    app.config.setdefault('TENANT_DEFAULT', os.environ.get('WEBFLIX_TENANT'))
+    if not app.config['TENANT_SHARDING']:
+        return
+    if app.config.get('SQLALCHEMY_REPLICA_URI'):
+        raise RuntimeError('Tenant sharding and a read replica cannot be combined.')
+
+    @app.before_request
+    def select_tenant():
+        if request.endpoint == 'static':
+            return None
+        key = resolve_tenant()
+        registry = get_tenants()
+        try:
+            if key is None or not registry.exists(key):
+                raise UnknownTenant(key)
+        except UnknownTenant:
+            abort(404, description='Unknown community.')
+        g.tenant = key
+        # user ids are per tenant: a session from another one is signed out
+        if http_session.get('tenant') != key:
+            http_session.pop('user_id', None)
+            http_session['tenant'] = key
+        return None
@@ -0,0 +1,105 @@
+"""Race-free get-or-create in as few round trips as the dialect allows.
+
+On SQLite >= 3.35 and PostgreSQL, :func:`get_or_create` is a single
+``INSERT ... ON CONFLICT DO NOTHING RETURNING`` that also loads the new
+instance; only when the row already exists does a SELECT follow. Other
+databases get a plain INSERT inside a savepoint and a SELECT on conflict.
+Either way two concurrent callers can neither both insert nor fail on the
+unique constraint.
+
+SQLAlchemy cannot cache the compiled form of ``ON CONFLICT`` inserts, so
+each statement is built once per model, key and column set and executed
+with bound parameters; rebuilding it on every call doubled its cost.
+
+Rows inserted by the fast path bypass the ORM flush, so their insert
+:class:`Change` is published here. That is also why there is no
+``ON CONFLICT DO UPDATE`` helper: neither SQLite nor the portable fallback
+can tell from it whether the row was inserted or updated, and the change
+handlers need to know.
+"""
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import object_mapper
+
+from .models import db
+from .events import Change, publish
+
+DIALECT_INSERTS = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}
+
+# (dialect, model, conflict target, columns) -> insert statement
+_statements = {}
+
+
+def supports_upsert_returning(dialect):
+    """Return True if ``dialect`` has ``INSERT ... ON CONFLICT ... RETURNING``."""
+    if dialect.name == 'postgresql':
+        return True
+    if dialect.name == 'sqlite':
+        return dialect.dbapi.sqlite_version_info >= (3, 35)
+    return False
+
+
+def _publish_insert(session, instance):
+    mapper = object_mapper(instance)
+    row = {attr.key: getattr(instance, attr.key) for attr in mapper.column_attrs}
+    key = tuple(mapper.primary_key_from_instance(instance))
+    publish(session, [
+        Change('insert', mapper.local_table.name, key, None, row)
+    ])
+
+
+def _insert_statement(dialect, model, target, columns):
+    key = (dialect.name, model, tuple(str(element) for element in target),
+           columns)
+    stmt = _statements.get(key)
+    if stmt is None:
+        stmt = _statements[key] = (
+            DIALECT_INSERTS[dialect.name](model)
+            .on_conflict_do_nothing(index_elements=list(target))
+            .returning(model)
+        )
+    return stmt
+
+
+def get_or_create(model, conflict, values, index_elements=None, session=None):
+    """Insert a row unless one with the same unique key exists.
+
+    The caller commits.
+
+    Args:
+        model: Mapped class to insert into.
+        conflict (tuple): Column names of the unique constraint or index
+            that identifies the row; all must be present in ``values``.
+        values (dict): Column values for a new row.
+        index_elements (tuple): Columns and expressions of the unique
+            index, if it is an expression index over the ``conflict``
+            columns, e.g. ``(Movie.title, func.coalesce(Movie.year, -1))``.
+        session: Session to use (default ``db.session``).
+
+    Returns:
+        tuple: ``(instance, created)``.
+    """
+    session = session or db.session
+    # filter_by turns None into IS NULL
+    lookup = select(model).filter_by(**{name: values[name] for name in conflict})
+    dialect = session.get_bind(mapper=model).dialect
+
+    if supports_upsert_returning(dialect):
+        stmt = _insert_statement(
+            dialect, model, tuple(index_elements or conflict),
+            tuple(sorted(values)))
+        instance = session.scalars(stmt, [values]).first()
+        if instance is not None:
+            _publish_insert(session, instance)
+            return instance, True
+        return session.scalars(lookup).one(), False
+
+    instance = model(**values)
+    try:
+        # the flush inside the savepoint publishes the insert as usual
+        with session.begin_nested():
+            session.add(instance)
+        return instance, True
+    except IntegrityError:
+        return session.scalars(lookup).one(), False
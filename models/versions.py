@@ -0,0 +1,64 @@
+from sqlalchemy import insert, select, update
+
+from .models import db
+from .events import on_change
+from .tenants import catalogue_table
+
+
+class DataVersion(db.Model):
+    """Monotonic counter per data scope, bumped on every write to it.
+
+    Scopes: 'catalogue' (movies, genres and their links), 'users' (user
+    records) and 'user:<id>' (one user's list). Cheap to read, so it can
+    validate cached responses without touching the data itself.
+    """
+    __tablename__ = 'data_versions'
+    scope = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<DataVersion scope='{self.scope}' version={self.version}>"
+
+
+def scopes_for(change):
+    """Return the version scopes touched by a single change."""
+    if change.table in ('movies', 'movie_genre', 'genres'):
+        return {'catalogue'}
+    if change.table == 'users':
+        return {'users', f'user:{change.key[0]}'}
+    if change.table == 'user_movies':
+        return {f'user:{change.key[0]}'}
+    return set()
+
+
+@on_change
+def bump_versions(connection, changes):
+    """Increment the version of every scope a flush wrote to."""
+    scopes = set()
+    for change in changes:
+        scopes |= scopes_for(change)
+    for scope in sorted(scopes):
+        table = DataVersion.__table__
+        if scope == 'catalogue':
+            # shared by all tenants: kept in the catalogue database
+            table = catalogue_table(table, connection)
+        result = connection.execute(
+            update(table).where(table.c.scope == scope)
+            .values(version=table.c.version + 1))
+        if result.rowcount == 0:
+            connection.execute(insert(table).values(scope=scope, version=1))
+
+
+def data_versions(scopes):
+    """Return ``{scope: version}`` for ``scopes`` (0 if never written)."""
+    scopes = list(scopes)
+    found = {}
+    for table, names in (
+            (DataVersion.__table__, [s for s in scopes if s != 'catalogue']),
+            (catalogue_table(DataVersion.__table__),
+             [s for s in scopes if s == 'catalogue'])):
+        if names:
+            found.update(db.session.execute(
+                select(table.c.scope, table.c.version)
+                .where(table.c.scope.in_(names))).all())
+    return {scope: found.get(scope, 0) for scope in scopes}
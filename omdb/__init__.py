@@ -0,0 +1,29 @@
+from .backends import (
+    FixtureBackend,
+    HTTPBackend,
+    RecordingBackend,
+    detail_response,
+    write_fixture,
+)
+from .client import (
+    OMDbClient,
+    get_client,
+    get_prefetcher,
+    init_app,
+)
+from .errors import (
+    OMDbError,
+    OMDbUnavailable,
+    QuotaExhausted,
+    RateLimited,
+)
+from .ingest import (
+    local_search,
+    movie_fields,
+    parse_year,
+    upsert_movie,
+)
+from .prefetch import Prefetcher
+from .ratelimit import RateLimiter
+from .refresh import refresh_catalogue
+from .standin import make_server as make_standin_server
@@ -0,0 +1,273 @@
+"""Where OMDb lookups go: the real API, recorded fixtures, or both.
+
+:class:`~omdb.OMDbClient` sends every lookup that misses its cache to a
+backend's ``fetch(params)``, chosen by ``OMDB_BACKEND``
+(``WEBFLIX_OMDB_BACKEND``):
+
+* ``http`` (default): :class:`HTTPBackend`, the API at ``OMDB_URL``. Point
+  ``OMDB_URL`` at ``flask omdb-standin`` to go over HTTP to a local server.
+* ``fixtures``: :class:`FixtureBackend`, recorded responses from
+  ``OMDB_FIXTURES_DIR``, in process and without network access.
+* ``record``: :class:`RecordingBackend`, the real API, saving every answer
+  to ``OMDB_FIXTURES_DIR`` for replay with ``fixtures``.
+
+A fixture is a JSON file ``{"request": {...}, "response": {...}}``; the API
+key is never recorded. ``flask export-omdb-fixtures`` writes detail
+fixtures for the movies already in the catalogue. Searches without a
+recorded fixture are answered from the titles of the detail fixtures, as
+OMDb would, ten at most.
+
+The fixture backend can inject latency (``OMDB_LATENCY`` plus up to
+``OMDB_LATENCY_JITTER`` seconds) and errors (``OMDB_ERROR_RATE``, the share
+of lookups failing as if OMDb answered ``OMDB_ERROR_STATUS``), to see how
+the app behaves with a fast, a slow or a flaky OMDb.
+"""
+import copy
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+
+from .errors import OMDbUnavailable, QuotaExhausted
+from .singleflight import digest
+
+OMDB_URL = "http://www.omdbapi.com/"
+NOT_FOUND = {"Response": "False", "Error": "Movie not found!"}
+# OMDb returns search results in pages of ten
+SEARCH_PAGE = 10
+
+
+def fixture_key(params):
+    """Return the key of a lookup: ``s:<title>`` or ``i:<imdb id>``."""
+    if params.get("i"):
+        return f"i:{params['i'].strip().lower()}"
+    return f"s:{' '.join((params.get('s') or '').lower().split())}"
+
+
+def _fixture_name(key):
+    kind, _, value = key.partition(":")
+    slug = re.sub(r"[^a-z0-9]+", "-", value).strip("-")[:60]
+    # search slugs can collide ("se7en", "se 7en"); IMDb IDs cannot
+    suffix = f"-{digest(key)[:8]}" if kind == "s" else ""
+    return f"{kind}-{slug}{suffix}.json"
+
+
+def write_fixture(directory, params, response):
+    """Save ``response`` as the fixture for ``params`` (without the API key)."""
+    request = {k: v for k, v in params.items() if k != "apikey"}
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
+            json.dump({"request": request, "response": response}, fh, indent=1)
+        os.replace(tmp, os.path.join(directory, _fixture_name(fixture_key(request))))
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+class HTTPBackend:
+    """The OMDb HTTP API (or anything answering like it).
+
+    Args:
+        url (str): API endpoint.
+        timeout (float): HTTP timeout in seconds.
+    """
+
+    def __init__(self, url=OMDB_URL, timeout=10):
+        self.url = url
+        self.timeout = timeout
+
+    def fetch(self, params):
+        """Return OMDb's JSON answer to ``params`` (including ``apikey``).
+
+        Raises:
+            QuotaExhausted: If OMDb reports the key's daily limit reached.
+            OMDbUnavailable: On connection problems or HTTP errors.
+        """
+        # imported on first use: most processes never talk to OMDb
+        import requests
+
+        try:
+            response = requests.get(self.url, params=params, timeout=self.timeout)
+            if response.status_code == 401 and "limit" in response.text.lower():
+                # OMDb's own "Request limit reached!" answer
+                raise QuotaExhausted("OMDb daily request limit reached.")
+            response.raise_for_status()
+            return response.json()
+        except requests.exceptions.RequestException as e:
+            raise OMDbUnavailable(str(e)) from e
+
+
+class FixtureBackend:
+    """Recorded OMDb responses, with optional latency and error injection.
+
+    Args:
+        directory (str): Directory of fixture files, read once.
+        latency (float): Seconds every lookup takes at least.
+        jitter (float): Up to this many seconds more, uniformly random.
+        error_rate (float): Share of lookups that fail (0 to 1).
+        error_status (int): HTTP status the injected failures stand for.
+        seed (int): Seed of the random source, for repeatable runs.
+    """
+
+    def __init__(
+        self,
+        directory,
+        latency=0.0,
+        jitter=0.0,
+        error_rate=0.0,
+        error_status=503,
+        seed=None,
+    ):
+        self.directory = directory
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.lookups = self.errors = self.misses = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._responses = self._load()
+
+    def _load(self):
+        responses = {}
+        if not os.path.isdir(self.directory):
+            return responses
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), encoding="utf-8") as fh:
+                    fixture = json.load(fh)
+                responses[fixture_key(fixture["request"])] = fixture["response"]
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Warning: Skipping OMDb fixture {name}: {e}")
+        return responses
+
+    def __len__(self):
+        return len(self._responses)
+
+    def _search(self, query):
+        """Answer a search nobody recorded from the detail fixtures."""
+        found = [
+            {
+                "Title": data["Title"],
+                "Year": data.get("Year", "N/A"),
+                "imdbID": data["imdbID"],
+                "Type": data.get("Type", "movie"),
+                "Poster": data.get("Poster", "N/A"),
+            }
+            for key, data in self._responses.items()
+            if key.startswith("i:")
+            and data.get("Response") == "True"
+            and query in data.get("Title", "").lower()
+        ]
+        if not found:
+            return NOT_FOUND
+        found.sort(key=lambda entry: entry["Title"].lower())
+        return {
+            "Search": found[:SEARCH_PAGE],
+            "totalResults": str(len(found)),
+            "Response": "True",
+        }
+
+    def fetch(self, params):
+        """Return the recorded answer to ``params``, after the injected delay.
+
+        Raises:
+            OMDbUnavailable: For the injected share of failed lookups.
+        """
+        with self._lock:
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            fail = self._random.random() < self.error_rate
+            self.lookups += 1
+            self.errors += fail
+        if delay:
+            time.sleep(delay)
+        if fail:
+            raise OMDbUnavailable(
+                f"{self.error_status} Server Error (injected) for {fixture_key(params)}"
+            )
+        key = fixture_key(params)
+        data = self._responses.get(key)
+        if data is None and key.startswith("s:"):
+            data = self._search(key[2:])
+        if data is None:
+            with self._lock:
+                self.misses += 1
+            data = NOT_FOUND
+        return copy.deepcopy(data)
+
+    def status(self):
+        """Return the number of fixtures and lookup counters."""
+        with self._lock:
+            return {
+                "fixtures": len(self._responses),
+                "lookups": self.lookups,
+                "errors": self.errors,
+                "misses": self.misses,
+            }
+
+
+class RecordingBackend:
+    """Another backend, saving each of its answers as a fixture.
+
+    Args:
+        backend: Backend to ask, normally :class:`HTTPBackend`.
+        directory (str): Directory to write fixtures to.
+    """
+
+    def __init__(self, backend, directory):
+        self.backend = backend
+        self.directory = directory
+
+    def fetch(self, params):
+        data = self.backend.fetch(params)
+        # "not found" answers too, so a replay finds nothing either
+        if data.get("Response") in ("True", "False"):
+            try:
+                write_fixture(self.directory, params, data)
+            except OSError as e:
+                print(f"Warning: Could not record OMDb fixture: {e}")
+        return data
+
+
+def detail_response(movie):
+    """Return an OMDb-shaped detail response for a catalogue ``Movie``."""
+    return {
+        "Title": movie.title,
+        "Year": str(movie.year) if movie.year else "N/A",
+        "Director": movie.director or "N/A",
+        "Plot": movie.plot_short or "N/A",
+        "Poster": movie.poster_url or "N/A",
+        "imdbRating": movie.imdb_rating or "N/A",
+        "imdbID": movie.omdb_id,
+        "Type": "movie",
+        "Response": "True",
+    }
+
+
+def create_backend(app):
+    """Return the backend ``OMDB_BACKEND`` names, configured from ``app``."""
+    config = app.config
+    name = config["OMDB_BACKEND"]
+    if name == "fixtures":
+        return FixtureBackend(
+            config["OMDB_FIXTURES_DIR"],
+            latency=config["OMDB_LATENCY"],
+            jitter=config["OMDB_LATENCY_JITTER"],
+            error_rate=config["OMDB_ERROR_RATE"],
+            error_status=config["OMDB_ERROR_STATUS"],
+            seed=config["OMDB_FIXTURES_SEED"],
+        )
+    http = HTTPBackend(config["OMDB_URL"], timeout=config["OMDB_TIMEOUT"])
+    if name == "record":
+        return RecordingBackend(http, config["OMDB_FIXTURES_DIR"])
+    if name != "http":
+        raise ValueError(f"Unknown OMDB_BACKEND {name!r}")
+    return http
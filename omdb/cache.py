@@ -0,0 +1,55 @@
+import json
+import os
+import tempfile
+import time
+
+from .singleflight import digest
+
+
+class ResponseCache:
+    """OMDb responses stored as JSON files shared by all worker processes.
+
+    Entries older than ``ttl`` seconds are treated as missing. Writes go
+    through a temporary file and ``os.replace`` so readers never observe a
+    partially written entry.
+    """
+
+    def __init__(self, directory, ttl=7 * 24 * 3600):
+        self.directory = directory
+        self.ttl = ttl
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{digest(key)}.json")
+
+    def get(self, key, max_age=None):
+        """Return the cached response for ``key`` or None if absent/expired.
+
+        Args:
+            key (str): Cache key.
+            max_age (float): Optional stricter age limit in seconds.
+        """
+        path = self._path(key)
+        ttl = self.ttl if max_age is None else min(self.ttl, max_age)
+        try:
+            if time.time() - os.path.getmtime(path) > ttl:
+                return None
+            with open(path, encoding="utf-8") as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return None
+
+    def set(self, key, value):
+        """Store ``value`` for ``key``."""
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as fh:
+                json.dump(value, fh)
+            os.replace(tmp, self._path(key))
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+    def __contains__(self, key):
+        return self.get(key) is not None
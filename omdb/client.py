@@ -0,0 +1,210 @@
+import os
+
+from flask import current_app
+
+from .backends import OMDB_URL, HTTPBackend, create_backend
+from .cache import ResponseCache
+from .errors import OMDbError, QuotaExhausted
+from .prefetch import Prefetcher
+from .ratelimit import DEFAULT_RESERVES, RateLimiter
+from .singleflight import SingleFlight, file_lock
+
+
+class OMDbClient:
+    """Cached, coalescing access to the OMDb API.
+
+    Every lookup is served from the shared response cache when possible.
+    On a miss, concurrent identical lookups in this process share one call
+    and a per-key file lock keeps other processes from repeating it. Calls
+    that do reach the backend are charged to the rate limiter, if any.
+
+    Args:
+        api_key (str): OMDb API key; lookups fail fast when it is missing.
+        cache_dir (str): Directory for cached responses and lock files.
+        cache_ttl (int): Seconds a cached response stays valid.
+        timeout (float): HTTP timeout in seconds.
+        limiter (RateLimiter): Shared rate limiter and quota tracker.
+        rate_wait (float): Seconds to wait for a rate limit token.
+        backend: Where lookups that miss the cache go (default: the OMDb
+            API, see :mod:`omdb.backends`).
+    """
+
+    def __init__(
+        self,
+        api_key,
+        cache_dir,
+        cache_ttl=7 * 24 * 3600,
+        timeout=10,
+        limiter=None,
+        rate_wait=2.0,
+        backend=None,
+    ):
+        self.api_key = api_key
+        self.cache = ResponseCache(cache_dir, cache_ttl)
+        self.lock_dir = os.path.join(cache_dir, "locks")
+        self.timeout = timeout
+        self.limiter = limiter
+        self.rate_wait = rate_wait
+        # not `backend or ...`: a fixture backend without fixtures is falsy
+        self.backend = backend if backend is not None else HTTPBackend(timeout=timeout)
+        self._flight = SingleFlight()
+
+    def search(self, title, priority="interactive"):
+        """Search OMDb movies by title (``s=`` lookup).
+
+        Args:
+            title (str): Title to search for.
+            priority (str): Rate limiter priority ("interactive" or "bulk").
+
+        Returns:
+            list: The ``Search`` entries of the OMDb response.
+
+        Raises:
+            OMDbError: If OMDb reports an error such as no results.
+            QuotaExhausted: If the daily budget for ``priority`` is used up.
+            OMDbUnavailable: On connection problems or HTTP errors.
+        """
+        key = f"s:{' '.join(title.lower().split())}"
+        data = self._lookup(key, {"s": title, "type": "movie"}, priority)
+        return data.get("Search", [])
+
+    def details(self, imdb_id, priority="interactive", max_age=None):
+        """Fetch full movie details by IMDb ID (``i=`` lookup).
+
+        Args:
+            imdb_id (str): IMDb ID of the movie.
+            priority (str): Rate limiter priority ("interactive", "bulk"
+                or "prefetch").
+            max_age (float): Only accept cached responses younger than this
+                many seconds (e.g. when refreshing stored data).
+
+        Returns:
+            dict: The OMDb detail response.
+
+        Raises:
+            OMDbError: If OMDb reports an error such as an unknown ID.
+            QuotaExhausted: If the daily budget for ``priority`` is used up.
+            OMDbUnavailable: On connection problems or HTTP errors.
+        """
+        return self._lookup(
+            f"i:{imdb_id}", {"i": imdb_id, "plot": "short"}, priority, max_age
+        )
+
+    def quota_status(self):
+        """Return the rate limiter's view of the remaining budget."""
+        if self.limiter is None:
+            return None
+        return self.limiter.status(self.api_key)
+
+    def is_cached(self, imdb_id):
+        """Return True if details for ``imdb_id`` can be served locally."""
+        return f"i:{imdb_id}" in self.cache
+
+    def _lookup(self, key, params, priority, max_age=None):
+        data = self.cache.get(key, max_age)
+        if data is None:
+            data = self._flight.do(
+                key, lambda: self._load(key, params, priority, max_age)
+            )
+        if data.get("Response") != "True":
+            raise OMDbError(data.get("Error", "Unknown error from OMDb."))
+        return data
+
+    def _load(self, key, params, priority, max_age=None):
+        with file_lock(self.lock_dir, key):
+            # another worker may have fetched it while we waited for the lock
+            data = self.cache.get(key, max_age)
+            if data is None:
+                if self.limiter is not None:
+                    self.limiter.acquire(self.api_key, priority, self.rate_wait)
+                data = self._request(params)
+                if data.get("Response") == "True":
+                    self.cache.set(key, data)
+        return data
+
+    def _request(self, params):
+        try:
+            return self.backend.fetch({**params, "apikey": self.api_key})
+        except QuotaExhausted:
+            if self.limiter is not None:
+                self.limiter.exhaust(self.api_key)
+            raise
+
+
+def init_app(app):
+    """Create the application's OMDb client from its configuration."""
+    if "omdb" in app.extensions:
+        return
+    # "http", "fixtures" or "record" (see omdb.backends)
+    app.config.setdefault(
+        "OMDB_BACKEND", os.environ.get("WEBFLIX_OMDB_BACKEND", "http")
+    )
+    app.config.setdefault("OMDB_URL", os.environ.get("OMDB_URL", OMDB_URL))
+    app.config.setdefault("OMDB_TIMEOUT", 10)
+    app.config.setdefault(
+        "OMDB_FIXTURES_DIR", os.path.join(app.root_path, "data", "omdb_fixtures")
+    )
+    app.config.setdefault("OMDB_LATENCY", 0.0)
+    app.config.setdefault("OMDB_LATENCY_JITTER", 0.0)
+    app.config.setdefault("OMDB_ERROR_RATE", 0.0)
+    app.config.setdefault("OMDB_ERROR_STATUS", 503)
+    app.config.setdefault("OMDB_FIXTURES_SEED", None)
+    offline = app.config["OMDB_BACKEND"] == "fixtures"
+    # fixtures need no key; the views only check that one is set
+    app.config.setdefault(
+        "OMDB_API_KEY",
+        os.environ.get("OMDB_API_KEY") or ("offline" if offline else None),
+    )
+    # replayed answers must not end up in the cache of real ones
+    app.config.setdefault(
+        "OMDB_CACHE_DIR",
+        os.path.join(
+            app.root_path, "data", "omdb_cache_offline" if offline else "omdb_cache"
+        ),
+    )
+    app.config.setdefault("OMDB_CACHE_TTL", 7 * 24 * 3600)
+    app.config.setdefault(
+        "OMDB_QUOTA_DB", os.path.join(app.root_path, "data", "omdb_quota.db")
+    )
+    app.config.setdefault(
+        "OMDB_DAILY_QUOTA", int(os.environ.get("OMDB_DAILY_QUOTA", 1000))
+    )
+    app.config.setdefault("OMDB_RATE_PER_SECOND", 5.0)
+    app.config.setdefault("OMDB_RATE_BURST", 10)
+    app.config.setdefault("OMDB_RATE_WAIT", 2.0)
+    # share of the budget that bulk imports must leave for interactive use
+    app.config.setdefault("OMDB_RESERVES", dict(DEFAULT_RESERVES))
+    limiter = RateLimiter(
+        app.config["OMDB_QUOTA_DB"],
+        rate=app.config["OMDB_RATE_PER_SECOND"],
+        burst=app.config["OMDB_RATE_BURST"],
+        daily_quota=app.config["OMDB_DAILY_QUOTA"],
+        reserves=app.config["OMDB_RESERVES"],
+    )
+    app.extensions["omdb"] = OMDbClient(
+        api_key=app.config["OMDB_API_KEY"],
+        cache_dir=app.config["OMDB_CACHE_DIR"],
+        cache_ttl=app.config["OMDB_CACHE_TTL"],
+        timeout=app.config["OMDB_TIMEOUT"],
+        limiter=limiter,
+        rate_wait=app.config["OMDB_RATE_WAIT"],
+        backend=create_backend(app),
+    )
+    # Warm the cache with details of the top search results; 0 disables
+    app.config.setdefault("OMDB_PREFETCH_TOP_N", 5)
+    app.config.setdefault("OMDB_PREFETCH_WORKERS", 4)
+    app.extensions["omdb_prefetch"] = Prefetcher(
+        app.extensions["omdb"],
+        top_n=app.config["OMDB_PREFETCH_TOP_N"],
+        max_workers=app.config["OMDB_PREFETCH_WORKERS"],
+    )
+
+
+def get_client():
+    """Return the OMDb client of the current application."""
+    return current_app.extensions["omdb"]
+
+
+def get_prefetcher():
+    """Return the OMDb detail prefetcher of the current application."""
+    return current_app.extensions["omdb_prefetch"]
@@ -0,0 +1,17 @@
+class OMDbError(Exception):
+    """OMDb answered, but with ``"Response": "False"`` (e.g. movie not found).
+
+    Also the base class of every other OMDb failure.
+    """
+
+
+class OMDbUnavailable(OMDbError):
+    """OMDb could not be reached or answered with an HTTP error."""
+
+
+class QuotaExhausted(OMDbError):
+    """The API key's daily request budget for this priority is used up."""
+
+
+class RateLimited(OMDbError):
+    """No request token became available within the allowed wait."""
@@ -0,0 +1,92 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Movie, get_or_create
+
+
+def parse_year(value):
+    """Return the (start) year of an OMDb ``Year`` value such as "2001–2003"."""
+    if not value:
+        return None
+    value = value.replace("–", "-").split("-")[0].strip()
+    return int(value) if value.isdigit() else None
+
+
+def movie_fields(imdb_id, details):
+    """Map an OMDb detail response to ``Movie`` column values."""
+    poster = details.get("Poster")
+    return {
+        "title": details.get("Title", "N/A"),
+        "director": details.get("Director", "N/A"),
+        "year": parse_year(details.get("Year")),
+        "omdb_id": imdb_id,
+        "plot_short": details.get("Plot", ""),
+        "imdb_rating": details.get("imdbRating", "N/A"),
+        "poster_url": poster if poster and poster != "N/A" else None,
+    }
+
+
+def local_search(title, limit=10):
+    """Search the local catalogue, returning OMDb-shaped search entries.
+
+    Used when OMDb cannot be asked (e.g. the daily quota is exhausted);
+    results carry the stored ``omdb_id`` so adding them needs no OMDb call.
+    """
+    pattern = f"%{' '.join(title.lower().split())}%"
+    movies = db.session.execute(
+        select(Movie)
+        .where(func.lower(Movie.title).like(pattern), Movie.omdb_id.isnot(None))
+        .order_by(func.lower(Movie.title))
+        .limit(limit)
+    ).scalars()
+    return [
+        {
+            "Title": m.title,
+            "Year": str(m.year) if m.year else "N/A",
+            "imdbID": m.omdb_id,
+            "Type": "movie",
+            "Poster": m.poster_url or "N/A",
+        }
+        for m in movies
+    ]
+
+
+def upsert_movie(fields):
+    """Insert a movie unless one with the same ``omdb_id`` already exists.
+
+    Goes through :func:`models.get_or_create`, so concurrent adds of the same
+    title never raise ``IntegrityError`` and a new movie costs one
+    ``INSERT ... RETURNING`` where the dialect supports it. The catalogue
+    holds one movie per title and year, so a movie entered by hand with this
+    title and year is completed with the OMDb fields instead. The caller
+    commits.
+
+    Args:
+        fields (dict): Movie column values, including ``omdb_id``.
+
+    Returns:
+        tuple: ``(movie, created)``.
+
+    Raises:
+        ValueError: If another OMDb movie has the same title and year.
+    """
+    fields = {"last_refreshed_at": datetime.now(timezone.utc), **fields}
+    try:
+        # the conflict target is omdb_id; a title and year clash still raises
+        with db.session.begin_nested():
+            return get_or_create(Movie, ("omdb_id",), fields)
+    except IntegrityError:
+        pass
+    movie = db.session.scalars(
+        select(Movie).filter_by(title=fields["title"], year=fields["year"])
+    ).one()
+    if movie.omdb_id is not None:
+        raise ValueError(
+            f'"{movie.title}" ({movie.year or "no year"}) is already in the '
+            f"catalogue as {movie.omdb_id}"
+        )
+    for name, value in fields.items():
+        setattr(movie, name, value)
+    return movie, False
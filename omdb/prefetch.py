@@ -0,0 +1,99 @@
+"""Speculative background prefetching of OMDb movie details.
+
+After a title search, the details of the top results are fetched into the
+shared response cache on a small thread pool, so clicking "add" is served
+locally. A lookup the user triggers while its prefetch is still running
+joins that call through the client's single-flight layer.
+"""
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .errors import OMDbError
+
+
+class Prefetcher:
+    """Bounded, cancellable warm-up of ``OMDbClient.details`` lookups.
+
+    Args:
+        client (OMDbClient): Client whose cache is warmed.
+        top_n (int): Number of leading search results to prefetch.
+        max_workers (int): Size of the thread pool.
+    """
+
+    def __init__(self, client, top_n=5, max_workers=4):
+        self.client = client
+        self.top_n = top_n
+        self.max_workers = max_workers
+        # reentrant: cancelling a future runs its done callbacks at once
+        self._lock = threading.RLock()
+        self._pending = {}
+        self._executor = None
+        self._pid = None
+
+    def _pool(self):
+        # created lazily, and again after a fork: pool threads do not survive it
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="omdb-prefetch"
+            )
+            self._pid = os.getpid()
+        return self._executor
+
+    def prefetch(self, imdb_ids, token=None):
+        """Queue detail lookups for the first ``top_n`` uncached IDs.
+
+        Args:
+            imdb_ids (list): IMDb IDs in result order.
+            token (str): Owner of the batch (e.g. a browser session); a new
+                batch for the same token cancels the previous one's queued work.
+
+        Returns:
+            list: The futures of the queued lookups.
+        """
+        ids = [i for i in imdb_ids[: self.top_n] if i and not self.client.is_cached(i)]
+        with self._lock:
+            if token is not None:
+                self._cancel_locked(token)
+            if not ids:
+                return []
+            pool = self._pool()
+            futures = [pool.submit(self._fetch, imdb_id) for imdb_id in ids]
+            if token is not None:
+                self._pending[token] = futures
+                forget = functools.partial(self._forget, token, futures)
+                for future in futures:
+                    future.add_done_callback(forget)
+        return futures
+
+    def _forget(self, token, futures, _future):
+        # drop a finished batch, so the map holds only sessions with work queued
+        with self._lock:
+            if self._pending.get(token) is futures and all(f.done() for f in futures):
+                del self._pending[token]
+
+    def cancel(self, token):
+        """Cancel queued lookups of ``token``'s batch; running ones finish."""
+        with self._lock:
+            self._cancel_locked(token)
+
+    def _cancel_locked(self, token):
+        for future in self._pending.pop(token, ()):
+            future.cancel()
+
+    def _fetch(self, imdb_id):
+        try:
+            self.client.details(imdb_id, priority="prefetch")
+        except OMDbError:
+            # speculative work: the real lookup will report any problem
+            pass
+
+    def shutdown(self):
+        """Drop queued work and stop the pool."""
+        with self._lock:
+            for token in list(self._pending):
+                self._cancel_locked(token)
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
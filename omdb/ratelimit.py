@@ -0,0 +1,191 @@
+"""Client-side OMDb rate limiting and daily quota accounting.
+
+State lives in a small SQLite file shared by every worker process. Each
+API key gets a token bucket (requests per second with a burst allowance)
+and a per-day request counter. Lower priorities must leave part of both
+budgets untouched, so interactive searches keep working after a bulk
+import has drained most of the day's quota.
+"""
+import hashlib
+import os
+import sqlite3
+import time
+from contextlib import closing
+from datetime import datetime, timezone
+
+from .errors import QuotaExhausted, RateLimited
+
+# Share of the daily quota and of the burst that a priority may not touch.
+DEFAULT_RESERVES = {
+    "interactive": 0.0,
+    "bulk": 0.2,
+    "prefetch": 0.4,
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS daily_usage (
+    key TEXT NOT NULL,
+    day TEXT NOT NULL,
+    used INTEGER NOT NULL DEFAULT 0,
+    rejected INTEGER NOT NULL DEFAULT 0,
+    exhausted INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (key, day)
+);
+"""
+
+
+def _today():
+    # OMDb quotas reset daily; count in UTC so all workers agree on the day
+    return datetime.now(timezone.utc).date().isoformat()
+
+
+def _key_id(api_key):
+    # never store the raw key
+    return hashlib.sha1((api_key or "").encode("utf-8")).hexdigest()[:16]
+
+
+class RateLimiter:
+    """Token bucket plus daily quota, shared across processes via SQLite.
+
+    Args:
+        path (str): SQLite file holding the shared state.
+        rate (float): Sustained requests per second.
+        burst (int): Bucket capacity.
+        daily_quota (int): Requests allowed per key per UTC day.
+        reserves (dict): Priority name mapped to the share of the budget
+            it must leave for higher priorities.
+    """
+
+    def __init__(self, path, rate=5.0, burst=10, daily_quota=1000, reserves=None):
+        self.path = path
+        self.rate = float(rate)
+        self.burst = burst
+        self.daily_quota = daily_quota
+        self.reserves = {**DEFAULT_RESERVES, **(reserves or {})}
+        self._schema_ready = False
+
+    def _connect(self):
+        if not self._schema_ready:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        if not self._schema_ready:
+            conn.executescript(_SCHEMA)
+            self._schema_ready = True
+        return conn
+
+    def _limit(self, priority):
+        return int(self.daily_quota * (1 - self.reserves.get(priority, 0.0)))
+
+    def try_acquire(self, api_key, priority="interactive"):
+        """Take one request from the budget without waiting.
+
+        Returns:
+            float: 0 if a request may be made now, otherwise the number of
+            seconds until a token is expected to be available.
+
+        Raises:
+            QuotaExhausted: If today's budget for ``priority`` is used up.
+        """
+        key, day, now = _key_id(api_key), _today(), time.time()
+        reserve = self.reserves.get(priority, 0.0)
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT tokens, updated_at FROM buckets WHERE key = ?", (key,)
+                ).fetchone()
+                tokens = self.burst if row is None else min(
+                    self.burst, row[0] + (now - row[1]) * self.rate)
+                usage = conn.execute(
+                    "SELECT used, exhausted FROM daily_usage "
+                    "WHERE key = ? AND day = ?", (key, day)
+                ).fetchone() or (0, 0)
+                conn.execute(
+                    "INSERT OR IGNORE INTO daily_usage (key, day) VALUES (?, ?)",
+                    (key, day))
+                if usage[1] or usage[0] >= self._limit(priority):
+                    conn.execute(
+                        "UPDATE daily_usage SET rejected = rejected + 1 "
+                        "WHERE key = ? AND day = ?", (key, day))
+                    conn.execute("COMMIT")
+                    raise QuotaExhausted(
+                        f"OMDb daily quota reached for {priority} requests.")
+                # lower priorities keep part of the burst for higher ones
+                floor = self.burst * reserve
+                wait = 0.0
+                if tokens - 1 < floor:
+                    wait = (floor + 1 - tokens) / self.rate
+                else:
+                    tokens -= 1
+                    conn.execute(
+                        "UPDATE daily_usage SET used = used + 1 "
+                        "WHERE key = ? AND day = ?", (key, day))
+                conn.execute(
+                    "INSERT OR REPLACE INTO buckets (key, tokens, updated_at) "
+                    "VALUES (?, ?, ?)", (key, tokens, now))
+                conn.execute("COMMIT")
+                return wait
+            except QuotaExhausted:
+                raise
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def acquire(self, api_key, priority="interactive", timeout=2.0):
+        """Take one request from the budget, waiting up to ``timeout`` seconds.
+
+        Raises:
+            QuotaExhausted: If today's budget for ``priority`` is used up.
+            RateLimited: If no token became available in time.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            wait = self.try_acquire(api_key, priority)
+            if not wait:
+                return
+            remaining = deadline - time.monotonic()
+            if wait > remaining:
+                raise RateLimited("OMDb request rate limit reached, try again shortly.")
+            time.sleep(wait)
+
+    def exhaust(self, api_key):
+        """Mark today's quota as used up, e.g. after OMDb itself refused."""
+        key, day = _key_id(api_key), _today()
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "INSERT INTO daily_usage (key, day, exhausted) VALUES (?, ?, 1) "
+                "ON CONFLICT (key, day) DO UPDATE SET exhausted = 1",
+                (key, day))
+
+    def status(self, api_key):
+        """Return remaining budget and usage counters for ``api_key``."""
+        key, day, now = _key_id(api_key), _today(), time.time()
+        with closing(self._connect()) as conn:
+            bucket = conn.execute(
+                "SELECT tokens, updated_at FROM buckets WHERE key = ?", (key,)
+            ).fetchone()
+            used, rejected, exhausted = conn.execute(
+                "SELECT used, rejected, exhausted FROM daily_usage "
+                "WHERE key = ? AND day = ?", (key, day)
+            ).fetchone() or (0, 0, 0)
+        tokens = self.burst if bucket is None else min(
+            self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        return {
+            "day": day,
+            "daily_quota": self.daily_quota,
+            "used_today": used,
+            "rejected_today": rejected,
+            "exhausted": bool(exhausted),
+            "remaining_today": {
+                priority: 0 if exhausted else max(0, self._limit(priority) - used)
+                for priority in self.reserves
+            },
+            "tokens": round(tokens, 2),
+            "rate_per_second": self.rate,
+            "burst": self.burst,
+        }
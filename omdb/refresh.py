@@ -0,0 +1,159 @@
+"""Periodic refresh of OMDb-derived movie fields.
+
+``imdb_rating``, ``poster_url`` and ``plot_short`` are captured when a movie
+is added and drift afterwards. :func:`refresh_catalogue` walks the movies
+with the oldest ``last_refreshed_at`` in batches, fetches them concurrently
+at "bulk" rate-limit priority, and writes back only the values that changed.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import or_, select, update
+
+from models import db, Movie, Change, publish
+
+from .errors import OMDbError, OMDbUnavailable, QuotaExhausted, RateLimited
+from .ingest import movie_fields
+
+REFRESHED_FIELDS = ("imdb_rating", "poster_url", "plot_short")
+
+
+def _utcnow():
+    return datetime.now(timezone.utc)
+
+
+def stalest_movies(limit, older_than):
+    """Return up to ``limit`` movies not refreshed since ``older_than``.
+
+    Never-refreshed movies come first, then the oldest refreshes.
+    """
+    columns = [Movie.id, Movie.omdb_id, *(getattr(Movie, f) for f in REFRESHED_FIELDS)]
+    return db.session.execute(
+        select(*columns)
+        .where(
+            Movie.omdb_id.isnot(None),
+            or_(Movie.last_refreshed_at.is_(None),
+                Movie.last_refreshed_at < older_than),
+        )
+        .order_by(Movie.last_refreshed_at.asc().nulls_first(), Movie.id)
+        .limit(limit)
+    ).mappings().all()
+
+
+def _fetch(client, imdb_id, max_age):
+    """Fetch details, classifying failures instead of raising.
+
+    Returns:
+        tuple: ``(status, details)`` with status "ok", "gone" (OMDb no longer
+        knows the ID), "retry" (temporary failure) or "quota".
+    """
+    try:
+        return "ok", client.details(imdb_id, priority="bulk", max_age=max_age)
+    except QuotaExhausted:
+        return "quota", None
+    except (RateLimited, OMDbUnavailable):
+        return "retry", None
+    except OMDbError:
+        return "gone", None
+
+
+def apply_refresh(rows, results, now):
+    """Write refreshed values back, touching only rows that differ.
+
+    Args:
+        rows (list): Movie rows as returned by :func:`stalest_movies`.
+        results (list): ``(status, details)`` per row.
+        now (datetime): Refresh timestamp to record.
+
+    Returns:
+        int: Number of movies whose OMDb fields changed.
+    """
+    changed, touched, changes = [], [], []
+    for row, (status, details) in zip(rows, results):
+        if status not in ("ok", "gone"):
+            continue
+        touched.append(row["id"])
+        if status != "ok":
+            continue
+        fresh = movie_fields(row["omdb_id"], details)
+        new = {f: fresh[f] for f in REFRESHED_FIELDS if fresh[f] != row[f]}
+        if new:
+            changed.append({"id": row["id"], **new, "last_refreshed_at": now})
+            changes.append(Change("update", "movies", (row["id"],),
+                                  {f: row[f] for f in new}, new))
+
+    if changed:
+        # ORM bulk UPDATE by primary key: one executemany per column set
+        db.session.execute(update(Movie), changed)
+        publish(db.session, changes)
+    unchanged = sorted(set(touched) - {c["id"] for c in changed})
+    if unchanged:
+        db.session.execute(
+            update(Movie)
+            .where(Movie.id.in_(unchanged))
+            .values(last_refreshed_at=now)
+            .execution_options(synchronize_session=False)
+        )
+    db.session.commit()
+    return len(changed)
+
+
+def refresh_catalogue(
+    client,
+    limit=None,
+    batch_size=50,
+    workers=4,
+    max_age=timedelta(days=30),
+    progress=None,
+):
+    """Refresh the stalest movies from OMDb.
+
+    Args:
+        client (OMDbClient): Client used for the lookups.
+        limit (int): Maximum number of movies to process (None for all due).
+        batch_size (int): Movies fetched concurrently and written per batch.
+        workers (int): Concurrent OMDb lookups.
+        max_age (timedelta): Movies refreshed more recently are skipped.
+        progress (callable): Called with a stats dict after each batch.
+
+    Returns:
+        dict: Totals for the run (processed, changed, failed, elapsed, ...).
+    """
+    started = time.monotonic()
+    now = _utcnow()
+    cutoff = now - max_age
+    totals = {"processed": 0, "changed": 0, "failed": 0, "batches": 0,
+              "stopped": None}
+    seen = set()
+
+    with ThreadPoolExecutor(max_workers=workers,
+                            thread_name_prefix="omdb-refresh") as pool:
+        while limit is None or totals["processed"] < limit:
+            size = batch_size if limit is None else min(
+                batch_size, limit - totals["processed"])
+            rows = [r for r in stalest_movies(size + len(seen), cutoff)
+                    if r["id"] not in seen][:size]
+            if not rows:
+                break
+            seen.update(r["id"] for r in rows)
+            # accept cache entries fetched during this run, not older ones
+            max_cache_age = time.monotonic() - started + 1
+            results = list(pool.map(
+                lambda r: _fetch(client, r["omdb_id"], max_cache_age), rows))
+
+            totals["changed"] += apply_refresh(rows, results, _utcnow())
+            totals["processed"] += len(rows)
+            totals["failed"] += sum(1 for s, _ in results if s in ("retry", "quota"))
+            totals["batches"] += 1
+            elapsed = time.monotonic() - started
+            totals["elapsed"] = round(elapsed, 2)
+            totals["per_second"] = round(totals["processed"] / elapsed, 2) if elapsed else None
+            if progress:
+                progress(dict(totals))
+            if any(s == "quota" for s, _ in results):
+                totals["stopped"] = "OMDb quota exhausted"
+                break
+
+    totals["elapsed"] = round(time.monotonic() - started, 2)
+    return totals
@@ -0,0 +1,85 @@
+"""Request coalescing for identical OMDb lookups.
+
+:class:`SingleFlight` makes concurrent callers in one process share a single
+in-flight call per key, and :func:`file_lock` serialises the same key across
+worker processes so only one of them goes to the network while the others
+pick the result up from the shared cache.
+"""
+import hashlib
+import os
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows has no flock
+    fcntl = None
+
+
+def digest(key):
+    """Return a filesystem-safe name for ``key``."""
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """Collapse concurrent calls with the same key into one execution."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        """Run ``fn`` for ``key`` unless a call for it is already running.
+
+        Callers that arrive while the first call is in flight wait for it
+        and receive the same result (or exception).
+
+        Args:
+            key (str): Identity of the call.
+            fn (callable): Zero-argument function producing the result.
+
+        Returns:
+            The value returned by ``fn``.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            return future.result()
+        try:
+            result = fn()
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def in_flight(self):
+        """Return the keys currently being fetched."""
+        with self._lock:
+            return list(self._calls)
+
+
+@contextmanager
+def file_lock(directory, key):
+    """Hold an exclusive cross-process lock for ``key`` under ``directory``.
+
+    Falls back to no locking where ``fcntl`` is unavailable.
+    """
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, f"{digest(key)}.lock"), "a") as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
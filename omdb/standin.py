@@ -0,0 +1,47 @@
+"""A local HTTP server answering like OMDb, from recorded fixtures.
+
+``flask omdb-standin`` serves a :class:`~omdb.backends.FixtureBackend`
+over HTTP. With ``OMDB_URL`` pointed at it, the app keeps its real HTTP
+path (``requests``, timeouts, status handling) while the answers, their
+latency and their failures are under control.
+"""
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+from .errors import OMDbUnavailable
+
+
+def make_server(backend, host="127.0.0.1", port=8079):
+    """Return a threaded HTTP server answering OMDb lookups from ``backend``.
+
+    Args:
+        backend (FixtureBackend): Source of the answers.
+        host (str): Address to listen on.
+        port (int): Port to listen on; 0 picks a free one.
+
+    Returns:
+        ThreadingHTTPServer: Call ``serve_forever()`` to start it.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            params = dict(parse_qsl(urlsplit(self.path).query))
+            try:
+                status, body = 200, backend.fetch(params)
+            except OMDbUnavailable as e:
+                status, body = backend.error_status, {"Error": str(e)}
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            # one line per lookup would drown a benchmark's output
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    return server
@@ -0,0 +1,155 @@
+"""Measure the OMDb-bound routes against a slow or flaky stand-in OMDb.
+
+Copies ``data/webflix.db`` to a scratch directory, writes OMDb fixtures for
+its movies and runs the app with the fixture backend (no network) under
+each combination of injected latency and error rate. Worker threads send
+``/search_movies`` and ``POST /api/users/<id>/add-movies`` lookups (every
+one a cache miss) mixed with ``/all-movies`` reads, and the script reports
+latency percentiles and status codes per route, so the effect of OMDb's
+speed on the cheap reads, and admission control's 503s, can be compared.
+
+Usage:
+    python scripts/bench_omdb.py [--latency-ms 50,2000] [--error-rate 0,0.2]
+        [--threads 8] [--requests 40]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select  # noqa: E402
+
+from app import create_app  # noqa: E402
+from models import db, Movie, User  # noqa: E402
+from omdb import detail_response, write_fixture  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))] if values else 0.0
+
+
+def export_fixtures(app, directory):
+    with app.app_context():
+        movies = db.session.scalars(select(Movie).where(Movie.omdb_id.isnot(None)))
+        titles = []
+        for movie in movies:
+            write_fixture(
+                directory, {"i": movie.omdb_id, "plot": "short"}, detail_response(movie)
+            )
+            titles.append(movie.title)
+        user_id = db.session.scalar(select(User.id).limit(1))
+    return titles, user_id
+
+
+def run(app, titles, user_id, threads, requests):
+    timings = defaultdict(list)
+    statuses = defaultdict(Counter)
+    lock = threading.Lock()
+    queue = list(range(threads * requests))
+
+    def worker():
+        client = app.test_client()
+        while True:
+            with lock:
+                if not queue:
+                    return
+                i = queue.pop()
+            # a different title every time: each lookup misses the cache
+            title = titles[i % len(titles)]
+            if i % 3 == 0:
+                route, call = "/all-movies", lambda: client.get("/all-movies")
+            elif i % 3 == 1:
+                route = "/search_movies"
+                call = lambda: client.get(  # noqa: E731
+                    "/search_movies", query_string={"title": title}
+                )
+            else:
+                route = "/api/.../add-movies"
+                call = lambda: client.post(  # noqa: E731
+                    f"/api/users/{user_id}/add-movies", json={"title": title}
+                )
+            start = time.perf_counter()
+            response = call()
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                timings[route].append(elapsed)
+                statuses[route][response.status_code] += 1
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return timings, statuses, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency-ms", default="50,2000")
+    parser.add_argument("--error-rate", default="0,0.2")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=40, help="Per thread.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        shutil.copy(os.path.join(ROOT, "data", "webflix.db"), tmp)
+        fixtures = os.path.join(tmp, "fixtures")
+        base = {
+            "TESTING": True,
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp}/webflix.db",
+            "OMDB_BACKEND": "fixtures",
+            "OMDB_FIXTURES_DIR": fixtures,
+            "OMDB_QUOTA_DB": os.path.join(tmp, "quota.db"),
+            "OMDB_RATE_PER_SECOND": 1000.0,
+            "OMDB_RATE_BURST": 1000,
+            "OMDB_DAILY_QUOTA": 10**6,
+            "OMDB_PREFETCH_TOP_N": 0,
+            "OMDB_FIXTURES_SEED": 42,
+            "ADMISSION_RATE_LIMITS": {},
+            "CATALOGUE_SNAPSHOT": False,
+        }
+        titles, user_id = export_fixtures(create_app(base), fixtures)
+        print(f"{len(titles)} fixtures, {args.threads} threads x {args.requests}")
+
+        for latency in (float(v) for v in args.latency_ms.split(",")):
+            for error_rate in (float(v) for v in args.error_rate.split(",")):
+                cache = tempfile.mkdtemp(dir=tmp)
+                app = create_app(
+                    {
+                        **base,
+                        "OMDB_LATENCY": latency / 1000,
+                        "OMDB_ERROR_RATE": error_rate,
+                        "OMDB_CACHE_DIR": cache,
+                    }
+                )
+                timings, statuses, elapsed = run(
+                    app, titles, user_id, args.threads, args.requests
+                )
+                print(
+                    f"\nOMDb latency {latency:.0f} ms, error rate {error_rate:.0%}: "
+                    f"{elapsed:.1f} s"
+                )
+                print(f"{'route':22} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}  status")
+                for route in sorted(timings):
+                    values = timings[route]
+                    codes = " ".join(
+                        f"{code}x{n}" for code, n in sorted(statuses[route].items())
+                    )
+                    print(
+                        f"{route:22} {percentile(values, 0.5):8.1f} "
+                        f"{percentile(values, 0.95):8.1f} {max(values):8.1f}  {codes}"
+                    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""Compare /all-movies queries on SQLite with the in-memory catalogue snapshot.
+
+Fills a scratch SQLite database with N synthetic movies (titles, years,
+ratings, poster URLs, 1-4 genres each), then times every sort order with
+and without a genre filter, one page at a time, through the database query
+the view uses and through ``CatalogueSnapshot.query``. Also reports the
+snapshot's build time and memory footprint per 100k movies, and times
+boolean genre queries on the ``GenreIndex`` bitmaps against the equivalent
+``EXISTS`` subqueries.
+
+Usage:
+    python scripts/bench_snapshot.py [-n 100000] [--per-page 24]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask  # noqa: E402
+from sqlalchemy import and_, func, insert, not_, or_, select  # noqa: E402
+
+from indexes import CatalogueSnapshot, GenreIndex  # noqa: E402
+from models import db, Genre, Movie, movie_genre  # noqa: E402
+from views.catalogue import _query_movies  # noqa: E402
+
+GENRES = ["Action", "Comedy", "Drama", "Horror", "Romance", "Sci-Fi", "Thriller"]
+POSTER = "https://m.media-amazon.com/images/M/MV5B{:016x}XkEyXkFqcGc@._V1_SX300.jpg"
+
+
+def fill(n):
+    rng = random.Random(42)
+    db.session.execute(insert(Genre), [{"name": name} for name in GENRES])
+    movies = [
+        {
+            "title": f"{rng.choice(['The', 'A', 'Night of', 'Return of'])} "
+            f"Movie {rng.randrange(10**6)}",
+            "year": rng.randrange(1920, 2025),
+            "imdb_rating": rng.choice(["N/A", f"{rng.uniform(1, 10):.1f}"]),
+            "poster_url": POSTER.format(rng.getrandbits(64)),
+            "omdb_id": f"tt{i:08d}",
+        }
+        for i in range(n)
+    ]
+    db.session.execute(insert(Movie), movies)
+    links = [
+        {"movie_id": movie_id, "genre_id": genre_id}
+        for movie_id in range(1, n + 1)
+        for genre_id in rng.sample(range(1, len(GENRES) + 1), rng.randint(1, 4))
+    ]
+    db.session.execute(insert(movie_genre), links)
+    db.session.commit()
+
+
+GENRE_QUERIES = (
+    "Action AND Sci-Fi AND NOT Horror",
+    "(Drama OR Romance) AND NOT Thriller",
+    "NOT Comedy",
+)
+
+
+def as_sql(node):
+    kind = node[0]
+    if kind == "genre":
+        return Movie.genres.any(Genre.id == node[1])
+    if kind == "not":
+        return not_(as_sql(node[1]))
+    combine = and_ if kind == "and" else or_
+    return combine(as_sql(node[1]), as_sql(node[2]))
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", type=int, default=100_000, help="Movies.")
+    parser.add_argument("--per-page", type=int, default=24)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = Flask(__name__)
+        app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{tmp}/bench.db"
+        db.init_app(app)
+        with app.app_context():
+            db.create_all()
+            fill(args.n)
+
+            snapshot = CatalogueSnapshot(db.engine)
+            build_ms = timed(lambda: snapshot.refresh(force=True), 1)
+            # the first query per sort order builds it; time that separately
+            first_ms = {
+                sort_by: timed(lambda: snapshot.query(sort_by=sort_by, limit=1), 1)
+                for sort_by in ("title", "release_date", "rating")
+            }
+            print(f"{args.n} movies; snapshot built in {build_ms:.0f} ms")
+            print(
+                "first query per order (sorting): "
+                + ", ".join(f"{k} {v:.0f} ms" for k, v in first_ms.items())
+            )
+
+            print(
+                f"\n{'sort':14} {'genre':6} {'dir':5} {'page':>5} "
+                f"{'sqlite ms':>10} {'snapshot ms':>12}"
+            )
+            last_page = args.n // args.per_page // 3
+            for sort_by in ("title", "release_date", "rating"):
+                for genre_id in (None, 4):
+                    for sort_dir, page in (("asc", 1), ("desc", last_page)):
+                        offset = (page - 1) * args.per_page
+                        query = (genre_id, sort_by, sort_dir, offset, args.per_page)
+                        sql_ms = timed(lambda: _query_movies(*query), args.repeat)
+                        snap_ms = timed(lambda: snapshot.query(*query), args.repeat)
+                        print(
+                            f"{sort_by:14} {str(genre_id or '-'):6} {sort_dir:5} "
+                            f"{page:5} {sql_ms:10.2f} {snap_ms:12.3f}"
+                        )
+
+            index = GenreIndex(db.engine)
+            build_ms = timed(lambda: index.refresh(force=True), 1)
+            print(
+                f"\ngenre index built in {build_ms:.0f} ms, "
+                f"{index.status()['bytes'] / 1024:.0f} KiB of bitmaps"
+            )
+            print(f"{'query':38} {'matches':>8} {'sqlite ms':>10} {'bitmap ms':>10}")
+            for text in GENRE_QUERIES:
+                node = index.parse(text)
+                count = select(func.count(Movie.id)).where(as_sql(node))
+                sql_ms = timed(lambda: db.session.scalar(count), args.repeat)
+                bitmap_ms = timed(lambda: len(index.evaluate(node)), args.repeat)
+                print(
+                    f"{text:38} {len(index.evaluate(node)):8} "
+                    f"{sql_ms:10.2f} {bitmap_ms:10.3f}"
+                )
+
+            usage = snapshot.memory_usage()
+            print()
+            for column, size in usage.items():
+                if column not in ("total", "per_100k"):
+                    print(f"{column:12} {size / 2**20:8.2f} MiB")
+            print(f"{'total':12} {usage['total'] / 2**20:8.2f} MiB")
+            print(f"per 100k movies: {usage['per_100k'] / 2**20:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
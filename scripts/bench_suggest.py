@@ -0,0 +1,131 @@
+"""Time typeahead suggestions from the prefix index against a LIKE query.
+
+Fills a scratch SQLite database with N synthetic movies (titles of 1-4
+words, one or two directors, ratings), then times ``SuggestIndex.suggest``
+for prefixes from very common to rare, checks each answer against the
+best-rated matches found by SQL, and times single-movie patches.
+
+Usage:
+    python scripts/bench_suggest.py [-n 100000] [--limit 8]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask  # noqa: E402
+from sqlalchemy import Float, cast, func, insert, or_, select  # noqa: E402
+
+from indexes import SuggestIndex  # noqa: E402
+from indexes.suggest import search_terms  # noqa: E402
+from models import db, Movie  # noqa: E402
+
+WORDS = (
+    "night day star dark light king queen return last first blue red love war "
+    "city river road house ghost dream storm fire ice iron gold silver shadow "
+    "moon sun empire kingdom secret lost final rising fall"
+).split()
+NAMES = "anna ben chris dana eli frank grace hugo ida jon kim leo mara nils".split()
+SURNAMES = "smith nolan lee garcia kim novak berg costa silva park moreau".split()
+PREFIXES = ("t", "th", "the", "n", "ni", "night", "shadow mo", "nolan", "zz")
+
+
+def fill(n):
+    rng = random.Random(42)
+    movies = []
+    for i in range(n):
+        words = rng.sample(WORDS, rng.randint(1, 4))
+        if rng.random() < 0.3:
+            words.insert(0, "the")
+        directors = ", ".join(
+            f"{rng.choice(NAMES)} {rng.choice(SURNAMES)}"
+            for _ in range(rng.choice((1, 1, 1, 2)))
+        )
+        movies.append(
+            {
+                "title": " ".join(words).title(),
+                "director": directors.title(),
+                "year": rng.randrange(1920, 2025),
+                "imdb_rating": rng.choice(["N/A", f"{rng.uniform(1, 10):.1f}"]),
+                "omdb_id": f"tt{i:08d}",
+            }
+        )
+    db.session.execute(insert(Movie), movies)
+    db.session.commit()
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def sql_suggest(prefix, limit):
+    """Best-rated movies with a title or director word starting with prefix."""
+    words = (f"{prefix}%", f"% {prefix}%")
+    rating = cast(func.nullif(Movie.imdb_rating, "N/A"), Float)
+    stmt = (
+        select(Movie.id, Movie.title, Movie.director, rating)
+        .where(
+            or_(
+                *(func.lower(Movie.title).like(w) for w in words),
+                *(func.lower(Movie.director).like(w) for w in words),
+            )
+        )
+        .order_by(func.coalesce(rating, -1).desc(), Movie.id)
+    )
+    # LIKE also matches after stop words and inside "a, b" lists; keep
+    # only rows the index would find and take the first ``limit``
+    found = []
+    for movie_id, title, director, _ in db.session.execute(stmt):
+        if any(t.startswith(prefix) for t in search_terms(title, director)):
+            found.append(movie_id)
+            if len(found) == limit:
+                break
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", type=int, default=100_000, help="Movies.")
+    parser.add_argument("--limit", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = Flask(__name__)
+        app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{tmp}/bench.db"
+        db.init_app(app)
+        with app.app_context():
+            db.create_all()
+            fill(args.n)
+
+            index = SuggestIndex(db.engine)
+            build_ms = timed(lambda: index.refresh(force=True), 1)
+            status = index.status()
+            print(
+                f"{args.n} movies, {status['terms']} terms; "
+                f"index built in {build_ms:.0f} ms"
+            )
+            print(f"\n{'prefix':10} {'sqlite ms':>10} {'index ms':>9} {'same':>5}")
+            for prefix in PREFIXES:
+                expected = sql_suggest(prefix, args.limit)
+                sql_ms = timed(lambda: sql_suggest(prefix, args.limit), 1)
+                index_ms = timed(lambda: index.suggest(prefix, args.limit), args.repeat)
+                same = index.suggest(prefix, args.limit) == expected
+                print(f"{prefix:10} {sql_ms:10.1f} {index_ms:9.3f} {str(same):>5}")
+
+            movie = Movie(title="Nightfall Returns", director="Ana Nolan")
+            db.session.add(movie)
+            db.session.commit()
+            patch_ms = timed(lambda: index.refresh(force=True), 1)
+            print(f"\none insert patched in {patch_ms:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
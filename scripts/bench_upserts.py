@@ -0,0 +1,91 @@
+"""Compare SELECT-then-INSERT with models.get_or_create.
+
+Links a user to N movies on a scratch SQLite database twice: once with
+the old pattern (SELECT the row, INSERT it if missing) and once with
+``get_or_create`` (``INSERT ... ON CONFLICT DO NOTHING RETURNING``). Each
+run is repeated against rows that already exist. Reports SQL statements
+sent to the database per operation and wall time.
+
+Usage:
+    python scripts/bench_upserts.py [-n 2000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask  # noqa: E402
+from sqlalchemy import event, insert, select  # noqa: E402
+
+from models import db, Movie, User, UserMovie, get_or_create  # noqa: E402
+
+
+def select_then_insert(user_id, movie_id):
+    link = db.session.scalars(
+        select(UserMovie).filter_by(user_id=user_id, movie_id=movie_id)
+    ).first()
+    if link is None:
+        link = UserMovie(user_id=user_id, movie_id=movie_id)
+        db.session.add(link)
+        db.session.flush()
+        return link, True
+    return link, False
+
+
+def upsert(user_id, movie_id):
+    return get_or_create(
+        UserMovie, ("user_id", "movie_id"), {"user_id": user_id, "movie_id": movie_id}
+    )
+
+
+def run(fn, user_id, movie_ids, counter):
+    counter["statements"] = 0
+    start = time.perf_counter()
+    for movie_id in movie_ids:
+        fn(user_id, movie_id)
+        db.session.commit()
+    elapsed = time.perf_counter() - start
+    n = len(movie_ids)
+    return counter["statements"] / n, elapsed / n * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", type=int, default=2000, help="Links per run.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = Flask(__name__)
+        app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{tmp}/bench.db"
+        db.init_app(app)
+        with app.app_context():
+            db.create_all()
+            db.session.execute(insert(User), [{"name": "old"}, {"name": "new"}])
+            db.session.execute(
+                insert(Movie),
+                [{"title": f"Movie {i}", "omdb_id": f"tt{i:07d}"} for i in range(args.n)],
+            )
+            db.session.commit()
+            movie_ids = db.session.scalars(select(Movie.id)).all()
+
+            counter = {"statements": 0}
+
+            @event.listens_for(db.engine, "before_cursor_execute")
+            def count(*_):
+                counter["statements"] += 1
+
+            print(f"{'pattern':24} {'case':8} {'stmts/op':>9} {'us/op':>9}")
+            for name, fn, user_id in (
+                ("SELECT then INSERT", select_then_insert, 1),
+                ("get_or_create", upsert, 2),
+            ):
+                for case in ("new", "existing"):
+                    per_op, micros = run(fn, user_id, movie_ids, counter)
+                    print(f"{name:24} {case:8} {per_op:9.2f} {micros:9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Check that importing the application stays within its start-up budget.
+
+Runs ``python -X importtime -c "import app"`` in a fresh interpreter, sums
+the cumulative time of the top-level imports and fails if it exceeds the
+budget or if a module that must be imported lazily shows up.
+
+Usage:
+    python scripts/check_import_time.py [--budget-ms 1000] [--top 10]
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+# imported on first use; importing them at start-up is a regression
+LAZY_MODULES = ("cloudinary", "requests", "PIL")
+LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def measure(module="app", runs=3):
+    """Import ``module`` in fresh interpreters and return the fastest run.
+
+    Returns:
+        tuple: ``(total_us, {module: cumulative_us})`` of the fastest run.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    best = None
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=root,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        modules, total = {}, 0
+        for match in LINE.finditer(result.stderr):
+            cumulative, indent, name = int(match[2]), match[3], match[4]
+            modules[name] = cumulative
+            if len(indent) == 1:  # top-level import
+                total += cumulative
+        if best is None or total < best[0]:
+            best = (total, modules)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        default=float(os.environ.get("IMPORT_TIME_BUDGET_MS", 1000)),
+    )
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    total, modules = measure()
+    print(f"import app: {total / 1000:.1f} ms (budget {args.budget_ms:.0f} ms)")
+    for name, cumulative in sorted(modules.items(), key=lambda m: -m[1])[: args.top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+    failures = [f"{name} is imported at start-up" for name in LAZY_MODULES if name in modules]
+    if total / 1000 > args.budget_ms:
+        failures.append(f"import time {total / 1000:.1f} ms exceeds {args.budget_ms:.0f} ms")
+    for failure in failures:
+        print(f"❌ {failure}")
+    if failures:
+        sys.exit(1)
+    print("✅ Import time within budget.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""Check that per-request memory stays bounded as the catalogue grows.
+
+Builds scratch databases of increasing catalogue size (synthetic movies
+with plots and genres, and one user whose list has a fixed length) and
+measures each route's tracemalloc peak (``MEMORY_PROFILING``). Routes whose
+output does not depend on the catalogue size (a user's list, one page of
+``/all-movies``) fail if their peak grows by more than ``--tolerance``;
+the unpaged ``/all-movies`` fails if it needs more than
+``--per-movie-budget`` bytes per movie.
+
+Usage:
+    python scripts/check_memory.py [--sizes 1000,8000] [--tolerance 0.25]
+        [--per-movie-budget 2048]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert  # noqa: E402
+
+from app import create_app  # noqa: E402
+from models import db, Genre, Movie, User, UserMovie, movie_genre  # noqa: E402
+
+LIST_LENGTH = 50
+# route -> output independent of the catalogue size
+ROUTES = {
+    "/api/users/1/movies": True,
+    "/my-movies": True,
+    "/all-movies?per_page=24": True,
+    "/all-movies": False,
+}
+# allocator noise allowed on top of the relative tolerance
+SLACK = 64 * 1024
+
+
+def fill(n):
+    rng = random.Random(42)
+    db.session.execute(
+        insert(Genre), [{"id": i, "name": f"Genre {i}"} for i in range(1, 21)]
+    )
+    db.session.execute(
+        insert(Movie),
+        [
+            {
+                "id": i,
+                "title": f"Movie {i:06d}",
+                "director": f"Director {rng.randrange(500)}",
+                "year": rng.randrange(1920, 2025),
+                "omdb_id": f"tt{i:08d}",
+                "plot_short": " ".join(["plot"] * rng.randrange(20, 60)),
+                "imdb_rating": f"{rng.uniform(1, 10):.1f}",
+                "poster_url": f"https://img.example/{i}.jpg",
+            }
+            for i in range(1, n + 1)
+        ],
+    )
+    db.session.execute(
+        insert(movie_genre),
+        [
+            {"movie_id": i, "genre_id": g}
+            for i in range(1, n + 1)
+            for g in rng.sample(range(1, 21), 2)
+        ],
+    )
+    db.session.execute(insert(User), [{"id": 1, "name": "Memory"}])
+    db.session.execute(
+        insert(UserMovie),
+        [
+            {"user_id": 1, "movie_id": m, "watched": m % 2 == 0}
+            for m in rng.sample(range(1, n + 1), LIST_LENGTH)
+        ],
+    )
+    db.session.commit()
+
+
+def measure(n, repeat):
+    """Return ``{route: median peak bytes}`` for a catalogue of ``n`` movies."""
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{tmp}/memory.db"
+        # the app expects an initialised database (flask init-db)
+        engine = create_engine(url)
+        db.metadata.create_all(engine)
+        engine.dispose()
+        app = create_app(
+            {
+                "TESTING": True,
+                "SQLALCHEMY_DATABASE_URI": url,
+                "MEMORY_PROFILING": True,
+                "TEMPLATE_CACHE_DIR": None,
+                "CATALOGUE_SNAPSHOT": False,
+                # measure building the lists, not serving them from cache
+                "USER_LIST_CACHE_BYTES": 0,
+            }
+        )
+        with app.app_context():
+            fill(n)
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session["user_id"] = 1
+        peaks = {}
+        for route in ROUTES:
+            client.get(route)  # warm-up: compiled templates, statement cache
+            samples = []
+            for _ in range(repeat):
+                response = client.get(route)
+                assert response.status_code == 200, (route, response.status_code)
+                samples.append(int(response.headers["X-Memory-Peak"]))
+            peaks[route] = statistics.median(samples)
+        with app.app_context():
+            db.engine.dispose()
+        return peaks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,8000")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--per-movie-budget", type=int, default=2048)
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    results = {n: measure(n, args.repeat) for n in sizes}
+    print(f"{'route':26}" + "".join(f"{n:>10} movies" for n in sizes))
+    for route in ROUTES:
+        print(
+            f"{route:26}"
+            + "".join(f"{results[n][route] / 1024:12.1f} KiB" for n in sizes)
+        )
+
+    failures = []
+    smallest, largest = sizes[0], sizes[-1]
+    for route, bounded in ROUTES.items():
+        peak = results[largest][route]
+        if bounded:
+            limit = results[smallest][route] * (1 + args.tolerance) + SLACK
+            if peak > limit:
+                failures.append(
+                    f"{route} peaks at {peak / 1024:.0f} KiB with {largest} movies, "
+                    f"over {limit / 1024:.0f} KiB ({smallest} movies + "
+                    f"{args.tolerance:.0%})"
+                )
+        elif peak / largest > args.per_movie_budget:
+            failures.append(
+                f"{route} needs {peak / largest:.0f} bytes per movie, "
+                f"over {args.per_movie_budget}"
+            )
+    for failure in failures:
+        print(f"❌ {failure}")
+    if failures:
+        sys.exit(1)
+    print("✅ Per-request memory stays bounded.")
+
+
+if __name__ == "__main__":
+    main()
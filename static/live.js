@@ -0,0 +1,154 @@
+// Partial updates: forms marked with data-partial are posted with fetch and
+// the page is patched from the JSON answer instead of being reloaded, and
+// the "My Movies" page follows the user's list over Server-Sent Events.
+(function () {
+  "use strict";
+
+  // --- Flash messages ---
+  function showMessages(messages) {
+    if (!messages || !messages.length) return;
+    let container = document.querySelector(".flash-messages");
+    if (!container) {
+      container = document.createElement("div");
+      container.className = "flash-messages";
+      document.querySelector("main").prepend(container);
+    }
+    messages.forEach(function (item) {
+      const alert = document.createElement("div");
+      alert.className = "alert alert-" + item.category;
+      alert.textContent = item.message;
+      container.appendChild(alert);
+      setTimeout(function () {
+        alert.classList.add("fade-out");
+      }, 3000);
+    });
+  }
+
+  // --- List page cards ---
+  function cardFor(movieId) {
+    return document.querySelector('.card[data-movie-id="' + movieId + '"]');
+  }
+
+  function fragment(html) {
+    const template = document.createElement("template");
+    template.innerHTML = html.trim();
+    return template.content.firstElementChild;
+  }
+
+  function updateEmptyMessage(list) {
+    const empty = list.querySelector(".empty-list-message");
+    if (empty) empty.hidden = list.querySelector(".card") !== null;
+  }
+
+  // whether a card with this watched state belongs on the page as filtered
+  function matchesFilter(list, watched) {
+    const filter = list.dataset.filterWatched;
+    return (
+      filter === "all" ||
+      (filter === "watched" && watched) ||
+      (filter === "unwatched" && !watched)
+    );
+  }
+
+  function putCard(list, data, added) {
+    const existing = cardFor(data.movie_id);
+    if (!matchesFilter(list, data.watched)) {
+      if (existing) existing.remove();
+    } else if (existing) {
+      existing.replaceWith(fragment(data.html));
+    } else if (added && list.dataset.filtered !== "true") {
+      // genre filters cannot be checked here; the card shows on reload
+      list.querySelector(".card-grid").appendChild(fragment(data.html));
+    }
+    updateEmptyMessage(list);
+  }
+
+  function followList(list) {
+    if (!window.EventSource) return;
+    const url = new URL(list.dataset.liveUrl, window.location.href);
+    url.searchParams.set("since", list.dataset.liveSince);
+    const source = new EventSource(url);
+    source.addEventListener("card-added", function (event) {
+      putCard(list, JSON.parse(event.data), true);
+    });
+    source.addEventListener("watched-changed", function (event) {
+      putCard(list, JSON.parse(event.data), false);
+    });
+    source.addEventListener("card-removed", function (event) {
+      const card = cardFor(JSON.parse(event.data).movie_id);
+      if (card) card.remove();
+      updateEmptyMessage(list);
+    });
+  }
+
+  // --- Form actions ---
+  const handlers = {
+    watched: function (form, result) {
+      const button = form.querySelector("button");
+      button.classList.toggle("button-watched", result.watched);
+      button.classList.toggle("button-not-watched", !result.watched);
+      button.textContent = result.watched
+        ? "Mark as Not Watched"
+        : "Mark as Watched";
+    },
+    remove: function (form) {
+      // the list-only buttons no longer apply
+      document
+        .querySelectorAll('form[data-partial="watched"], form[data-partial="remove"]')
+        .forEach(function (element) {
+          element.remove();
+        });
+    },
+    genres: function (form, result) {
+      const names = result.genres.map(function (genre) {
+        return genre.name;
+      });
+      document.getElementById("movie-genres").textContent = names.length
+        ? names.join(", ")
+        : "None assigned";
+    },
+    add: function (form) {
+      form.querySelectorAll("button").forEach(function (button) {
+        button.disabled = true;
+      });
+      form.closest("li").classList.add("added");
+    },
+  };
+
+  document.addEventListener("submit", async function (event) {
+    const form = event.target.closest("form[data-partial]");
+    if (!form || !window.fetch) return;
+    event.preventDefault();
+    let response;
+    try {
+      response = await fetch(form.action, {
+        method: "POST",
+        body: new FormData(form),
+        headers: { Accept: "application/json" },
+        credentials: "same-origin",
+      });
+    } catch (error) {
+      // network trouble: fall back to a normal post
+      form.submit();
+      return;
+    }
+    const type = response.headers.get("Content-Type") || "";
+    if (!type.startsWith("application/json")) {
+      form.submit();
+      return;
+    }
+    const result = await response.json();
+    showMessages(result.messages);
+    if (response.ok && handlers[form.dataset.partial]) {
+      handlers[form.dataset.partial](form, result);
+    }
+  });
+
+  document.addEventListener("DOMContentLoaded", function () {
+    const list = document.querySelector("[data-live-url]");
+    if (list) {
+      updateEmptyMessage(list);
+      followList(list);
+    }
+  });
+})();
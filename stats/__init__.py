@@ -0,0 +1,7 @@
+from .rollups import (
+    check_rollups,
+    ensure_rollups,
+    global_stats,
+    rebuild_rollups,
+    user_stats,
+)
@@ -0,0 +1,431 @@
+"""Incrementally maintained statistics rollups.
+
+The rollup tables in :mod:`models.stats` are adjusted from the change
+handler below on every flush, so reading statistics never needs a GROUP BY
+over ``user_movies``/``movies``/``movie_genre``. :func:`rebuild_rollups`
+recomputes everything from the base tables and :func:`check_rollups`
+reports drift without writing.
+
+With tenant sharding, the catalogue-wide figures (movie and rating counts
+in ``stats_global``, and ``stats_genres``) are kept in the catalogue
+database only, whichever tenant writes the movie, and read from there;
+each tenant's rollups hold its users and lists.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, delete, desc, func, insert, inspect, select, update
+
+from models import (
+    db,
+    Genre,
+    Movie,
+    User,
+    UserMovie,
+    GlobalStats,
+    UserStats,
+    GenreStats,
+    WeeklyAdditions,
+    catalogue_table,
+    current_tenant,
+    movie_genre,
+    on_change,
+)
+
+GLOBAL_ID = 1
+
+ROLLUP_TABLES = (
+    GlobalStats.__table__,
+    UserStats.__table__,
+    GenreStats.__table__,
+    WeeklyAdditions.__table__,
+)
+
+
+def parse_rating(value):
+    """Convert an OMDb rating string ("7.3", "N/A", None) to a float or None."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def week_start(value):
+    """Return the Monday of the week containing ``value``."""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if isinstance(value, datetime):
+        value = value.date()
+    return value - timedelta(days=value.weekday())
+
+
+def _rating_deltas(rating, sign):
+    if rating is None:
+        return 0, 0.0
+    return sign, sign * rating
+
+
+def _bump(connection, table, key, create=False, **deltas):
+    """Add ``deltas`` to the rollup row identified by ``key``.
+
+    A missing row is only created when ``create`` is set, so decrements
+    against rows that were never counted are ignored rather than going
+    negative.
+    """
+    deltas = {col: d for col, d in deltas.items() if d}
+    if not deltas:
+        return
+    where = and_(*(table.c[col] == val for col, val in key.items()))
+    result = connection.execute(
+        update(table).where(where).values(
+            {col: table.c[col] + d for col, d in deltas.items()}))
+    if result.rowcount == 0 and create:
+        connection.execute(insert(table).values(**key, **deltas))
+
+
+def _movie_ratings(connection, movie_ids, changes):
+    """Ratings for ``movie_ids``, preferring values carried by the changes.
+
+    Rows deleted in the same flush are already gone from the database, so
+    their rating can only be recovered from the change itself.
+    """
+    ratings = {}
+    for change in changes:
+        if change.table == 'movies':
+            row = change.old if change.op == 'delete' else change.new
+            if row and 'imdb_rating' in row:
+                ratings[change.key[0]] = parse_rating(row['imdb_rating'])
+    missing = set(movie_ids) - set(ratings)
+    if missing:
+        rows = connection.execute(
+            select(Movie.id, Movie.imdb_rating).where(Movie.id.in_(missing)))
+        for movie_id, rating in rows:
+            ratings[movie_id] = parse_rating(rating)
+    return ratings
+
+
+@on_change
+def apply_changes(connection, changes):
+    """Fold a batch of row changes into the rollup tables."""
+    g = GlobalStats.__table__
+    u = UserStats.__table__
+    gs = GenreStats.__table__
+    w = WeeklyAdditions.__table__
+    glob = {'id': GLOBAL_ID}
+    # catalogue-wide figures live with the catalogue (see module docstring)
+    catalogue_g = catalogue_table(g, connection)
+    catalogue_gs = catalogue_table(gs, connection)
+
+    list_movie_ids = [c.key[1] for c in changes if c.table == 'user_movies']
+    ratings = (_movie_ratings(connection, list_movie_ids, changes)
+               if list_movie_ids else {})
+    deleted_users = []
+
+    for change in changes:
+        op, table = change.op, change.table
+        sign = -1 if op == 'delete' else 1
+
+        if table == 'users':
+            if op == 'insert':
+                _bump(connection, g, glob, create=True, user_count=1)
+            elif op == 'delete':
+                _bump(connection, g, glob, user_count=-1)
+                deleted_users.append(change.key[0])
+
+        elif table == 'movies':
+            if op in ('insert', 'delete'):
+                row = change.new or change.old
+                count, total = _rating_deltas(
+                    parse_rating(row.get('imdb_rating')), sign)
+                _bump(connection, catalogue_g, glob, create=(op == 'insert'),
+                      movie_count=sign, rated_movie_count=count,
+                      rating_sum=total)
+            elif 'imdb_rating' in change.new:
+                old_count, old_total = _rating_deltas(
+                    parse_rating(change.old.get('imdb_rating')), -1)
+                new_count, new_total = _rating_deltas(
+                    parse_rating(change.new.get('imdb_rating')), 1)
+                count, total = old_count + new_count, old_total + new_total
+                _bump(connection, catalogue_g, glob, create=True,
+                      rated_movie_count=count, rating_sum=total)
+                if count or total:
+                    # fan the new rating out to every list holding the movie
+                    holders = select(UserMovie.user_id).where(
+                        UserMovie.movie_id == change.key[0])
+                    connection.execute(
+                        update(u).where(u.c.user_id.in_(holders)).values(
+                            rated_count=u.c.rated_count + count,
+                            rating_sum=u.c.rating_sum + total))
+
+        elif table == 'movie_genre':
+            _bump(connection, catalogue_gs, {'genre_id': change.key[1]},
+                  create=(op == 'insert'), movie_count=sign)
+
+        elif table == 'user_movies':
+            user_id, movie_id = change.key
+            if op in ('insert', 'delete'):
+                row = change.new or change.old
+                watched = sign if row.get('watched') else 0
+                count, total = _rating_deltas(ratings.get(movie_id), sign)
+                create = op == 'insert'
+                _bump(connection, u, {'user_id': user_id}, create=create,
+                      movie_count=sign, watched_count=watched,
+                      rated_count=count, rating_sum=total)
+                _bump(connection, g, glob, create=create,
+                      list_count=sign, watched_count=watched)
+                if row.get('added_on'):
+                    _bump(connection, w,
+                          {'user_id': user_id,
+                           'week_start': week_start(row['added_on'])},
+                          create=create, count=sign)
+            elif 'watched' in change.new:
+                was = bool(change.old.get('watched'))
+                now = bool(change.new.get('watched'))
+                if was != now:
+                    delta = 1 if now else -1
+                    _bump(connection, u, {'user_id': user_id},
+                          create=True, watched_count=delta)
+                    _bump(connection, g, glob, create=True,
+                          watched_count=delta)
+
+    # drop per-user rows last so cascaded list deletions above find them
+    if deleted_users:
+        connection.execute(delete(u).where(u.c.user_id.in_(deleted_users)))
+        connection.execute(delete(w).where(w.c.user_id.in_(deleted_users)))
+
+
+def compute_rollups(session=None):
+    """Recompute every rollup row from the base tables.
+
+    In a tenant, the catalogue-wide figures are left at zero: they are
+    kept in the catalogue database.
+
+    Returns:
+        dict: Table name mapped to a list of row dicts.
+    """
+    session = session or db.session
+    glob = dict(id=GLOBAL_ID, user_count=0, movie_count=0,
+                rated_movie_count=0, rating_sum=0.0, list_count=0,
+                watched_count=0)
+    glob['user_count'] = session.execute(
+        select(func.count()).select_from(User)).scalar()
+
+    in_tenant = current_tenant() is not None
+    ratings = {}
+    for movie_id, rating in session.execute(
+            select(Movie.id, Movie.imdb_rating)):
+        rating = parse_rating(rating)
+        ratings[movie_id] = rating
+        if in_tenant:
+            continue
+        glob['movie_count'] += 1
+        if rating is not None:
+            glob['rated_movie_count'] += 1
+            glob['rating_sum'] += rating
+
+    users = {}
+    weekly = defaultdict(int)
+    for user_id, movie_id, watched, added_on in session.execute(
+            select(UserMovie.user_id, UserMovie.movie_id,
+                   UserMovie.watched, UserMovie.added_on)):
+        row = users.setdefault(user_id, dict(
+            user_id=user_id, movie_count=0, watched_count=0,
+            rated_count=0, rating_sum=0.0))
+        row['movie_count'] += 1
+        glob['list_count'] += 1
+        if watched:
+            row['watched_count'] += 1
+            glob['watched_count'] += 1
+        rating = ratings.get(movie_id)
+        if rating is not None:
+            row['rated_count'] += 1
+            row['rating_sum'] += rating
+        if added_on:
+            weekly[(user_id, week_start(added_on))] += 1
+
+    genres = [] if in_tenant else [
+        dict(genre_id=genre_id, movie_count=count)
+        for genre_id, count in session.execute(
+            select(movie_genre.c.genre_id, func.count())
+            .group_by(movie_genre.c.genre_id))
+    ]
+
+    return {
+        'stats_global': [glob],
+        'stats_users': list(users.values()),
+        'stats_genres': genres,
+        'stats_weekly_additions': [
+            dict(user_id=user_id, week_start=week, count=count)
+            for (user_id, week), count in weekly.items()
+        ],
+    }
+
+
+def rebuild_rollups(session=None):
+    """Replace the contents of every rollup table with freshly computed rows.
+
+    Returns:
+        dict: Table name mapped to the number of rows written.
+    """
+    session = session or db.session
+    db.metadata.create_all(session.get_bind(), tables=ROLLUP_TABLES)
+    rows = compute_rollups(session)
+    written = {}
+    for table in ROLLUP_TABLES:
+        session.execute(delete(table))
+        if rows[table.name]:
+            session.execute(insert(table), rows[table.name])
+        written[table.name] = len(rows[table.name])
+    session.commit()
+    return written
+
+
+def ensure_rollups(session=None):
+    """Create and backfill the rollup tables if this database lacks them.
+
+    Returns:
+        bool: True if the tables had to be created.
+    """
+    session = session or db.session
+    bind = inspect(session.get_bind())
+    if all(bind.has_table(table.name) for table in ROLLUP_TABLES):
+        return False
+    rebuild_rollups(session)
+    return True
+
+
+def _key_columns(table):
+    return [col.name for col in table.primary_key.columns]
+
+
+def check_rollups(session=None):
+    """Compare stored rollups against a fresh recomputation.
+
+    Returns:
+        list[str]: Human readable descriptions of every mismatching row.
+    """
+    session = session or db.session
+    bind = inspect(session.get_bind())
+    missing = [t.name for t in ROLLUP_TABLES if not bind.has_table(t.name)]
+    if missing:
+        return [f"{name}: table missing, run rebuild-stats" for name in missing]
+    expected = compute_rollups(session)
+    problems = []
+    for table in ROLLUP_TABLES:
+        keys = _key_columns(table)
+        stored = {
+            tuple(row[k] for k in keys): dict(row)
+            for row in session.execute(select(table)).mappings()
+        }
+        fresh = {tuple(row[k] for k in keys): row
+                 for row in expected[table.name]}
+        for key in sorted(set(stored) | set(fresh), key=str):
+            have, want = stored.get(key), fresh.get(key)
+            if have is None:
+                problems.append(f"{table.name} {key}: missing, expected {want}")
+            elif want is None:
+                if any(v for k, v in have.items() if k not in keys):
+                    problems.append(f"{table.name} {key}: unexpected row {have}")
+            else:
+                for col, value in want.items():
+                    if isinstance(value, float):
+                        if abs((have[col] or 0.0) - value) > 1e-6:
+                            problems.append(
+                                f"{table.name} {key}: {col}={have[col]}, "
+                                f"expected {value}")
+                    elif have[col] != value:
+                        problems.append(
+                            f"{table.name} {key}: {col}={have[col]}, "
+                            f"expected {value}")
+    return problems
+
+
+def _ratio(part, whole):
+    return round(part / whole, 3) if whole else None
+
+
+def _average(total, count):
+    return round(total / count, 2) if count else None
+
+
+def global_stats(weeks=12):
+    """Catalogue-wide statistics read from the rollup tables.
+
+    Args:
+        weeks (int): Number of most recent weeks of additions to include.
+
+    Returns:
+        dict: JSON-serialisable statistics.
+    """
+    row = db.session.get(GlobalStats, GLOBAL_ID) or GlobalStats(
+        user_count=0, movie_count=0, rated_movie_count=0, rating_sum=0.0,
+        list_count=0, watched_count=0)
+    catalogue = catalogue_table(GlobalStats.__table__)
+    movies = row
+    if catalogue is not GlobalStats.__table__:
+        movies = db.session.execute(
+            select(catalogue.c.movie_count, catalogue.c.rated_movie_count,
+                   catalogue.c.rating_sum)
+            .where(catalogue.c.id == GLOBAL_ID)).first() or GlobalStats(
+            movie_count=0, rated_movie_count=0, rating_sum=0.0)
+    genre_stats = catalogue_table(GenreStats.__table__)
+    genres = db.session.execute(
+        select(Genre.id, Genre.name,
+               func.coalesce(genre_stats.c.movie_count, 0).label('movies'))
+        .outerjoin(genre_stats, genre_stats.c.genre_id == Genre.id)
+        .order_by(desc('movies'), Genre.name)).all()
+    additions = db.session.execute(
+        select(WeeklyAdditions.week_start, func.sum(WeeklyAdditions.count))
+        .group_by(WeeklyAdditions.week_start)
+        .order_by(WeeklyAdditions.week_start.desc())
+        .limit(weeks)).all()
+    return {
+        "users": row.user_count,
+        "movies": movies.movie_count,
+        "list_entries": row.list_count,
+        "watched": row.watched_count,
+        "watched_ratio": _ratio(row.watched_count, row.list_count),
+        "avg_imdb_rating": _average(movies.rating_sum,
+                                    movies.rated_movie_count),
+        "genres": [
+            {"id": genre_id, "name": name, "movies": count}
+            for genre_id, name, count in genres
+        ],
+        "additions_per_week": [
+            {"week_start": week.isoformat(), "count": count}
+            for week, count in reversed(additions)
+        ],
+    }
+
+
+def user_stats(user_id, weeks=12):
+    """Statistics for one user's list read from the rollup tables.
+
+    Args:
+        user_id (int): ID of the user.
+        weeks (int): Number of most recent weeks of additions to include.
+
+    Returns:
+        dict: JSON-serialisable statistics.
+    """
+    row = db.session.get(UserStats, user_id)
+    movies = row.movie_count if row else 0
+    watched = row.watched_count if row else 0
+    additions = db.session.execute(
+        select(WeeklyAdditions.week_start, WeeklyAdditions.count)
+        .where(WeeklyAdditions.user_id == user_id)
+        .order_by(WeeklyAdditions.week_start.desc())
+        .limit(weeks)).all()
+    return {
+        "user_id": user_id,
+        "movies": movies,
+        "watched": watched,
+        "watched_ratio": _ratio(watched, movies),
+        "avg_imdb_rating": (_average(row.rating_sum, row.rated_count)
+                            if row else None),
+        "additions_per_week": [
+            {"week_start": week.isoformat(), "count": count}
+            for week, count in reversed(additions)
+            if count
+        ],
+    }
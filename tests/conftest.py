@@ -0,0 +1,58 @@
+"""Shared fixtures: apps on scratch SQLite databases.
+
+Every path the app writes to (databases, caches, the local media store,
+tenant files) is under the test's ``tmp_path``; OMDb answers come from the
+(empty) fixtures backend and uploads go to the local Cloudinary stand-in.
+"""
+import os
+import sys
+
+import pytest
+from sqlalchemy import create_engine
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+from models import db  # noqa: E402
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    """Return ``make(config=None)``: a new app on a fresh database."""
+    apps = []
+
+    def make(config=None, database="webflix.db"):
+        url = f"sqlite:///{tmp_path / database}"
+        # the app expects an initialised database (flask init-db)
+        engine = create_engine(url)
+        db.metadata.create_all(engine)
+        engine.dispose()
+        app = create_app(
+            {
+                "TESTING": True,
+                "SQLALCHEMY_DATABASE_URI": url,
+                "TEMPLATE_CACHE_DIR": None,
+                "CATALOGUE_SNAPSHOT": False,
+                "OMDB_BACKEND": "fixtures",
+                "OMDB_FIXTURES_DIR": str(tmp_path / "omdb_fixtures"),
+                "OMDB_CACHE_DIR": str(tmp_path / "omdb_cache"),
+                "OMDB_QUOTA_DB": str(tmp_path / "omdb_quota.db"),
+                "MEDIA_BACKEND": "local",
+                "MEDIA_LOCAL_DIR": str(tmp_path / "media"),
+                "MEDIA_DELETE_WORKER": False,
+                "AVATAR_CACHE_DIR": str(tmp_path / "avatars"),
+                "TENANT_DIR": str(tmp_path / "tenants"),
+                **(config or {}),
+            }
+        )
+        apps.append(app)
+        return app
+
+    yield make
+    for app in apps:
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose()
+            registry = app.extensions.get("tenants")
+            if registry is not None:
+                registry.dispose()
@@ -0,0 +1,52 @@
+"""Admission control of the OMDb fallback of title suggestions."""
+import pytest
+
+from web.admission import DEFAULT_RATE_LIMITS
+
+
+@pytest.fixture
+def suggest_app(make_app):
+    app = make_app(
+        {"ADMISSION_RATE_LIMITS": {**DEFAULT_RATE_LIMITS, "omdb_suggest": (2, 60)}}
+    )
+    searches = []
+
+    def search(title, priority="interactive"):
+        searches.append(title)
+        return [{"imdbID": "tt0000001", "Title": "Xanadu", "Year": "1980"}]
+
+    app.extensions["omdb"].search = search
+    return app, searches
+
+
+def _sources(client):
+    response = client.get("/api/movies/suggest?q=xan")
+    assert response.status_code == 200
+    return [s["source"] for s in response.get_json()["suggestions"]]
+
+
+def test_suggest_skips_omdb_over_the_users_rate_limit(suggest_app):
+    app, searches = suggest_app
+    client = app.test_client()
+    assert _sources(client) == ["omdb"]
+    assert _sources(client) == ["omdb"]
+    # over the limit: local suggestions only, not a 429
+    assert _sources(client) == []
+    assert len(searches) == 2
+    status = client.get("/api/debug/admission").get_json()
+    assert status["rate_limited"] == {"omdb_suggest": 1}
+
+
+def test_suggest_skips_omdb_without_a_free_slot(suggest_app):
+    app, searches = suggest_app
+    omdb = app.extensions["admission"].classes["omdb"]
+    for _ in range(omdb.concurrency):
+        assert omdb.acquire()
+    try:
+        assert _sources(app.test_client()) == []
+    finally:
+        for _ in range(omdb.concurrency):
+            omdb.release()
+    assert searches == []
+    assert _sources(app.test_client()) == ["omdb"]
+    assert omdb.active == 0
@@ -0,0 +1,171 @@
+"""Profile picture uploads, against the local Cloudinary stand-in."""
+import io
+import json
+import os
+
+import pytest
+from sqlalchemy import select
+from werkzeug.datastructures import FileStorage
+
+from media import AvatarError, cached_variant, get_admin_api, get_uploader
+from media import upload_avatar
+from media.avatars import _cache_path
+from media.local import LocalUploader
+from models import db, MediaDeletion, User
+
+Image = pytest.importorskip("PIL.Image")
+
+# EXIF tags: camera make, orientation, GPS block
+MAKE, ORIENTATION, GPS_INFO = 0x010F, 0x0112, 0x8825
+
+
+def _jpeg(size, tags=None):
+    image = Image.new("RGB", size, "navy")
+    exif = Image.Exif()
+    for tag, value in (tags or {}).items():
+        exif[tag] = value
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", exif=exif)
+    return buffer.getvalue()
+
+
+def _file(data, filename="me.jpg"):
+    return FileStorage(stream=io.BytesIO(data), filename=filename)
+
+
+def _open(data):
+    return Image.open(io.BytesIO(data))
+
+
+@pytest.fixture
+def app(make_app):
+    app = make_app()
+    with app.app_context():
+        yield app
+
+
+def test_rejects_files_that_are_not_images(app):
+    with pytest.raises(AvatarError, match="not a readable image"):
+        upload_avatar(_file(b"%PDF-1.7 not a picture"), get_uploader())
+
+
+def test_rejects_oversized_files(app):
+    app.config["AVATAR_MAX_BYTES"] = 1024
+    data = _jpeg((400, 400))
+    assert len(data) > 1024
+    with pytest.raises(AvatarError, match="at most"):
+        upload_avatar(_file(data), get_uploader())
+
+
+def test_rejects_too_many_pixels(app):
+    app.config["AVATAR_MAX_PIXELS"] = 100 * 100
+    with pytest.raises(AvatarError, match="too many pixels"):
+        upload_avatar(_file(_jpeg((101, 100))), get_uploader())
+
+
+def test_rejects_truncated_images(app):
+    with pytest.raises(AvatarError):
+        upload_avatar(_file(_jpeg((300, 200))[:400]), get_uploader())
+
+
+def test_strips_exif_and_applies_orientation(app):
+    uploader = get_uploader()
+    # orientation 6: the camera was turned; shown rotated by 90 degrees
+    data = _jpeg(
+        (300, 200), {MAKE: "Webcam", ORIENTATION: 6, GPS_INFO: {2: (51, 0, 0)}}
+    )
+    assert _open(data).getexif()[MAKE] == "Webcam"
+    url, public_id, _ = upload_avatar(_file(data), uploader)
+    stored = _open(uploader.open_url(url))
+    assert dict(stored.getexif()) == {}
+    assert "exif" not in stored.info
+    assert stored.size == (200, 300)
+    assert public_id.startswith(f"{app.config['MEDIA_FOLDER']}/")
+
+
+def test_bounds_master_and_variant_sizes(app):
+    uploader = get_uploader()
+    url, _, variant_urls = upload_avatar(_file(_jpeg((2400, 1200))), uploader)
+    edge = app.config["AVATAR_MAX_SIZE"]
+    assert _open(uploader.open_url(url)).size == (edge, edge // 2)
+    urls = json.loads(variant_urls)
+    assert set(urls) == {"small", "medium"}
+    for variant, size in (("small", 80), ("medium", 160)):
+        assert f"w_{size},h_{size}" in urls[variant]
+        with open(_cache_path(urls[variant]), "rb") as f:
+            assert _open(f.read()).size == (size, size)
+
+
+def test_keeps_transparency_as_png(app):
+    uploader = get_uploader()
+    buffer = io.BytesIO()
+    Image.new("RGBA", (64, 64), (255, 0, 0, 128)).save(buffer, "PNG")
+    url, _, _ = upload_avatar(_file(buffer.getvalue(), "me.png"), uploader)
+    assert url.endswith(".png")
+    assert _open(uploader.open_url(url)).mode == "RGBA"
+
+
+def test_variant_cache_is_written_and_read(app):
+    uploader = get_uploader()
+    _, public_id, variant_urls = upload_avatar(_file(_jpeg((300, 300))), uploader)
+    small = json.loads(variant_urls)["small"]
+    path = cached_variant(small, uploader)
+    assert path == _cache_path(small)
+    # served from the cache without asking the host
+    uploader.destroy(public_id)
+    assert cached_variant(small, uploader) == path
+    # a miss is fetched from the host and stored
+    os.remove(path)
+    with pytest.raises(FileNotFoundError):
+        cached_variant(small, uploader)
+    _, _, variant_urls = upload_avatar(_file(_jpeg((300, 300))), uploader)
+    medium = json.loads(variant_urls)["medium"]
+    os.remove(_cache_path(medium))
+    path = cached_variant(medium, uploader)
+    with open(path, "rb") as f:
+        assert _open(f.read()).size == (160, 160)
+
+
+def test_avatar_route_serves_cached_variants(make_app):
+    app = make_app()
+    client = app.test_client()
+    response = client.post(
+        "/add_user",
+        data={"name": "Ada", "profile_pic": (io.BytesIO(_jpeg((300, 300))), "a.jpg")},
+        content_type="multipart/form-data",
+    )
+    assert response.status_code == 302
+    response = client.get("/avatars/1/small")
+    assert response.status_code == 200
+    assert _open(response.data).size == (80, 80)
+    assert client.get("/avatars/1/huge").status_code == 404
+
+
+class _NoUrlUploader(LocalUploader):
+    """Stores the upload but answers without a delivery URL."""
+
+    def upload(self, file, **options):
+        result = super().upload(file, **options)
+        del result["secure_url"]
+        return result
+
+
+@pytest.mark.parametrize("route", ["/add_user", "/user/1/update"])
+def test_upload_rejected_after_storing_is_queued_for_deletion(make_app, route):
+    app = make_app()
+    with app.app_context():
+        db.session.add(User(id=1, name="Ada"))
+        db.session.commit()
+        app.extensions["cloudinary"] = _NoUrlUploader(app.config["MEDIA_LOCAL_DIR"])
+    response = app.test_client().post(
+        route,
+        data={"name": "Bea", "profile_pic": (io.BytesIO(_jpeg((300, 300))), "b.jpg")},
+        content_type="multipart/form-data",
+    )
+    assert response.status_code == 302
+    with app.app_context():
+        stored = get_admin_api().resources(prefix="webflix/")["resources"]
+        assert len(stored) == 1
+        queued = db.session.scalars(select(MediaDeletion.public_id)).all()
+        assert queued == [stored[0]["public_id"]]
+        assert User.query.filter_by(name="Bea").count() == 0
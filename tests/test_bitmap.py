@@ -0,0 +1,105 @@
+"""Bitmap set operations, checked against Python sets."""
+import random
+
+import pytest
+
+from indexes.bitmap import ARRAY_MAX, Bitmap
+
+
+def _dense(high, count, rng):
+    """``count`` ids in container ``high`` (an int container past ARRAY_MAX)."""
+    base = high << 16
+    return {base + low for low in rng.sample(range(1 << 16), count)}
+
+
+@pytest.fixture
+def sets():
+    rng = random.Random(7)
+    # sparse, dense and mixed containers, some only on one side
+    a = _dense(0, 6000, rng) | _dense(1, 50, rng) | _dense(3, 5000, rng)
+    b = _dense(0, 300, rng) | _dense(1, 9000, rng) | _dense(2, 10, rng)
+    b |= set(rng.sample(sorted(a), 2000))
+    return a, b
+
+
+def _kinds(bitmap):
+    return {
+        high: "int" if isinstance(c, int) else "array"
+        for high, c in bitmap._containers.items()
+    }
+
+
+def test_matches_python_sets(sets):
+    a, b = sets
+    left, right = Bitmap(a), Bitmap(b)
+    assert _kinds(left) == {0: "int", 1: "array", 3: "int"}
+    assert list(left) == sorted(a)
+    assert len(left) == len(a)
+    assert set(left & right) == a & b
+    assert set(left | right) == a | b
+    assert set(left - right) == a - b
+    assert set(right - left) == b - a
+    # operands are not modified
+    assert set(left) == a and set(right) == b
+
+
+def test_results_use_the_preferred_container(sets):
+    a, b = sets
+    small = Bitmap(sorted(a)[:10])
+    # dense AND sparse is sparse; dense OR anything stays dense
+    assert _kinds(Bitmap(a) & small) == {0: "array"}
+    assert _kinds(Bitmap(a) | small) == {0: "int", 1: "array", 3: "int"}
+    # subtracting almost everything turns a dense container back into an array
+    rest = Bitmap(a) - Bitmap(sorted(a)[10:])
+    assert _kinds(rest) == {0: "array"} and set(rest) == set(sorted(a)[:10])
+
+
+def test_add_and_discard_switch_container_form():
+    bitmap = Bitmap(range(ARRAY_MAX))
+    assert _kinds(bitmap) == {0: "array"}
+    bitmap.add(ARRAY_MAX)
+    assert _kinds(bitmap) == {0: "int"}
+    assert len(bitmap) == ARRAY_MAX + 1
+    bitmap.add(ARRAY_MAX)
+    assert len(bitmap) == ARRAY_MAX + 1
+    bitmap.discard(0)
+    assert _kinds(bitmap) == {0: "array"}
+    assert 0 not in bitmap and ARRAY_MAX in bitmap
+
+
+def test_add_discard_contains_across_containers():
+    bitmap = Bitmap()
+    assert not bitmap
+    for value in (5, 70000, 3, 1 << 33):
+        bitmap.add(value)
+    assert list(bitmap) == [3, 5, 70000, 1 << 33]
+    assert 70000 in bitmap and 70001 not in bitmap and 4 not in bitmap
+    bitmap.discard(70000)
+    bitmap.discard(123456)
+    assert list(bitmap) == [3, 5, 1 << 33]
+    for value in (3, 5, 1 << 33):
+        bitmap.discard(value)
+    assert not bitmap and bitmap._containers == {}
+
+
+def test_shared_containers_are_not_mutated():
+    left = Bitmap([1, 2, 3])
+    union = left | Bitmap([70000])
+    union.add(4)
+    union.discard(1)
+    assert list(left) == [1, 2, 3]
+    assert list(union) == [2, 3, 4, 70000]
+
+
+def test_equality_compares_members():
+    values = list(range(0, 3 * ARRAY_MAX, 3))
+    assert Bitmap(values[::2]) | Bitmap(values[1::2]) == Bitmap(values)
+    assert Bitmap(values) - Bitmap(values[1:]) == Bitmap([0])
+    assert Bitmap([1]) != Bitmap([2])
+    assert Bitmap([1]) != Bitmap([1, 70000])
+    assert Bitmap() == Bitmap([])
+
+
+def test_nbytes():
+    assert Bitmap(range(10)).nbytes() == 20
+    assert Bitmap(range(ARRAY_MAX + 1)).nbytes() == 8192
@@ -0,0 +1,162 @@
+"""The change-data feed: logging, /api/changes and compaction."""
+import json
+import threading
+import time
+from datetime import timedelta
+
+import pytest
+
+from models import db, Movie, User, UserMovie, changes_since, compact_changes
+from models import change_floor, get_or_create
+
+
+@pytest.fixture
+def app(make_app):
+    app = make_app({"CHANGES_POLL_INTERVAL": 0.05, "CHANGES_STREAM_SECONDS": 0.3})
+    with app.app_context():
+        db.session.add_all([User(id=3, name="Ada"), User(id=31, name="Bea")])
+        db.session.add(Movie(id=17, title="Alien", year=1979))
+        db.session.commit()
+    return app
+
+
+def _changes(client, **args):
+    response = client.get("/api/changes", query_string=args)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def test_writes_are_logged_in_order(app):
+    with app.app_context():
+        start = max(entry["seq"] for entry in changes_since(0))
+        movie = db.session.get(Movie, 17)
+        movie.title = "Aliens"
+        get_or_create(
+            UserMovie, ("user_id", "movie_id"), {"user_id": 3, "movie_id": 17}
+        )
+        db.session.commit()
+        db.session.delete(movie)
+        db.session.commit()
+        entries = [(e["op"], e["table"], e["key"]) for e in changes_since(start)]
+        assert entries[:2] == [
+            ("update", "movies", [17]),
+            ("insert", "user_movies", [3, 17]),
+        ]
+        # one flush: the cascaded delete comes in no particular order
+        assert sorted(entries[2:]) == [
+            ("delete", "movies", [17]),
+            ("delete", "user_movies", [3, 17]),
+        ]
+        update, insert, delete = changes_since(start)[:3]
+        assert update["data"] == {"title": "Aliens"}
+        assert insert["data"]["watched"] is False
+        assert delete["data"] is None
+
+
+def test_filters(app):
+    with app.app_context():
+        for user_id in (3, 31):
+            db.session.add(UserMovie(user_id=user_id, movie_id=17))
+        db.session.commit()
+        tables = [e["table"] for e in changes_since(0, tables=["movies"])]
+        assert tables == ["movies"]
+        # [3] and [3, 17], not [31, 17]
+        keys = [e["key"] for e in changes_since(0, key_prefix=(3,))]
+        assert keys == [[3], [3, 17]]
+        assert len(changes_since(0, limit=2)) == 2
+
+
+def test_api_pages_through_the_log(app):
+    client = app.test_client()
+    first = _changes(client, limit=2)
+    assert [e["table"] for e in first["changes"]] == ["users", "users"]
+    assert first["floor"] == 0
+    second = _changes(client, since=first["last_seq"])
+    assert [e["table"] for e in second["changes"]] == ["movies"]
+    assert _changes(client, since=second["last_seq"])["changes"] == []
+    assert _changes(client, tables="movies")["last_seq"] == second["last_seq"]
+
+
+def test_long_poll_returns_when_this_process_commits(app):
+    client = app.test_client()
+    last = _changes(client)["last_seq"]
+
+    def write():
+        time.sleep(0.2)
+        with app.app_context():
+            db.session.add(User(name="Cy"))
+            db.session.commit()
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    started = time.monotonic()
+    result = _changes(client, since=last, wait=5)
+    writer.join()
+    assert [e["data"]["name"] for e in result["changes"]] == ["Cy"]
+    assert time.monotonic() - started < 2
+
+
+def test_stream_sends_entries_with_their_seq_as_id(app):
+    client = app.test_client()
+    response = client.get(
+        "/api/changes", headers={"Last-Event-ID": "2"}, query_string={"stream": 1}
+    )
+    assert response.mimetype == "text/event-stream"
+    body = response.get_data(as_text=True)
+    events = [block for block in body.split("\n\n") if "event: change" in block]
+    assert len(events) == 1
+    assert "id: 3" in events[0]
+    data = next(line for line in events[0].splitlines() if line.startswith("data:"))
+    assert json.loads(data[5:])["table"] == "movies"
+
+
+def test_compaction_collapses_each_rows_entries(app):
+    with app.app_context():
+        movie = db.session.get(Movie, 17)
+        movie.title = "Aliens"
+        db.session.commit()
+        movie.year = 1986
+        db.session.commit()
+        db.session.add(User(id=5, name="Temp"))
+        db.session.commit()
+        db.session.delete(db.session.get(User, 5))
+        db.session.commit()
+        totals = compact_changes(collapse_age=timedelta(0), retain=None)
+        db.session.commit()
+        assert totals == {"collapsed": 3, "truncated": 0, "floor": 0}
+        entries = {(e["table"], e["key"][0]): e for e in changes_since(0)}
+        assert entries["movies", 17]["op"] == "insert"
+        assert entries["movies", 17]["data"]["title"] == "Aliens"
+        assert entries["movies", 17]["data"]["year"] == 1986
+        assert entries["users", 5]["op"] == "delete"
+        assert entries["users", 3]["op"] == "insert"
+
+
+def test_truncation_raises_the_floor(app):
+    client = app.test_client()
+    last = _changes(client)["last_seq"]
+    with app.app_context():
+        totals = compact_changes(collapse_age=None, retain=timedelta(0))
+        db.session.commit()
+        assert totals == {"collapsed": 0, "truncated": 3, "floor": last}
+        assert change_floor() == last
+    # consumers behind the floor must re-read the tables
+    response = client.get("/api/changes", query_string={"since": 1})
+    assert response.status_code == 410
+    assert response.get_json()["floor"] == last
+    result = _changes(client, since=last)
+    assert (result["changes"], result["floor"]) == ([], last)
+    with app.app_context():
+        db.session.add(User(name="Cy"))
+        db.session.commit()
+    assert [e["seq"] for e in _changes(client, since=last)["changes"]] == [last + 1]
+
+
+def test_compact_changes_command(app):
+    result = app.test_cli_runner().invoke(
+        args=["compact-changes", "--collapse-after", "0", "--retain-days", "1e-9"]
+    )
+    assert result.exit_code == 0, result.output
+    assert "dropped 3 change log entries" in result.output
+    with app.app_context():
+        assert changes_since(0) == [] and change_floor() == 3
@@ -0,0 +1,127 @@
+"""The genre index following the change log (CatalogueIndex)."""
+from datetime import timedelta
+
+import pytest
+
+import indexes.tracking
+from indexes import GenreQueryError, get_genre_index
+from models import db, Genre, Movie, compact_changes
+
+
+@pytest.fixture
+def apps(make_app):
+    """This process's app, and another process's on the same database."""
+    app = make_app({"GENRE_INDEX_INTERVAL": 3600})
+    with app.app_context():
+        action, drama, horror = (
+            Genre(id=1, name="Action"),
+            Genre(id=2, name="Drama"),
+            Genre(id=3, name="Horror"),
+        )
+        db.session.add_all(
+            [
+                Movie(id=1, title="Aliens", genres=[action, horror]),
+                Movie(id=2, title="Heat", genres=[action, drama]),
+                Movie(id=3, title="The Shining", genres=[drama, horror]),
+                Movie(id=4, title="Koyaanisqatsi"),
+            ]
+        )
+        db.session.commit()
+    return app, make_app()
+
+
+def _ids(app, query):
+    with app.app_context():
+        return list(get_genre_index().query(query)[0])
+
+
+def _write(app, work):
+    with app.app_context():
+        work()
+        db.session.commit()
+
+
+def test_first_use_rebuilds(apps):
+    app, _ = apps
+    with app.app_context():
+        index = get_genre_index()
+        assert index.refresh() == "rebuilt"
+        assert index.refresh() == "current"
+    assert _ids(app, "Action AND NOT Horror") == [2]
+    assert _ids(app, "(drama OR 3) NOT Action") == [3]
+    assert _ids(app, "NOT (Action OR Drama OR Horror)") == [4]
+    with pytest.raises(GenreQueryError, match="Unknown genre"):
+        _ids(app, "Western")
+
+
+def test_own_writes_are_patched_before_the_next_query(apps):
+    app, _ = apps
+    assert _ids(app, "Drama") == [2, 3]
+
+    def add_genre():
+        movie = db.session.get(Movie, 4)
+        movie.genres.append(db.session.get(Genre, 2))
+
+    _write(app, add_genre)
+    assert _ids(app, "Drama") == [2, 3, 4]
+    _write(app, lambda: db.session.delete(db.session.get(Movie, 3)))
+    assert _ids(app, "Drama OR Horror") == [1, 2, 4]
+    assert _ids(app, "NOT Action") == [4]
+    with app.app_context():
+        status = get_genre_index().status()
+    assert (status["rebuilds"], status["patches"], status["movies"]) == (1, 2, 3)
+
+
+def test_other_processes_writes_are_read_after_the_interval(apps):
+    app, other = apps
+    assert _ids(app, "Horror") == [1, 3]
+
+    def rename():
+        genre, movie = db.session.get(Genre, 3), db.session.get(Movie, 2)
+        genre.name = "Thriller"
+        movie.genres.append(genre)
+
+    _write(other, rename)
+    # not checked again yet
+    assert _ids(app, "Horror") == [1, 3]
+    with app.app_context():
+        index = get_genre_index()
+        index.check_interval = 0
+        assert index.refresh() == "patched"
+    assert _ids(app, "Thriller") == [1, 2, 3]
+    with pytest.raises(GenreQueryError):
+        _ids(app, "Horror")
+
+
+def test_rebuilds_when_too_many_entries_wait(apps, monkeypatch):
+    app, other = apps
+    assert _ids(app, "Action") == [1, 2]
+    monkeypatch.setattr(indexes.tracking, "REBUILD_AFTER", 2)
+
+    def add_movies():
+        action = db.session.get(Genre, 1)
+        for movie_id in (5, 6, 7):
+            db.session.add(Movie(id=movie_id, title=f"M{movie_id}", genres=[action]))
+
+    _write(other, add_movies)
+    with app.app_context():
+        assert get_genre_index().refresh(force=True) == "rebuilt"
+    assert _ids(app, "Action") == [1, 2, 5, 6, 7]
+
+
+def test_rebuilds_when_the_log_is_truncated_past_its_position(apps):
+    app, other = apps
+    assert _ids(app, "Action") == [1, 2]
+    _write(other, lambda: db.session.delete(db.session.get(Movie, 1)))
+    with other.app_context():
+        totals = compact_changes(collapse_age=None, retain=timedelta(0))
+        db.session.commit()
+    assert totals["truncated"] > 0
+    with app.app_context():
+        index = get_genre_index()
+        assert index.seq < totals["floor"]
+        assert index.refresh(force=True) == "rebuilt"
+        assert index.seq == totals["floor"]
+        # the emptied log is not read as being behind again
+        assert index.refresh(force=True) == "current"
+    assert _ids(app, "Action") == [2]
@@ -0,0 +1,16 @@
+"""Run ``scripts/check_import_time.py`` as part of the test suite."""
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_import_time_within_budget():
+    result = subprocess.run(
+        [sys.executable, os.path.join("scripts", "check_import_time.py")],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stdout + result.stderr
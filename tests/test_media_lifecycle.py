@@ -0,0 +1,214 @@
+"""The media deletion queue and the orphan sweeper, against local storage."""
+import io
+import os
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select, update
+
+from media import get_admin_api, purge_deletions, release_upload, sweep_orphans
+from media.lifecycle import RETRY_BASE, RETRY_MAX, deletion_status, retry_delay
+from media.local import LocalUploader
+from models import db, MediaDeletion, User, queue_deletion
+
+# enough of a JPEG for the stand-in, which only checks the signature
+JPEG = b"\xff\xd8\xff\xe0" + bytes(64)
+
+
+class FlakyUploader(LocalUploader):
+    """Fails the first ``failures`` delete_resources calls."""
+
+    def __init__(self, root, failures=1):
+        super().__init__(root)
+        self.failures = failures
+        self.calls = []
+
+    def delete_resources(self, public_ids, **options):
+        self.calls.append(list(public_ids))
+        if len(self.calls) <= self.failures:
+            raise ConnectionError("host unreachable")
+        return super().delete_resources(public_ids, **options)
+
+
+@pytest.fixture
+def app(make_app):
+    app = make_app()
+    with app.app_context():
+        yield app
+
+
+def _upload(api, age=None):
+    public_id = api.upload(io.BytesIO(JPEG), folder="webflix")["public_id"]
+    if age is not None:
+        stamp = time.time() - age.total_seconds()
+        os.utime(api._path(public_id, "jpg"), (stamp, stamp))
+    return public_id
+
+
+def _stored(api):
+    return {r["public_id"] for r in api.resources(prefix="webflix/")["resources"]}
+
+
+def _queued():
+    return set(db.session.scalars(select(MediaDeletion.public_id)))
+
+
+def _flaky(app, failures=1):
+    api = app.extensions["cloudinary"] = FlakyUploader(
+        app.config["MEDIA_LOCAL_DIR"], failures
+    )
+    return api
+
+
+def test_queue_skips_none_and_duplicates(app):
+    assert queue_deletion(["webflix/a", None, "webflix/b"]) == 2
+    db.session.commit()
+    assert queue_deletion(["webflix/a", "webflix/c"]) == 1
+    db.session.commit()
+    assert _queued() == {"webflix/a", "webflix/b", "webflix/c"}
+
+
+def test_purge_deletes_in_batches(app):
+    api = get_admin_api()
+    public_ids = [_upload(api) for _ in range(5)]
+    queue_deletion(public_ids + ["webflix/gone"])
+    db.session.commit()
+    totals = purge_deletions(api, batch_size=2)
+    assert totals == {
+        "deleted": 5,
+        "not_found": 1,
+        "failed": 0,
+        "batches": 3,
+        "next_retry": None,
+    }
+    assert _stored(api) == set()
+    assert _queued() == set()
+
+
+def test_failed_batch_is_retried_with_backoff(app):
+    api = _flaky(app)
+    public_ids = sorted(_upload(api) for _ in range(4))
+    queue_deletion(public_ids)
+    db.session.commit()
+
+    started = datetime.utcnow()
+    totals = purge_deletions(api, batch_size=2)
+    assert (totals["deleted"], totals["failed"], totals["batches"]) == (2, 2, 2)
+    assert api.calls == [public_ids[:2], public_ids[2:]]
+    failed = db.session.scalars(select(MediaDeletion)).all()
+    assert {row.public_id for row in failed} == set(public_ids[:2])
+    for row in failed:
+        assert row.attempts == 1
+        assert "host unreachable" in row.last_error
+        assert row.not_before >= started + RETRY_BASE
+    assert totals["next_retry"] == min(row.not_before for row in failed)
+    assert _stored(api) == set(public_ids[:2])
+
+    # not due yet
+    assert purge_deletions(api)["batches"] == 0
+    db.session.execute(
+        update(MediaDeletion).values(not_before=datetime.utcnow() - timedelta(1))
+    )
+    db.session.commit()
+    totals = purge_deletions(api)
+    assert (totals["deleted"], totals["failed"]) == (2, 0)
+    assert _queued() == set() and _stored(api) == set()
+
+
+def test_retry_delay_doubles_up_to_the_cap():
+    assert [retry_delay(n) for n in (1, 2, 3)] == [
+        RETRY_BASE,
+        RETRY_BASE * 2,
+        RETRY_BASE * 4,
+    ]
+    assert retry_delay(50) == RETRY_MAX
+
+
+def test_gives_up_after_max_attempts(app):
+    api = _flaky(app, failures=10)
+    queue_deletion([_upload(api)])
+    db.session.commit()
+    for _ in range(2):
+        purge_deletions(api, max_attempts=2)
+        db.session.execute(
+            update(MediaDeletion).values(not_before=datetime.utcnow() - timedelta(1))
+        )
+        db.session.commit()
+    totals = purge_deletions(api, max_attempts=2)
+    assert totals["batches"] == 0 and totals["next_retry"] is None
+    status = deletion_status(max_attempts=2)
+    assert status["queued"] == 1 and status["retrying"] == 0
+    assert [row.attempts for row in status["abandoned"]] == [2]
+
+
+def test_worker_drains_the_queue_and_schedules_retries(make_app):
+    app = make_app({"MEDIA_DELETE_WORKER": True})
+    with app.app_context():
+        api = _flaky(app)
+        first, second = _upload(api), _upload(api)
+        # fails: the worker schedules a retry instead of giving up
+        release_upload(first)
+        worker = app.extensions["media_deletions"]
+        deadline = time.monotonic() + 5
+        while worker._timer is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert worker._timer is not None
+        worker._timer.cancel()
+        assert 1 <= worker._timer.interval <= RETRY_BASE.total_seconds()
+        # succeeds
+        release_upload(second)
+        while _queued() != {first} and time.monotonic() < deadline:
+            db.session.rollback()
+            time.sleep(0.01)
+        assert _queued() == {first}
+        assert _stored(api) == {first}
+
+
+def test_sweeper_queues_only_unreferenced_assets(app):
+    api = get_admin_api()
+    old = timedelta(hours=2)
+    referenced, legacy, orphan = _upload(api, old), _upload(api, old), _upload(api, old)
+    recent, queued = _upload(api), _upload(api, old)
+    url = f"{api.base_url}/image/upload/v1/{legacy}.jpg"
+    db.session.add_all(
+        [
+            User(
+                name="Ada",
+                profile_pic_url="https://example.com/ada.jpg",
+                profile_pic_public_id=referenced,
+            ),
+            # stored before public ids were: found from the URL
+            User(name="Bea", profile_pic_url=url),
+        ]
+    )
+    queue_deletion([queued])
+    db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=["sweep-media", "--dry-run"])
+    assert result.exit_code == 0, result.output
+    assert "5 assets in webflix/: 2 in use, 1 already queued" in result.output
+    assert "1 too recent, 1 orphaned" in result.output
+    assert "Would queue 1" in result.output
+    assert _queued() == {queued}
+
+    result = app.test_cli_runner().invoke(args=["sweep-media"])
+    assert result.exit_code == 0, result.output
+    assert orphan in result.output
+    assert _queued() == {queued, orphan}
+    assert User.query.filter_by(name="Bea").one().profile_pic_public_id == legacy
+    assert recent in _stored(api)
+
+    purge_deletions(api)
+    assert _stored(api) == {referenced, legacy, recent}
+
+
+def test_sweeper_sees_missing_assets(app):
+    api = get_admin_api()
+    db.session.add(
+        User(name="Ada", profile_pic_url="x", profile_pic_public_id="webflix/lost")
+    )
+    db.session.commit()
+    totals = sweep_orphans(api, "webflix")
+    assert totals["missing"] == ["webflix/lost"]
+    assert totals["orphans"] == []
@@ -0,0 +1,27 @@
+"""Run ``scripts/check_memory.py`` as part of the test suite.
+
+Smaller catalogues than the script's defaults keep the run short; the
+bounded routes still have to stay flat over an eightfold growth.
+"""
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_per_request_memory_bounded():
+    result = subprocess.run(
+        [
+            sys.executable,
+            os.path.join("scripts", "check_memory.py"),
+            "--sizes",
+            "250,2000",
+            "--repeat",
+            "1",
+        ],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stdout + result.stderr
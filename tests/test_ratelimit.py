@@ -0,0 +1,121 @@
+"""The shared SQLite token bucket and daily quota of OMDb requests."""
+import threading
+
+import pytest
+
+from omdb import QuotaExhausted, RateLimited
+from omdb.ratelimit import RateLimiter
+
+KEY = "secret-api-key"
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "omdb_quota.db")
+
+
+def _take(limiter, priority, count):
+    return [limiter.try_acquire(KEY, priority) for _ in range(count)]
+
+
+def test_burst_then_wait(path):
+    limiter = RateLimiter(path, rate=0.01, burst=3)
+    assert _take(limiter, "interactive", 3) == [0, 0, 0]
+    wait = limiter.try_acquire(KEY)
+    # the next token is about 1 / rate seconds away
+    assert 99 < wait <= 100
+    assert limiter.status(KEY)["used_today"] == 3
+
+
+def test_tokens_refill_at_the_rate(path):
+    limiter = RateLimiter(path, rate=20, burst=1)
+    limiter.acquire(KEY)
+    assert limiter.try_acquire(KEY) > 0
+    # waits for the next token (1/20 s)
+    limiter.acquire(KEY, timeout=1.0)
+    with pytest.raises(RateLimited):
+        limiter.acquire(KEY, timeout=0.0)
+
+
+def test_lower_priorities_leave_part_of_the_burst(path):
+    limiter = RateLimiter(path, rate=0.01, burst=10)
+    # bulk must leave 20% of the bucket, prefetch 40%
+    assert _take(limiter, "prefetch", 6) == [0] * 6
+    assert limiter.try_acquire(KEY, "prefetch") > 0
+    assert _take(limiter, "bulk", 2) == [0, 0]
+    assert limiter.try_acquire(KEY, "bulk") > 0
+    assert _take(limiter, "interactive", 2) == [0, 0]
+    assert limiter.try_acquire(KEY, "interactive") > 0
+
+
+def test_lower_priorities_leave_part_of_the_daily_quota(path):
+    limiter = RateLimiter(path, rate=1000, burst=1000, daily_quota=10)
+    assert _take(limiter, "bulk", 8) == [0] * 8
+    with pytest.raises(QuotaExhausted):
+        limiter.try_acquire(KEY, "bulk")
+    with pytest.raises(QuotaExhausted):
+        limiter.try_acquire(KEY, "prefetch")
+    status = limiter.status(KEY)
+    assert status["remaining_today"] == {"interactive": 2, "bulk": 0, "prefetch": 0}
+    assert _take(limiter, "interactive", 2) == [0, 0]
+    with pytest.raises(QuotaExhausted):
+        limiter.try_acquire(KEY, "interactive")
+    status = limiter.status(KEY)
+    assert (status["used_today"], status["rejected_today"]) == (10, 3)
+
+
+def test_custom_reserves(path):
+    limiter = RateLimiter(
+        path, rate=1000, burst=1000, daily_quota=10, reserves={"bulk": 0.5}
+    )
+    assert _take(limiter, "bulk", 5) == [0] * 5
+    with pytest.raises(QuotaExhausted):
+        limiter.try_acquire(KEY, "bulk")
+
+
+def test_exhaust_stops_every_priority(path):
+    limiter = RateLimiter(path, daily_quota=1000)
+    limiter.exhaust(KEY)
+    for priority in ("interactive", "bulk", "prefetch"):
+        with pytest.raises(QuotaExhausted):
+            limiter.try_acquire(KEY, priority)
+    status = limiter.status(KEY)
+    assert status["exhausted"] is True
+    assert set(status["remaining_today"].values()) == {0}
+    # other keys are unaffected
+    assert limiter.try_acquire("another-key") == 0
+
+
+def test_budget_is_shared_through_the_file(path):
+    first = RateLimiter(path, rate=0.01, burst=2)
+    second = RateLimiter(path, rate=0.01, burst=2)
+    assert first.try_acquire(KEY) == 0
+    assert second.try_acquire(KEY) == 0
+    assert first.try_acquire(KEY) > 0
+    with open(path, "rb") as f:
+        assert KEY.encode() not in f.read()
+
+
+def test_concurrent_limiters_never_overspend(path):
+    admitted, refused = [], []
+    start = threading.Barrier(10)
+
+    def worker():
+        # one limiter (and connection) per thread, as in separate processes
+        limiter = RateLimiter(path, rate=1000, burst=1000, daily_quota=25)
+        start.wait(5)
+        for _ in range(5):
+            try:
+                limiter.acquire(KEY, timeout=1.0)
+            except QuotaExhausted:
+                refused.append(1)
+            else:
+                admitted.append(1)
+
+    threads = [threading.Thread(target=worker) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    assert (len(admitted), len(refused)) == (25, 25)
+    assert RateLimiter(path, daily_quota=25).status(KEY)["used_today"] == 25
@@ -0,0 +1,117 @@
+"""Read-replica routing, with two SQLite files kept in sync."""
+import sqlite3
+import time
+
+import pytest
+
+from models import db, Movie, User, UserMovie, get_router, sync_sqlite_replica
+from models.routing import STICKY_KEY
+
+
+@pytest.fixture
+def replica_app(make_app, tmp_path):
+    primary, replica = tmp_path / "webflix.db", tmp_path / "replica.db"
+
+    def make(**config):
+        app = make_app(
+            {
+                "SQLALCHEMY_REPLICA_URI": f"sqlite:///{replica}",
+                "DB_REPLICA_CHECK_INTERVAL": 0,
+                **config,
+            }
+        )
+        with app.app_context():
+            db.session.add_all(
+                [
+                    User(id=1, name="Ada"),
+                    Movie(id=1, title="Alien", year=1979, omdb_id="tt0078748"),
+                    Movie(id=2, title="Brazil", year=1985, omdb_id="tt0088846"),
+                    UserMovie(user_id=1, movie_id=1),
+                ]
+            )
+            db.session.commit()
+        sync_sqlite_replica(str(primary), str(replica))
+        # a difference only the replica has, to tell which one answered
+        _execute(replica, "UPDATE users SET name = 'Ada (replica)' WHERE id = 1")
+        return app
+
+    return make
+
+
+def _execute(path, sql):
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute(sql)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _user_name(client):
+    return client.get("/api/users").get_json()[0]["name"]
+
+
+def _signed_in(app):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["user_id"] = 1
+    return client
+
+
+def test_get_requests_read_from_replica(replica_app):
+    app = replica_app()
+    client = app.test_client()
+    assert _user_name(client) == "Ada (replica)"
+    with client.session_transaction() as session:
+        assert STICKY_KEY not in session
+
+
+def test_reads_stick_to_primary_after_orm_write(replica_app):
+    app = replica_app()
+    client = _signed_in(app)
+    response = client.post("/user/1/movie/1/toggle-watched")
+    assert response.status_code == 302
+    with client.session_transaction() as session:
+        assert session[STICKY_KEY] > time.time()
+    assert _user_name(client) == "Ada"
+    # other browsers still read from the replica
+    assert _user_name(app.test_client()) == "Ada (replica)"
+
+
+def test_reads_stick_to_primary_after_upsert(replica_app):
+    app = replica_app()
+    client = _signed_in(app)
+    response = client.post("/add_movie/tt0088846", data={"add_to_user": "true"})
+    assert response.status_code == 302
+    with app.app_context():
+        assert UserMovie.query.filter_by(user_id=1, movie_id=2).count() == 1
+    with client.session_transaction() as session:
+        assert session[STICKY_KEY] > time.time()
+    assert _user_name(client) == "Ada"
+    movies = client.get("/api/users/1/movies").get_json()
+    assert sorted(movie["id"] for movie in movies) == [1, 2]
+
+
+def test_lagging_replica_falls_back_to_primary(replica_app):
+    app = replica_app(DB_REPLICA_MAX_LAG=0.05)
+    client = app.test_client()
+    with app.app_context():
+        db.session.add(User(name="Brian"))
+        db.session.commit()
+    # first seen behind: no lag yet
+    assert _user_name(client) == "Ada (replica)"
+    time.sleep(0.1)
+    assert _user_name(client) == "Ada"
+    with app.app_context():
+        assert get_router().status()["healthy"] is False
+
+
+def test_unhealthy_replica_falls_back_to_primary(replica_app, tmp_path):
+    app = replica_app()
+    _execute(tmp_path / "replica.db", "DROP TABLE data_versions")
+    client = app.test_client()
+    assert _user_name(client) == "Ada"
+    with app.app_context():
+        status = get_router().status()
+    assert status["healthy"] is False
+    assert "data_versions" in status["error"]
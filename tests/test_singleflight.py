@@ -0,0 +1,149 @@
+"""Coalescing of identical OMDb lookups: SingleFlight and file_lock."""
+import threading
+import time
+
+import pytest
+
+from omdb import OMDbError
+from omdb.client import OMDbClient
+from omdb.singleflight import SingleFlight, fcntl, file_lock
+
+WAIT = 5
+
+
+def _run_all(target, count):
+    threads = [threading.Thread(target=target) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def _join(threads):
+    for thread in threads:
+        thread.join(WAIT)
+        assert not thread.is_alive()
+
+
+def _coalesced(flight, fn, count=8):
+    """Call ``flight.do("key", fn)`` from ``count`` threads at once."""
+    results, errors = [], []
+    arrived = threading.Barrier(count + 1)
+
+    def call():
+        arrived.wait(WAIT)
+        try:
+            results.append(flight.do("key", fn))
+        except Exception as e:
+            errors.append(e)
+
+    threads = _run_all(call, count)
+    arrived.wait(WAIT)
+    return threads, results, errors
+
+
+def test_concurrent_calls_share_one_execution():
+    flight, release, calls = SingleFlight(), threading.Event(), []
+
+    def fn():
+        calls.append(1)
+        release.wait(WAIT)
+        return {"Response": "True"}
+
+    threads, results, errors = _coalesced(flight, fn)
+    # let every caller reach the in-flight call before it completes
+    time.sleep(0.2)
+    assert flight.in_flight() == ["key"]
+    release.set()
+    _join(threads)
+    assert len(calls) == 1
+    assert len(results) == 8 and not errors
+    assert all(result is results[0] for result in results)
+    assert flight.in_flight() == []
+
+
+def test_followers_get_the_leaders_exception():
+    flight, release = SingleFlight(), threading.Event()
+
+    def fn():
+        release.wait(WAIT)
+        raise OMDbError("Movie not found!")
+
+    threads, results, errors = _coalesced(flight, fn, count=4)
+    time.sleep(0.2)
+    release.set()
+    _join(threads)
+    assert not results
+    assert len(errors) == 4
+    assert all(error is errors[0] for error in errors)
+
+
+def test_finished_calls_are_not_reused():
+    flight, calls = SingleFlight(), []
+    assert flight.do("key", lambda: calls.append(1) or 1) == 1
+    assert flight.do("key", lambda: calls.append(2) or 2) == 2
+    assert calls == [1, 2]
+    with pytest.raises(ValueError):
+        flight.do("key", lambda: int("x"))
+    assert flight.in_flight() == []
+
+
+def test_different_keys_run_independently():
+    flight, release = SingleFlight(), threading.Event()
+    slow = threading.Thread(
+        target=lambda: flight.do("slow", lambda: release.wait(WAIT))
+    )
+    slow.start()
+    try:
+        assert flight.do("fast", lambda: "done") == "done"
+    finally:
+        release.set()
+        slow.join(WAIT)
+
+
+@pytest.mark.skipif(fcntl is None, reason="no flock on this platform")
+def test_file_lock_serialises_one_key(tmp_path):
+    # separate open() calls hold separate flock locks, as processes do
+    order = []
+
+    def other():
+        with file_lock(tmp_path, "i:tt0078748"):
+            order.append("other")
+
+    with file_lock(tmp_path, "i:tt0078748"):
+        thread = threading.Thread(target=other)
+        thread.start()
+        time.sleep(0.2)
+        order.append("first")
+        # another key is not held up
+        with file_lock(tmp_path, "i:tt0088846"):
+            order.append("unrelated")
+    thread.join(WAIT)
+    assert order == ["first", "unrelated", "other"]
+
+
+class CountingBackend:
+    """Answers every lookup after ``delay`` seconds, counting calls."""
+
+    def __init__(self, delay=0.2):
+        self.delay = delay
+        self.calls = []
+
+    def fetch(self, params):
+        self.calls.append(params["i"])
+        time.sleep(self.delay)
+        return {"Response": "True", "imdbID": params["i"], "Title": "Alien"}
+
+
+def test_client_fetches_concurrent_lookups_once(tmp_path):
+    backend = CountingBackend()
+    client = OMDbClient("key", str(tmp_path), backend=backend)
+    results = []
+    threads = _run_all(lambda: results.append(client.details("tt0078748")), 6)
+    _join(threads)
+    assert backend.calls == ["tt0078748"]
+    assert len(results) == 6
+
+    # another process sharing the cache does not go to the network
+    other = OMDbClient("key", str(tmp_path), backend=CountingBackend())
+    assert other.details("tt0078748")["Title"] == "Alien"
+    assert other.backend.calls == []
@@ -0,0 +1,128 @@
+"""Tenant sharding: tenant files that ATTACH the shared catalogue."""
+import sqlite3
+
+import pytest
+
+from models import db, Movie, User, UserMovie, use_tenant
+from models.tenants import TENANT_TABLES
+
+
+@pytest.fixture
+def app(make_app):
+    app = make_app({"TENANT_SHARDING": True})
+    with app.app_context():
+        db.session.add(Movie(id=1, title="Alien", year=1979, omdb_id="tt0078748"))
+        db.session.commit()
+    runner = app.test_cli_runner()
+    for key in ("film-club", "Book-Club"):
+        result = runner.invoke(args=["create-tenant", key])
+        assert result.exit_code == 0, result.output
+    with app.app_context(), use_tenant("film-club"):
+        db.session.add(User(id=1, name="Ada"))
+        db.session.add(UserMovie(user_id=1, movie_id=1))
+        db.session.commit()
+    return app
+
+
+def _rows(app, name, sql):
+    database = "webflix.db" if name is None else f"tenants/{name}.db"
+    path = app.config["SQLALCHEMY_DATABASE_URI"].rsplit("/", 1)[0]
+    conn = sqlite3.connect(f"{path[len('sqlite:///'):]}/{database}")
+    try:
+        return conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+
+
+def _get(client, url, tenant, **kwargs):
+    return client.get(url, headers={"X-Tenant": tenant}, **kwargs)
+
+
+def test_tenant_files_hold_only_tenant_tables(app):
+    tables = _rows(
+        app, "book-club", "SELECT name FROM sqlite_master WHERE type = 'table'"
+    )
+    assert {name for name, in tables} - {"sqlite_sequence"} == set(TENANT_TABLES)
+    result = app.test_cli_runner().invoke(args=["create-tenant", "film-club"])
+    assert "already exists" in result.output
+
+
+def test_user_rows_go_to_the_tenant_file(app):
+    assert _rows(app, "film-club", "SELECT name FROM users") == [("Ada",)]
+    assert _rows(app, "book-club", "SELECT name FROM users") == []
+    assert _rows(app, None, "SELECT name FROM users") == []
+    with app.app_context(), use_tenant("film-club"):
+        # the list joins the attached catalogue
+        user_movie = db.session.get(UserMovie, (1, 1))
+        assert user_movie.movie.title == "Alien"
+
+
+def test_catalogue_writes_from_a_tenant_go_to_the_catalogue(app):
+    with app.app_context(), use_tenant("film-club"):
+        db.session.add(Movie(id=2, title="Brazil", year=1985))
+        db.session.add(UserMovie(user_id=1, movie_id=2))
+        db.session.commit()
+    assert _rows(app, None, "SELECT title FROM movies ORDER BY id") == [
+        ("Alien",),
+        ("Brazil",),
+    ]
+    # each log records the writes to its own database
+    catalogue_log = _rows(app, None, "SELECT table_name, row_key FROM change_log")
+    tenant_log = _rows(app, "film-club", "SELECT table_name, row_key FROM change_log")
+    assert ("movies", "[2]") in catalogue_log
+    assert ("users", "[1]") not in catalogue_log
+    assert sorted(tenant_log) == [
+        ("user_movies", "[1, 1]"),
+        ("user_movies", "[1, 2]"),
+        ("users", "[1]"),
+    ]
+
+
+def test_requests_are_served_from_the_named_tenant(app):
+    client = app.test_client()
+    users = _get(client, "/api/users", "film-club").get_json()
+    assert [user["name"] for user in users] == ["Ada"]
+    assert _get(client, "/api/users", "BOOK-CLUB").get_json() == []
+    movies = _get(client, "/api/users/1/movies", "film-club").get_json()
+    assert [movie["title"] for movie in movies] == ["Alien"]
+    assert _get(client, "/api/users/1/movies", "book-club").status_code == 404
+    assert _get(client, "/api/users", "chess-club").status_code == 404
+    # no header and no TENANT_DEFAULT
+    assert client.get("/api/users").status_code == 404
+
+
+def test_switching_tenant_signs_the_user_out(app):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session.update(user_id=1, tenant="film-club")
+    _get(client, "/api/users", "film-club")
+    with client.session_transaction() as session:
+        assert session["user_id"] == 1
+    _get(client, "/api/users", "book-club")
+    with client.session_transaction() as session:
+        assert "user_id" not in session and session["tenant"] == "book-club"
+
+
+def test_feed_merges_the_catalogue_and_tenant_logs(app):
+    client = app.test_client()
+    feed = _get(client, "/api/changes", "film-club").get_json()
+    entries = [(e["log"], e["table"], e["position"]) for e in feed["changes"]]
+    assert entries == [
+        ("catalogue", "movies", "1:0"),
+        ("tenant", "users", "1:1"),
+        ("tenant", "user_movies", "1:2"),
+    ]
+    assert (feed["last_seq"], feed["floor"]) == ("1:2", "0:0")
+    tables = _get(
+        client, "/api/changes", "film-club", query_string={"tables": "users"}
+    ).get_json()
+    assert [e["position"] for e in tables["changes"]] == ["0:1"]
+    after = _get(
+        client, "/api/changes", "film-club", query_string={"since": "1:2"}
+    ).get_json()
+    assert after["changes"] == [] and after["last_seq"] == "1:2"
+    # the other tenant shares the catalogue's entries only
+    other = _get(client, "/api/changes", "book-club").get_json()
+    assert [e["log"] for e in other["changes"]] == ["catalogue"]
+    bad = _get(client, "/api/changes", "film-club", query_string={"since": "12"})
+    assert bad.status_code == 400
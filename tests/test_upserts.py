@@ -0,0 +1,112 @@
+"""get_or_create, and the one movie per title and year it relies on."""
+import re
+import threading
+
+import pytest
+from sqlalchemy import event, text
+
+from datamanager.sqlite_data_manager import SQLiteDataManager
+from models import db, Movie, upgrade_schema
+from omdb import movie_fields, upsert_movie
+
+MOVIE_SQL = re.compile(r"\b(FROM|INTO) movies\b")
+
+
+@pytest.fixture
+def app(make_app):
+    app = make_app()
+    with app.app_context():
+        db.session.add(Movie(id=1, title="Alien", year=1979, omdb_id="tt0078748"))
+        db.session.commit()
+    return app
+
+
+@pytest.fixture
+def movie_statements(app):
+    """SQL statements sent to the movies table."""
+    statements = []
+
+    def count(conn, cursor, statement, *_):
+        if MOVIE_SQL.search(statement):
+            statements.append(statement.split()[0])
+
+    with app.app_context():
+        event.listen(db.engine, "before_cursor_execute", count)
+        yield statements
+        event.remove(db.engine, "before_cursor_execute", count)
+
+
+def _titles(title):
+    return db.session.scalars(db.select(Movie.id).filter_by(title=title)).all()
+
+
+def test_add_movie_is_one_statement(app, movie_statements):
+    manager = SQLiteDataManager()
+    movie = manager.add_movie("Koyaanisqatsi", "Godfrey Reggio", None)
+    assert movie_statements == ["INSERT"]
+    movie_statements.clear()
+    # the movie without a year is found again; so is the OMDb import
+    assert manager.add_movie("Koyaanisqatsi", None, None).id == movie.id
+    assert manager.add_movie("Alien", None, 1979).id == 1
+    assert movie_statements == ["INSERT", "SELECT"] * 2
+    assert _titles("Koyaanisqatsi") == [movie.id]
+
+
+def test_concurrent_adds_without_a_year_insert_once(app):
+    start, ids = threading.Barrier(8), []
+
+    def add():
+        with app.app_context():
+            start.wait(5)
+            ids.append(SQLiteDataManager().add_movie("Baraka", None, None).id)
+
+    threads = [threading.Thread(target=add) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    assert len(ids) == 8 and len(set(ids)) == 1
+    with app.app_context():
+        assert _titles("Baraka") == ids[:1]
+
+
+def test_omdb_import_completes_a_movie_entered_by_hand(app):
+    with app.app_context():
+        manual = SQLiteDataManager().add_movie("Brazil", None, 1985)
+        details = {"Title": "Brazil", "Year": "1985", "Director": "Terry Gilliam"}
+        movie, created = upsert_movie(movie_fields("tt0088846", details))
+        db.session.commit()
+        assert (movie.id, created) == (manual.id, False)
+        assert (movie.omdb_id, movie.director) == ("tt0088846", "Terry Gilliam")
+        assert movie.last_refreshed_at is not None
+
+
+def test_omdb_import_clashing_with_another_import(app):
+    with app.app_context():
+        details = {"Title": "Alien", "Year": "1979"}
+        with pytest.raises(ValueError, match="already in the catalogue as tt0078748"):
+            upsert_movie(movie_fields("tt9999999", details))
+        # only the insert was undone
+        movie, created = upsert_movie(
+            movie_fields("tt0088846", {"Title": "Brazil", "Year": "1985"})
+        )
+        db.session.commit()
+        assert created and _titles("Alien") == [1] and _titles("Brazil") == [movie.id]
+
+
+def test_upgrade_replaces_the_partial_index(app):
+    with app.app_context():
+        with db.engine.begin() as conn:
+            conn.execute(text("DROP INDEX uq_movies_title_year"))
+            conn.execute(
+                text(
+                    "CREATE UNIQUE INDEX uq_movies_manual_title_year "
+                    "ON movies (title, year) WHERE omdb_id IS NULL"
+                )
+            )
+        assert upgrade_schema() == [
+            "dropped index uq_movies_manual_title_year",
+            "created index uq_movies_title_year",
+        ]
+        # the expression index is recognised from then on
+        assert upgrade_schema() == []
@@ -0,0 +1,63 @@
+"""Route blueprints and the per-process choice of which ones to serve.
+
+``ENABLED_BLUEPRINTS`` (default: the comma-separated ``WEBFLIX_BLUEPRINTS``
+environment variable, or all of them) selects the blueprints a process
+registers. Modules of disabled blueprints are never imported, so their
+dependencies are never loaded or configured: a read-only catalogue pool run
+with ``WEBFLIX_BLUEPRINTS=catalogue`` sets up neither OMDb nor Cloudinary.
+Templates use ``has_endpoint()`` to hide links this process cannot serve;
+redirects to a disabled blueprint go to the home page instead.
+"""
+
+import importlib
+import os
+
+from flask import current_app, url_for
+
+# blueprint name -> (module defining it, URL prefix)
+BLUEPRINTS = {
+    "catalogue": ("views.catalogue", None),
+    "lists": ("views.lists", None),
+    "users": ("views.users", None),
+    "ingest": ("views.ingest", None),
+    "api": ("api.api", "/api"),
+}
+
+
+def has_endpoint(endpoint):
+    """Return True if this process serves ``endpoint`` (for templates)."""
+    return endpoint in current_app.view_functions
+
+
+def _disabled_endpoint_url(error, endpoint, values):
+    """Redirect to the home page instead of to a disabled blueprint."""
+    blueprint = endpoint.partition(".")[0]
+    if blueprint in BLUEPRINTS and not has_endpoint(endpoint):
+        return url_for("home")
+    return None
+
+
+def register_blueprints(app):
+    """Import and register the blueprints enabled for this process.
+
+    Raises:
+        ValueError: If ``ENABLED_BLUEPRINTS`` names an unknown blueprint.
+    """
+    app.config.setdefault(
+        "ENABLED_BLUEPRINTS",
+        os.environ.get("WEBFLIX_BLUEPRINTS", ",".join(BLUEPRINTS)),
+    )
+    enabled = app.config["ENABLED_BLUEPRINTS"]
+    if isinstance(enabled, str):
+        enabled = [name.strip() for name in enabled.split(",") if name.strip()]
+    unknown = sorted(set(enabled) - set(BLUEPRINTS))
+    if unknown:
+        raise ValueError(f"Unknown blueprints in ENABLED_BLUEPRINTS: {unknown}")
+    app.config["ENABLED_BLUEPRINTS"] = tuple(enabled)
+
+    for name in enabled:
+        module, url_prefix = BLUEPRINTS[name]
+        blueprint = getattr(importlib.import_module(module), name)
+        app.register_blueprint(blueprint, url_prefix=url_prefix)
+    app.add_template_global(has_endpoint)
+    app.url_build_error_handlers.append(_disabled_endpoint_url)
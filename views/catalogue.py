@@ -0,0 +1,242 @@
+"""Catalogue views: browsing, movie details, statistics and curation."""
+
+from flask import (
+    Blueprint,
+    current_app,
+    flash,
+    redirect,
+    render_template,
+    request,
+    session,
+    url_for,
+)
+from indexes import GenreQueryError, get_genre_index, get_snapshot, in_ids
+from models import db, Genre, Movie, UserMovie
+from sqlalchemy import Float, asc, cast, desc, func
+from stats import global_stats, user_stats
+from web import action_response, conditional
+
+catalogue = Blueprint("catalogue", __name__)
+
+
+@catalogue.route("/all-movies")
+@conditional("catalogue", "user:{session_user}")
+def list_all_movies():
+    """List all movies with optional sorting, genre filtering and paging.
+
+    Served from the in-memory catalogue snapshot when it is enabled
+    (``CATALOGUE_SNAPSHOT``), otherwise from the database.
+    """
+    # Get sorting/filtering parameters from query string, with defaults
+    sort_by = request.args.get("sort_by", "title")
+    sort_dir = request.args.get("sort_dir", "asc")
+    # Change filter param to expect genre ID, default to 'all'
+    filter_genre_id = request.args.get("filter_genre_id", "all")
+    # Paging is optional: without per_page every movie is on one page
+    per_page = request.args.get(
+        "per_page", current_app.config.get("MOVIES_PER_PAGE"), type=int
+    )
+    page = max(request.args.get("page", 1, type=int), 1)
+    # Boolean genre query, e.g. "Action AND Sci-Fi NOT Horror"
+    genre_query = request.args.get("genres", "").strip()
+
+    genre_id = None
+    if filter_genre_id != "all":
+        try:
+            genre_id = int(filter_genre_id)
+        except ValueError:
+            flash("Invalid genre selected.", "warning")
+            # Optionally reset filter_genre_id to 'all' or handle error differently
+            filter_genre_id = "all"
+
+    movie_ids = movie_ids_key = None
+    if genre_query:
+        index = get_genre_index()
+        try:
+            movie_ids, genre_query = index.query(genre_query)
+            movie_ids_key = (genre_query, index.seq)
+        except GenreQueryError as e:
+            flash(f"Invalid genre query: {e}", "warning")
+
+    offset = (page - 1) * per_page if per_page else 0
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        movies, total = snapshot.query(
+            genre_id=genre_id,
+            sort_by=sort_by,
+            sort_dir=sort_dir,
+            offset=offset,
+            limit=per_page,
+            movie_ids=movie_ids,
+            movie_ids_key=movie_ids_key,
+        )
+        all_genres = snapshot.genres
+    else:
+        movies, total = _query_movies(
+            genre_id, sort_by, sort_dir, offset, per_page, movie_ids
+        )
+        # Fetch all genres for the dropdown
+        all_genres = Genre.query.order_by(Genre.name).all()
+
+    # Pass current sort/filter values and all genres to template
+    return render_template(
+        "all_movies.html",
+        movies=movies,
+        sort_by=sort_by,
+        sort_dir=sort_dir,
+        filter_genre_id=filter_genre_id,
+        genre_query=genre_query,
+        all_genres=all_genres,
+        page=page,
+        per_page=per_page,
+        pages=-(-total // per_page) if per_page else 1,
+    )
+
+
+def _query_movies(genre_id, sort_by, sort_dir, offset, limit, movie_ids=None):
+    """Return ``(movies, total)`` for one page of the catalogue from the database.
+
+    ``movie_ids`` restricts the result, e.g. to a genre query's matches.
+    """
+    # Base query
+    query = Movie.query
+
+    # Apply genre filter using the relationship
+    if genre_id is not None:
+        # Filter movies that have the selected genre ID in their genres relationship
+        query = query.filter(Movie.genres.any(Genre.id == genre_id))
+    if movie_ids is not None:
+        query = query.filter(in_ids(Movie.id, movie_ids))
+
+    # Determine sort direction
+    direction = asc if sort_dir == "asc" else desc
+
+    # Apply sorting - handle case-insensitivity for text fields
+    if sort_by == "title":
+        query = query.order_by(direction(func.lower(Movie.title)))
+    elif sort_by == "release_date":
+        query = query.order_by(direction(Movie.year))
+    elif sort_by == "rating":
+        # ratings are stored as text ("7.3", "N/A"); compare them as numbers
+        query = query.order_by(direction(cast(Movie.imdb_rating, Float)))
+
+    # The grid shows titles and posters only: plain rows of those columns
+    # take a fraction of the memory of Movie objects in the identity map
+    rows = query.with_entities(Movie.id, Movie.title, Movie.poster_url)
+    if limit is None:
+        movies = rows.all()
+        return movies, len(movies)
+    total = query.order_by(None).count()
+    return rows.offset(offset).limit(limit).all(), total
+
+
+@catalogue.route("/stats")
+def show_stats():
+    """Show catalogue statistics and, if a user is selected, theirs."""
+    user_id = session.get("user_id")
+    return render_template(
+        "stats.html",
+        stats=global_stats(),
+        my_stats=user_stats(user_id) if user_id else None,
+    )
+
+
+# --- Delete Movie Route ---
+@catalogue.route("/movie/<int:movie_id>/delete", methods=["POST"])
+def delete_movie(movie_id):
+    """Delete a movie from the database and all user associations.
+
+    Args:
+        movie_id (int): ID of the movie to delete.
+    """
+    movie = Movie.query.get_or_404(movie_id)
+    try:
+        # Get title for flash message
+        movie_title = movie.title
+
+        # Deleting the movie should automatically delete related UserMovie entries
+        # due to cascade='all, delete-orphan' on the relationships.
+        db.session.delete(movie)
+        db.session.commit()
+        flash(
+            f'Movie "{movie_title}" deleted successfully from the main database!',
+            "success",
+        )
+
+    except Exception as e:
+        db.session.rollback()
+        flash(f"Error deleting movie: {str(e)}", "danger")
+
+    # Redirect back to the all movies list
+    return redirect(url_for("catalogue.list_all_movies"))
+
+
+# --- Movie Detail Route ---
+@catalogue.route("/movie/<int:movie_id>")
+@conditional("catalogue", "user:{session_user}")
+def movie_detail(movie_id):
+    """Show the detail page for a single movie.
+
+    Args:
+        movie_id (int): ID of the movie to display.
+    """
+    movie = Movie.query.get_or_404(movie_id)
+    user_movie = None
+    all_genres = Genre.query.order_by(Genre.name).all()
+
+    # Check if a user is logged in
+    user_id = session.get("user_id")
+    if user_id:
+        # Try to find the specific UserMovie association for this user and movie
+        user_movie = UserMovie.query.filter_by(
+            user_id=user_id, movie_id=movie_id
+        ).first()
+
+    # Pass the movie, user_movie, and all genres to the template
+    return render_template(
+        "movie_detail.html",
+        movie=movie,
+        user_movie=user_movie,
+        all_genres=all_genres,
+    )
+
+
+# --- Update Movie Genres Route ---
+@catalogue.route("/movie/<int:movie_id>/update_genres", methods=["POST"])
+def update_movie_genres(movie_id):
+    """Update the genres associated with a movie (max 4).
+
+    Args:
+        movie_id (int): ID of the movie to update genres for.
+    """
+    movie = Movie.query.get_or_404(movie_id)
+    # Get list of selected genre IDs from the form. Use getlist for multi-select.
+    selected_genre_ids = request.form.getlist("genre_ids")
+
+    redirect_url = url_for("catalogue.movie_detail", movie_id=movie_id)
+
+    # Limit to a maximum of 4 genres
+    if len(selected_genre_ids) > 4:
+        flash("You can select a maximum of 4 genres.", "warning")
+        return action_response(redirect_url, status=400)
+
+    try:
+        # Fetch the Genre objects corresponding to the selected IDs
+        selected_genres = Genre.query.filter(Genre.id.in_(selected_genre_ids)).all()
+
+        # Update the movie's genres relationship
+        movie.genres = selected_genres
+
+        db.session.commit()
+        flash("Movie genres updated successfully!", "success")
+
+    except Exception as e:
+        db.session.rollback()
+        flash(f"Error updating genres: {str(e)}", "danger")
+        return action_response(redirect_url, status=500)
+
+    return action_response(
+        redirect_url,
+        movie_id=movie_id,
+        genres=[{"id": genre.id, "name": genre.name} for genre in movie.genres],
+    )
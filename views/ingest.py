@@ -0,0 +1,219 @@
+"""Adding movies to the catalogue from OMDb searches."""
+
+import uuid
+
+from flask import (
+    Blueprint,
+    current_app,
+    flash,
+    redirect,
+    render_template,
+    request,
+    session,
+    url_for,
+)
+from models import db, Movie, User, UserMovie, get_or_create
+from omdb import OMDbError, OMDbUnavailable, QuotaExhausted, RateLimited
+from omdb import get_client, get_prefetcher
+from omdb import init_app as init_omdb
+from omdb import local_search, movie_fields, upsert_movie
+from web import action_response, wants_partial
+
+ingest = Blueprint("ingest", __name__)
+
+
+@ingest.record_once
+def setup(state):
+    """Create the shared OMDb client; warn if no API key is configured."""
+    init_omdb(state.app)
+    if not state.app.config["OMDB_API_KEY"]:
+        print("Warning: OMDB_API_KEY environment variable not set.")
+
+
+@ingest.route("/add-movie-search")
+def add_movie_search_page():
+    """Render the search page for finding and adding movies."""
+    # Determine if the user is logged in to set the context for adding
+    add_to_user = "user_id" in session
+    return render_template("add_movie_search.html", add_to_user=add_to_user)
+
+
+# --- OMDb Movie Search Route ---
+@ingest.route("/search_movies")
+def search_movies():
+    """Search for movies via the OMDb API by title and show results."""
+    search_title = request.args.get("title")
+    # Determine the context (add to user or global) based on who initiated the search
+    # This comes from the dedicated search page's context
+    add_to_user_flag = request.args.get("add_to_user", "false").lower() == "true"
+
+    if not search_title:
+        flash("Please enter a movie title to search.", "warning")
+        # Redirect back to the search page
+        return redirect(url_for("ingest.add_movie_search_page"))
+
+    if not current_app.config["OMDB_API_KEY"]:
+        flash("OMDb API key is not configured. Cannot search for movies.", "danger")
+        # Redirect back to the search page
+        return redirect(url_for("ingest.add_movie_search_page"))
+
+    search_results = []
+    error_message = None
+    try:
+        # Title search ('s' parameter); identical concurrent searches
+        # share one OMDb call and repeat searches are served from cache
+        search_results = get_client().search(search_title)
+        # Fetch details of the top results in the background so the
+        # likely "add" click is served from the cache
+        if current_app.config["OMDB_PREFETCH_TOP_N"]:
+            token = session.setdefault("search_token", uuid.uuid4().hex)
+            get_prefetcher().prefetch(
+                [result.get("imdbID") for result in search_results], token
+            )
+    except (QuotaExhausted, RateLimited) as e:
+        # Out of OMDb budget: fall back to what we already have locally
+        search_results = local_search(search_title)
+        flash(
+            f"{e} Showing matches from the WEBFLIX catalogue instead.",
+            "warning",
+        )
+    except OMDbUnavailable as e:
+        error_message = f"Error connecting to OMDb: {e}"
+    except OMDbError as e:
+        error_message = str(e)
+    except Exception as e:
+        error_message = f"An unexpected error occurred: {e}"
+
+    if error_message:
+        flash(f"OMDb Search Error: {error_message}", "danger")
+        # Redirect back to the search page
+        return redirect(url_for("ingest.add_movie_search_page"))
+
+    # Render the results page, passing the context flag
+    return render_template(
+        "search_results.html",
+        results=search_results,
+        search_title=search_title,
+        add_to_user=add_to_user_flag,
+    )
+
+
+# --- Add Movie Route ---
+# Allow POST requests from the form
+@ingest.route("/add_movie/<imdb_id>", methods=["POST"])
+def add_movie_from_omdb(imdb_id):
+    """Add a movie from OMDb to the database and optionally to the user's list.
+
+    Args:
+        imdb_id (str): IMDb ID of the movie to add.
+    """
+    add_to_user_flag = request.form.get("add_to_user", "false").lower() == "true"
+    current_user_id = session.get("user_id")
+    movie = None
+    new_movie_added = False
+    linked = False
+    # Get original search term for redirection
+    originating_search_title = request.form.get("search_title", "")
+
+    # Determine the redirect URL early based on the context
+    # If adding to user, redirect to user's movies, otherwise to all movies.
+    # Consider redirecting back to search results? For now, stick to lists.
+    if add_to_user_flag and current_user_id:
+        success_redirect_url = url_for("lists.list_my_movies")
+        # Redirect back to search results with the original query on failure/info
+        failure_redirect_url = url_for(
+            "ingest.search_movies", title=originating_search_title, add_to_user="true"
+        )
+    else:
+        success_redirect_url = url_for("catalogue.list_all_movies")
+        # Redirect back to search results with the original query on failure/info
+        failure_redirect_url = url_for(
+            "ingest.search_movies", title=originating_search_title, add_to_user="false"
+        )
+
+    # 1. Check if movie already exists in our DB
+    movie = Movie.query.filter_by(omdb_id=imdb_id).first()
+
+    if not movie:
+        # 2. If not, fetch details from OMDb using IMDb ID ('i' parameter)
+        if not current_app.config["OMDB_API_KEY"]:
+            flash(
+                "OMDb API key is not configured. Cannot add movie details.",
+                "danger",
+            )
+            return action_response(failure_redirect_url, status=503)
+
+        try:
+            # Get short plot ('i' parameter); concurrent adds of the same
+            # title share one OMDb call
+            data = get_client().details(imdb_id)
+
+            # 3. Create the new movie. The insert is idempotent, so a
+            # concurrent add of the same title simply finds the winner's row.
+            movie, new_movie_added = upsert_movie(movie_fields(imdb_id, data))
+            db.session.commit()
+            if new_movie_added:
+                flash(f'Movie "{movie.title}" added to the main database.', "success")
+
+        except OMDbUnavailable as e:
+            db.session.rollback()
+            flash(f"Error connecting to OMDb: {e}", "danger")
+            return action_response(failure_redirect_url, status=502)
+        except OMDbError as e:
+            flash(f"Error fetching details from OMDb: {e}", "danger")
+            return action_response(failure_redirect_url, status=502)
+        except Exception as e:
+            db.session.rollback()
+            flash(f"An unexpected error occurred while adding movie: {e}", "danger")
+            return action_response(failure_redirect_url, status=500)
+    else:
+        # Only flash if we didn't just add it and are trying to add globally
+        if not new_movie_added and not add_to_user_flag:
+            flash(f'Movie "{movie.title}" already exists in the database.', "info")
+
+    # 4. If add_to_user flag is set AND user is logged in, add to user's list
+    if add_to_user_flag:
+        if not current_user_id:
+            flash("You must be logged in to add movies to your list.", "warning")
+            # Redirect to login or user list? Redirecting to failure URL (search results) for now.
+            return action_response(failure_redirect_url, status=401)
+        # Ensure we have a movie object (either found or newly created)
+        elif movie:
+            current_user = User.query.get(current_user_id)
+            if current_user:
+                # Link the movie unless it is already in the list: one
+                # INSERT ... ON CONFLICT DO NOTHING, safe against double clicks
+                try:
+                    _, linked = get_or_create(
+                        UserMovie,
+                        ("user_id", "movie_id"),
+                        {"user_id": current_user_id, "movie_id": movie.id},
+                    )
+                    db.session.commit()
+                except Exception as e:
+                    db.session.rollback()
+                    flash(f"Error adding movie to your list: {e}", "danger")
+                    # Redirect to failure URL on error adding to user list
+                    return action_response(failure_redirect_url, status=500)
+                if linked:
+                    flash(f'Movie "{movie.title}" added to your list.', "success")
+                else:
+                    flash(f'Movie "{movie.title}" is already in your list.', "info")
+            else:
+                # Should not happen if session is valid
+                flash("Current user not found.", "danger")
+                # Redirect back to search on error
+                return action_response(failure_redirect_url, status=404)
+        else:
+            # Should not happen if movie wasn't found/created correctly
+            flash("Could not find or create movie to add to your list.", "danger")
+            # Redirect back to search on error
+            return action_response(failure_redirect_url, status=500)
+
+    # 5. Redirect to the appropriate success page; scripts get the ids and,
+    # when the movie is in the user's list, its card
+    fields = {"movie_id": movie.id, "created": new_movie_added, "linked": linked}
+    if wants_partial() and add_to_user_flag:
+        user_movie = db.session.get(UserMovie, (current_user_id, movie.id))
+        fields["html"] = render_template("_movie_card.html", user_movie=user_movie)
+    return action_response(success_redirect_url, **fields)
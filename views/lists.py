@@ -0,0 +1,300 @@
+"""Personal movie lists: viewing, watched status and removal."""
+
+import time
+
+from flask import (
+    Blueprint,
+    current_app,
+    flash,
+    redirect,
+    render_template,
+    request,
+    session,
+    url_for,
+)
+from indexes import GenreQueryError, cached_user_list, get_genre_index, in_ids
+from indexes import serialize_user_movie
+from models import db, Genre, Movie, User, UserMovie
+from models import change_floor, changes_since, latest_seq
+from sqlalchemy import asc, desc, func
+from sqlalchemy.orm import contains_eager
+from web import action_response, conditional, format_event, sse_response
+
+lists = Blueprint("lists", __name__)
+
+
+@lists.record_once
+def setup(state):
+    """Defaults for the live update stream of the list page."""
+    state.app.config.setdefault("LIVE_UPDATES_POLL_INTERVAL", 0.5)
+    # streams end after this long; EventSource reconnects and resumes
+    state.app.config.setdefault("LIVE_UPDATES_STREAM_SECONDS", 300.0)
+
+
+@lists.route("/my-movies")
+@conditional("catalogue", "user:{session_user}")
+def list_my_movies():
+    """List movies in the current user's personal collection."""
+    user_id = session.get("user_id")
+    if not user_id:
+        flash("Please select a user to see their movies.", "warning")
+        return redirect(url_for("users.list_users"))
+
+    current_user = User.query.get(user_id)
+    if not current_user:
+        flash("Selected user not found.", "danger")
+        session.pop("user_id", None)
+        return redirect(url_for("users.list_users"))
+
+    # Get sorting/filtering parameters, with defaults
+    sort_by = request.args.get("sort_by", "title")
+    sort_dir = request.args.get("sort_dir", "asc")
+    filter_watched = request.args.get("filter_watched", "all")
+    filter_genre_id = request.args.get("filter_genre_id", "all")
+    # Boolean genre query, e.g. "Action AND Sci-Fi NOT Horror"
+    genre_query = request.args.get("genres", "").strip()
+
+    genre_id = None
+    if filter_genre_id != "all":
+        try:
+            genre_id = int(filter_genre_id)
+        except ValueError:
+            flash("Invalid genre selected.", "warning")
+            filter_genre_id = "all"
+
+    def build(genre_query):
+        return _load_list(
+            user_id, sort_by, sort_dir, filter_watched, genre_id, genre_query
+        )
+
+    # Served from the list cache until this list or the catalogue changes
+    filters = ("html", sort_by, sort_dir, filter_watched, genre_id)
+    try:
+        listing = cached_user_list(
+            user_id, (*filters, genre_query), lambda: build(genre_query)
+        )
+    except GenreQueryError as e:
+        flash(f"Invalid genre query: {e}", "warning")
+        listing = cached_user_list(user_id, (*filters, ""), lambda: build(""))
+        listing = dict(listing, genre_query=genre_query)
+
+    if (
+        not listing["movies"]
+        and filter_watched == "all"
+        and not genre_query
+        and sort_by == "title"
+        and sort_dir == "asc"
+    ):
+        # Only show "no movies" if there are truly no movies, not just filtered out
+        flash("No movies found for this user.", "info")
+
+    # Pass current sort/filter values and all genres to template
+    return render_template(
+        "my_movies.html",
+        movies=listing["movies"],
+        user=current_user,
+        sort_by=sort_by,
+        sort_dir=sort_dir,
+        filter_watched=filter_watched,
+        filter_genre_id=filter_genre_id,
+        genre_query=listing["genre_query"],
+        all_genres=listing["genres"],
+        # live updates start after the last change this page includes
+        live_since=latest_seq(),
+    )
+
+
+def _load_list(user_id, sort_by, sort_dir, filter_watched, genre_id, genre_query):
+    """Query one view of a user's list, serialized for the list cache.
+
+    Raises:
+        GenreQueryError: If ``genre_query`` is malformed.
+    """
+    # Base query for UserMovie association objects, joining with Movie
+    query = (
+        UserMovie.query.filter_by(user_id=user_id)
+        .join(Movie)
+        .options(contains_eager(UserMovie.movie))
+    )
+
+    # Apply watched filter
+    if filter_watched == "watched":
+        query = query.filter(UserMovie.watched)
+    elif filter_watched == "unwatched":
+        query = query.filter(~UserMovie.watched)
+
+    # Apply genre filter using the relationship on the joined Movie
+    if genre_id is not None:
+        query = query.filter(Movie.genres.any(Genre.id == genre_id))
+
+    # Evaluate the genre query on the bitmap index, within this user's list
+    if genre_query:
+        movie_ids, genre_query = get_genre_index().query(genre_query, user_id=user_id)
+        query = query.filter(in_ids(UserMovie.movie_id, movie_ids))
+
+    # Determine sort direction
+    direction = asc if sort_dir == "asc" else desc
+
+    # Apply sorting based on Movie attributes
+    if sort_by == "title":
+        query = query.order_by(direction(func.lower(Movie.title)))
+    elif sort_by == "release_date":
+        query = query.order_by(direction(Movie.year))
+    elif sort_by == "rating":
+        query = query.order_by(direction(Movie.imdb_rating))
+    # Sorting by genre name is complex here too.
+
+    return {
+        "movies": [serialize_user_movie(um) for um in query.all()],
+        # canonical form, shown back in the form
+        "genre_query": genre_query,
+        # for the genre dropdown
+        "genres": [
+            {"id": genre.id, "name": genre.name}
+            for genre in Genre.query.order_by(Genre.name)
+        ],
+    }
+
+
+def _card_event(entry):
+    """Turn a ``user_movies`` change log entry into a list page event."""
+    user_id, movie_id = entry["key"]
+    if entry["op"] == "delete":
+        return format_event(
+            {"movie_id": movie_id}, event="card-removed", id=entry["seq"]
+        )
+    if entry["op"] == "update" and "watched" not in entry["data"]:
+        # ratings and other fields are not shown on the card
+        return None
+    user_movie = db.session.get(UserMovie, (user_id, movie_id))
+    if user_movie is None:
+        # removed again later; its delete entry follows
+        return None
+    data = {
+        "movie_id": movie_id,
+        "watched": user_movie.watched,
+        "html": render_template("_movie_card.html", user_movie=user_movie),
+    }
+    event = "card-added" if entry["op"] == "insert" else "watched-changed"
+    return format_event(data, event=event, id=entry["seq"])
+
+
+@lists.route("/my-movies/events")
+def list_events():
+    """Stream changes to the current user's list as Server-Sent Events.
+
+    Events are ``card-added`` and ``watched-changed`` (with the card's HTML)
+    and ``card-removed``, each carrying the ``movie_id``; their ids are
+    change log sequence numbers, so a reconnecting ``EventSource`` resumes
+    where it stopped.
+
+    Query Args:
+        since (int): Sequence number the page was rendered at (the
+            ``Last-Event-ID`` header takes precedence).
+    """
+    user_id = session.get("user_id")
+    if not user_id:
+        # 204 tells EventSource not to reconnect
+        return "", 204
+    config = current_app.config
+    since = request.headers.get("Last-Event-ID", type=int)
+    if since is None:
+        since = request.args.get("since", type=int)
+    if since is None or since < change_floor():
+        # unknown or compacted position: only what happens from now on
+        since = latest_seq()
+    poll = config["LIVE_UPDATES_POLL_INTERVAL"]
+
+    def events():
+        position = since
+        deadline = time.monotonic() + config["LIVE_UPDATES_STREAM_SECONDS"]
+        while time.monotonic() < deadline:
+            entries = changes_since(
+                position,
+                tables=["user_movies"],
+                key_prefix=(user_id,),
+                wait=poll,
+                poll_interval=poll,
+            )
+            if not entries:
+                yield None
+            for entry in entries:
+                position = entry["seq"]
+                yield _card_event(entry)
+            # forget loaded rows so the next batch is read afresh
+            db.session.rollback()
+
+    return sse_response(events())
+
+
+# --- Toggle Watched Status Route ---
+@lists.route(
+    "/user/<int:user_id>/movie/<int:movie_id>/toggle-watched", methods=["POST"]
+)
+def toggle_watched(user_id, movie_id):
+    """Toggle the watched status for a user's movie.
+
+    Args:
+        user_id (int): ID of the user.
+        movie_id (int): ID of the movie.
+    """
+    redirect_url = url_for("lists.list_my_movies", user_id=user_id)
+    user_movie = UserMovie.query.filter_by(user_id=user_id, movie_id=movie_id).first()
+    if user_movie:
+        try:
+            # Toggle the status
+            user_movie.watched = not user_movie.watched
+            db.session.commit()
+            status = "watched" if user_movie.watched else "not watched"
+            flash(f'Movie "{user_movie.movie.title}" marked as {status}.', "success")
+        except Exception as e:
+            db.session.rollback()
+            flash(f"Error updating watched status: {str(e)}", "danger")
+            return action_response(redirect_url, status=500)
+    else:
+        flash("Movie not found in your list.", "warning")
+        return action_response(redirect_url, status=404)
+
+    # Scripts get the new state and the re-rendered card
+    return action_response(
+        redirect_url,
+        movie_id=movie_id,
+        watched=user_movie.watched,
+        html=render_template("_movie_card.html", user_movie=user_movie),
+    )
+
+
+# --- Delete movie from user's list Route ---
+@lists.route("/users/<int:user_id>/movies/<int:movie_id>/delete", methods=["POST"])
+def delete_user_movie(user_id, movie_id):
+    """Remove a movie from a user's list without deleting it globally.
+
+    Args:
+        user_id (int): ID of the user.
+        movie_id (int): ID of the movie to remove.
+    """
+    # Check if the movie is in the user's list
+    user_movie = UserMovie.query.filter_by(user_id=user_id, movie_id=movie_id).first()
+
+    if user_movie:
+        try:
+            # Get movie title for the flash message
+            movie_title = user_movie.movie.title
+
+            # Delete the association
+            db.session.delete(user_movie)
+            db.session.commit()
+
+            flash(f'"{movie_title}" has been removed from your list.', "success")
+        except Exception as e:
+            db.session.rollback()
+            flash(f"Error removing movie from your list: {str(e)}", "danger")
+            return action_response(url_for("lists.list_my_movies"), status=500)
+    else:
+        flash("This movie is not in your list.", "warning")
+        return action_response(url_for("lists.list_my_movies"), status=404)
+
+    # Redirect back to the user's movie list
+    return action_response(
+        url_for("lists.list_my_movies"), movie_id=movie_id, removed=True
+    )
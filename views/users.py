@@ -0,0 +1,266 @@
+"""User management: profiles, avatars and the session user."""
+
+import hashlib
+
+from flask import (
+    Blueprint,
+    abort,
+    flash,
+    redirect,
+    render_template,
+    request,
+    send_file,
+    session,
+    url_for,
+)
+from media import AVATAR_VARIANTS, AvatarError, cached_variant, forget_variants
+from media import get_uploader, sniff, upload_avatar, user_variant_url
+from media import init_app as init_media
+from media import release_upload, user_public_id, wake_deletion_worker
+from models import db, User, queue_deletion
+from web import conditional
+
+ONE_YEAR = 365 * 24 * 3600
+
+users = Blueprint("users", __name__)
+
+
+@users.record_once
+def setup(state):
+    """Read Cloudinary credentials; the SDK is configured on first upload."""
+    init_media(state.app)
+
+
+@users.route("/avatars/<int:user_id>/<variant>")
+def avatar(user_id, variant):
+    """Serve a user's avatar variant from the local cache.
+
+    Args:
+        user_id (int): ID of the user.
+        variant (str): One of ``AVATAR_VARIANTS``, e.g. "small".
+    """
+    if variant not in AVATAR_VARIANTS:
+        abort(404)
+    user = User.query.get_or_404(user_id)
+    url = user_variant_url(user, variant)
+    if url is None:
+        abort(404)
+    try:
+        path = cached_variant(url, get_uploader())
+    except (AvatarError, OSError) as e:
+        print(f"Warning: Could not cache avatar {url}: {e}")
+        # let the browser try the image host itself
+        if url.startswith(("http://", "https://")):
+            return redirect(url)
+        abort(404)
+    with open(path, "rb") as f:
+        _, mimetype = sniff(f.read(16))
+    # links carry a hash of the variant URL, which changes with the picture
+    current = request.args.get("v") == hashlib.sha1(url.encode()).hexdigest()[:12]
+    return send_file(path, mimetype=mimetype, max_age=ONE_YEAR if current else 60)
+
+
+@users.route("/users")
+@conditional("users")
+def list_users():
+    """Display a list of all users."""
+    users = User.query.all()
+    return render_template("users.html", users=users)
+
+
+@users.route("/add_user_form")
+@conditional("users")
+def add_user_form():
+    """Render the form to add a new user."""
+    users = User.query.all()
+    return render_template("add_user.html", users=users)
+
+
+# --- Route to handle user editing ---
+@users.route("/user/<int:user_id>/edit", methods=["GET"])
+def edit_user_form(user_id):
+    """Render the edit form for an existing user.
+
+    Args:
+        user_id (int): ID of the user to edit.
+    """
+    user = User.query.get_or_404(user_id)
+    return render_template("edit_user.html", user=user)
+
+
+# --- Route to handle user update ---
+@users.route("/user/<int:user_id>/update", methods=["POST"])
+def update_user(user_id):
+    """Process the user update form submission.
+
+    Args:
+        user_id (int): ID of the user to update.
+    """
+    user = User.query.get_or_404(user_id)
+    new_name = request.form.get("name")
+    profile_pic_file = request.files.get("profile_pic")
+
+    if not new_name:
+        flash("User name cannot be empty.", "danger")
+        return redirect(url_for("users.edit_user_form", user_id=user_id))
+
+    # Check if name is being changed to one that already exists (excluding the current user)
+    existing_user = User.query.filter(User.name == new_name, User.id != user_id).first()
+    if existing_user:
+        flash(f'Another user with the name "{new_name}" already exists.', "warning")
+        return redirect(url_for("users.edit_user_form", user_id=user_id))
+
+    # Store the old picture for deletion once the change commits
+    old_public_id = user_public_id(user)
+    old_avatar_urls = user.avatar_urls
+    new_public_id = None
+    try:
+        # Handle picture update
+        if profile_pic_file and profile_pic_file.filename != "":
+            # Validate, strip and shrink the picture, then upload that copy
+            user.profile_pic_url, new_public_id, user.avatar_urls = upload_avatar(
+                profile_pic_file, get_uploader()
+            )
+            user.profile_pic_public_id = new_public_id
+            # Deleted from Cloudinary in the background, after the commit
+            queue_deletion([old_public_id])
+
+        # Update name
+        user.name = new_name
+        db.session.commit()
+        if new_public_id:
+            forget_variants(old_avatar_urls)
+            wake_deletion_worker()
+        flash(f'User "{user.name}" updated successfully!', "success")
+
+    except AvatarError as e:
+        db.session.rollback()
+        # Rejected after the upload: nobody references that asset
+        release_upload(e.public_id)
+        flash(f"Profile picture not accepted: {e}", "warning")
+        return redirect(url_for("users.edit_user_form", user_id=user_id))
+    except Exception as e:
+        db.session.rollback()
+        # The new picture is not referenced by anyone
+        release_upload(new_public_id)
+        flash(f"Error updating user: {str(e)}", "danger")
+        # Redirect back to edit form on error
+        return redirect(url_for("users.edit_user_form", user_id=user_id))
+
+    return redirect(url_for("users.list_users"))
+
+
+# --- Route to handle adding a new user ---
+@users.route("/add_user", methods=["POST"])
+def add_user():
+    """Handle creation of a new user from form data."""
+    name = request.form.get("name")
+    profile_pic_file = request.files.get("profile_pic")
+    profile_pic_url = public_id = avatar_urls = None
+
+    if not name:
+        flash("User name is required.", "danger")
+        return redirect(url_for("users.add_user_form"))
+
+    # Check if user already exists
+    existing_user = User.query.filter_by(name=name).first()
+    if existing_user:
+        flash(f'User "{name}" already exists.', "warning")
+        return redirect(url_for("users.add_user_form"))
+
+    try:
+        if profile_pic_file and profile_pic_file.filename != "":
+            # Validate, strip and shrink the picture, then upload that copy
+            # to Cloudinary in the 'webflix' folder
+            profile_pic_url, public_id, avatar_urls = upload_avatar(
+                profile_pic_file, get_uploader()
+            )
+
+        # Create new user
+        new_user = User(
+            name=name,
+            profile_pic_url=profile_pic_url,
+            profile_pic_public_id=public_id,
+            avatar_urls=avatar_urls,
+        )
+        db.session.add(new_user)
+        db.session.commit()
+        flash(f'User "{name}" added successfully!', "success")
+
+    except AvatarError as e:
+        db.session.rollback()
+        # Rejected after the upload: nobody references that asset
+        release_upload(e.public_id)
+        flash(f"Profile picture not accepted: {e}", "warning")
+        return redirect(url_for("users.add_user_form"))
+    except Exception as e:
+        # Rollback in case of error during commit or upload
+        db.session.rollback()
+        release_upload(public_id)
+        flash(f"Error adding user: {str(e)}", "danger")
+
+    return redirect(url_for("users.list_users"))
+
+
+# --- Delete User Route ---
+@users.route("/user/<int:user_id>/delete", methods=["POST"])
+def delete_user(user_id):
+    """Delete a user (and their Cloudinary image), handling session cleanup.
+
+    Args:
+        user_id (int): ID of the user to delete.
+    """
+    user = User.query.get_or_404(user_id)
+    try:
+        # Get name for flash message and picture before deletion
+        user_name = user.name
+        avatar_urls = user.avatar_urls
+
+        # Delete user from DB (cascades should handle UserMovie entries);
+        # the picture is queued for deletion in the same transaction
+        queue_deletion([user_public_id(user)])
+        db.session.delete(user)
+        db.session.commit()
+        forget_variants(avatar_urls)
+        wake_deletion_worker()
+
+        # Clear session if the deleted user was the current user
+        if session.get("user_id") == user_id:
+            session.pop("user_id", None)
+            flash(
+                f'User "{user_name}" deleted. You have been logged out as this user.',
+                "info",
+            )
+        else:
+            flash(f'User "{user_name}" deleted successfully!', "success")
+
+    except Exception as e:
+        db.session.rollback()
+        flash(f"Error deleting user: {str(e)}", "danger")
+
+    return redirect(url_for("users.list_users"))
+
+
+# --- Set User Route ---
+@users.route("/set_user/<int:user_id>")
+def set_user(user_id):
+    """Set the current session user.
+
+    Args:
+        user_id (int): ID of the user to set in session.
+    """
+    user = User.query.get(user_id)
+    if user:
+        session["user_id"] = user_id
+        # flash(f'User set to {user.name}.', 'success')
+    else:
+        flash("User not found.", "danger")
+    return redirect(url_for("users.list_users"))
+
+
+@users.route("/logout")
+def logout():
+    """Log out the current user by clearing session data."""
+    session.pop("user_id", None)
+    flash("You have been logged out.", "info")
+    return redirect(url_for("home"))
@@ -0,0 +1,28 @@
+from .admission import (
+    admission_status,
+    init_app as init_admission,
+    optional_admission,
+)
+from .assets import (
+    build_assets,
+    init_app as init_assets,
+)
+from .compression import init_app as init_compression
+from .conditional import conditional
+from .memory import (
+    init_app as init_memory,
+    memory_profile,
+)
+from .partial import action_response, wants_partial
+from .sse import format_event, sse_response
+from .templating import (
+    compile_templates,
+    init_app as init_templating,
+    template_timings,
+)
+from .warmup import (
+    hot_routes,
+    init_app as init_warmup,
+    warm_up,
+    warm_up_on_start,
+)
@@ -0,0 +1,320 @@
+"""Admission control: concurrency limits per endpoint class, per-user rates.
+
+Every endpoint may belong to a class (``ADMISSION_ROUTES``, endpoint ->
+class name). A class (``ADMISSION_CLASSES``) admits at most
+``concurrency`` of its requests at a time in each worker process; up to
+``queue`` more wait for a slot, for at most ``timeout`` seconds, and any
+request beyond that is answered at once with ``503`` and ``Retry-After``.
+The OMDb-bound routes wait seconds on the network, so without a limit a
+burst of searches occupies every worker thread and cheap reads such as
+``/all-movies`` queue behind them. Endpoints in no class are not limited.
+
+``ADMISSION_RATE_LIMITS`` (endpoint or class name -> ``(requests,
+seconds)``) adds a token bucket per signed-in user, or per client address
+for anonymous requests; a user over the limit gets ``429`` with
+``Retry-After``. An endpoint's own limit replaces its class's.
+
+Work a request can do without, such as the OMDb fallback of
+``/api/movies/suggest`` (taken on keystrokes), goes through
+:func:`optional_admission` instead: it is skipped, not queued or refused,
+when its rule's rate limit is spent or its class has no free slot.
+
+Admitted, queued, rejected and rate-limited counts are kept per process
+(:func:`admission_status`, ``GET /api/debug/admission``).
+"""
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from flask import current_app, g, jsonify, make_response, request, session
+
+from models import current_tenant
+
+log = logging.getLogger(__name__)
+
+DEFAULT_CLASSES = {
+    # OMDb searches and imports: network-bound, seconds each
+    "omdb": {"concurrency": 4, "queue": 8, "timeout": 5.0, "retry_after": 5},
+}
+DEFAULT_ROUTES = {
+    "ingest.search_movies": "omdb",
+    "ingest.add_movie_from_omdb": "omdb",
+    "api.add_favorite_movies": "omdb",
+}
+DEFAULT_RATE_LIMITS = {
+    "omdb": (30, 60),
+    # one call imports a whole list
+    "api.add_favorite_movies": (5, 60),
+    # OMDb fallback of title suggestions (see optional_admission)
+    "omdb_suggest": (20, 60),
+}
+
+
+class EndpointClass:
+    """Concurrency limit with a bounded wait queue for one endpoint class.
+
+    Args:
+        name (str): Class name, e.g. "omdb".
+        concurrency (int): Requests handled at the same time at most.
+        queue (int): Requests waiting for a slot at most; 0 rejects at once.
+        timeout (float): Seconds a queued request waits before rejection.
+        retry_after (int): ``Retry-After`` seconds sent with a rejection.
+    """
+
+    def __init__(self, name, concurrency, queue=0, timeout=0.0, retry_after=1):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue = queue
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.active = self.waiting = 0
+        self.admitted = self.queued = self.rejected = self.timed_out = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, wait=True):
+        """Take a slot, waiting in the queue if there is room.
+
+        Args:
+            wait (bool): False: never queue, take a free slot or none.
+
+        Returns:
+            bool: True if admitted; the caller must :meth:`release` it.
+        """
+        with self._cond:
+            # no overtaking: a free slot goes to the queue first
+            if self.active < self.concurrency and not self.waiting:
+                self.active += 1
+                self.admitted += 1
+                return True
+            if not wait or self.waiting >= self.queue:
+                self.rejected += 1
+                return False
+            self.waiting += 1
+            self.queued += 1
+            deadline = time.monotonic() + self.timeout
+            try:
+                while self.active >= self.concurrency:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timed_out += 1
+                        return False
+                    self._cond.wait(remaining)
+            finally:
+                self.waiting -= 1
+            self.active += 1
+            self.admitted += 1
+            return True
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
+
+    def status(self):
+        with self._cond:
+            return {
+                "class": self.name,
+                "concurrency": self.concurrency,
+                "queue": self.queue,
+                "active": self.active,
+                "waiting": self.waiting,
+                "admitted": self.admitted,
+                "queued": self.queued,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+            }
+
+
+class RateLimiter:
+    """Token buckets per (rule, client), forgetting the least recent clients.
+
+    Args:
+        max_clients (int): Buckets kept at most.
+    """
+
+    def __init__(self, max_clients=10000):
+        self.max_clients = max_clients
+        self._lock = threading.Lock()
+        # (rule, client) -> (tokens, updated_at)
+        self._buckets = OrderedDict()
+
+    def take(self, rule, client, limit, period):
+        """Spend one token of ``client``'s bucket for ``rule``.
+
+        Args:
+            limit (int): Bucket size: requests allowed in a burst.
+            period (float): Seconds in which ``limit`` tokens refill.
+
+        Returns:
+            float: 0 if allowed, else seconds until a token is available.
+        """
+        key = (rule, client)
+        rate = limit / period
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (limit, now))
+            tokens = min(limit, tokens + (now - updated_at) * rate)
+            if tokens >= 1:
+                tokens, wait = tokens - 1, 0.0
+            else:
+                wait = (1 - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+class AdmissionControl:
+    """The endpoint classes and rate limits of one application.
+
+    Args:
+        classes (dict): Class name -> keyword arguments of
+            :class:`EndpointClass`.
+        routes (dict): Endpoint -> class name.
+        rate_limits (dict): Endpoint or class name -> ``(requests, seconds)``.
+    """
+
+    def __init__(self, classes, routes, rate_limits):
+        self.classes = {
+            name: EndpointClass(name, **options) for name, options in classes.items()
+        }
+        self.routes = dict(routes)
+        self.rate_limits = dict(rate_limits)
+        self.limiter = RateLimiter()
+        # rule -> requests refused by it
+        self.rate_limited = {}
+        self._lock = threading.Lock()
+
+    def _rate_wait(self, rule):
+        """Spend a token of the client's ``rule`` bucket; seconds to wait."""
+        if rule not in self.rate_limits:
+            return 0.0
+        limit, period = self.rate_limits[rule]
+        wait = self.limiter.take(rule, _client(), limit, period)
+        if wait:
+            with self._lock:
+                self.rate_limited[rule] = self.rate_limited.get(rule, 0) + 1
+        return wait
+
+    def admit(self, endpoint):
+        """Admit a request for ``endpoint`` or return the rejection response."""
+        name = self.routes.get(endpoint)
+        endpoint_class = self.classes.get(name)
+        rule = endpoint if endpoint in self.rate_limits else name
+        wait = self._rate_wait(rule)
+        if wait:
+            log.info("Rate limited %s for %s", endpoint, _client())
+            return _reject(
+                429, math.ceil(wait), "Too many requests; try again shortly."
+            )
+        if endpoint_class is None:
+            return None
+        if not endpoint_class.acquire():
+            log.info("Rejected %s: %s requests saturated", endpoint, name)
+            return _reject(
+                503, endpoint_class.retry_after, "Server busy; try again shortly."
+            )
+        g.admission_slot = endpoint_class
+        return None
+
+    def admit_optional(self, rule, name):
+        """Return True if optional work may start now, without waiting.
+
+        A True answer holds a slot of class ``name`` (if it exists), which
+        the caller must release.
+        """
+        if self._rate_wait(rule):
+            return False
+        endpoint_class = self.classes.get(name)
+        return endpoint_class is None or endpoint_class.acquire(wait=False)
+
+    def status(self):
+        with self._lock:
+            rate_limited = dict(self.rate_limited)
+        return {
+            "classes": [c.status() for c in self.classes.values()],
+            "rate_limited": rate_limited,
+        }
+
+
+@contextmanager
+def optional_admission(rule, name):
+    """Yield True if optional work of class ``name`` may run now.
+
+    The signed-in user's (or client address's) ``rule`` rate limit is
+    spent and a free slot of ``name`` taken for the block; if either is
+    not available, yields False and the caller skips the work. Always True
+    with admission control disabled.
+    """
+    control = current_app.extensions.get("admission")
+    if control is None:
+        yield True
+        return
+    admitted = control.admit_optional(rule, name)
+    try:
+        yield admitted
+    finally:
+        if admitted and name in control.classes:
+            control.classes[name].release()
+
+
+def _client():
+    # user ids are per tenant
+    user_id = session.get("user_id")
+    if user_id is not None:
+        return (current_tenant(), user_id)
+    return request.remote_addr
+
+
+def _reject(status, retry_after, message):
+    if (
+        request.blueprint == "api"
+        or request.accept_mimetypes.best == "application/json"
+    ):
+        response = jsonify({"error": message})
+    else:
+        response = make_response(message)
+        response.mimetype = "text/plain"
+    response.status_code = status
+    response.headers["Retry-After"] = str(max(1, retry_after))
+    return response
+
+
+def admission_status():
+    """Return the current app's counters in this process, or None if disabled.
+
+    Returns:
+        dict: ``classes``: per endpoint class its limits, ``active`` and
+        ``waiting`` requests and ``admitted``, ``queued``, ``rejected`` and
+        ``timed_out`` counts; ``rate_limited``: refusals per rate limit.
+    """
+    control = current_app.extensions.get("admission")
+    return control.status() if control is not None else None
+
+
+def init_app(app):
+    """Register admission control and its configuration defaults."""
+    app.config.setdefault("ADMISSION_ENABLED", True)
+    app.config.setdefault("ADMISSION_CLASSES", DEFAULT_CLASSES)
+    app.config.setdefault("ADMISSION_ROUTES", DEFAULT_ROUTES)
+    app.config.setdefault("ADMISSION_RATE_LIMITS", DEFAULT_RATE_LIMITS)
+    if not app.config["ADMISSION_ENABLED"]:
+        return
+    control = app.extensions["admission"] = AdmissionControl(
+        app.config["ADMISSION_CLASSES"],
+        app.config["ADMISSION_ROUTES"],
+        app.config["ADMISSION_RATE_LIMITS"],
+    )
+
+    @app.before_request
+    def admit():
+        return control.admit(request.endpoint)
+
+    @app.teardown_request
+    def release(exc):
+        slot = g.pop("admission_slot", None)
+        if slot is not None:
+            slot.release()
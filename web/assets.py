@@ -0,0 +1,144 @@
+"""Fingerprinted, precompressed static assets.
+
+``flask build-assets`` copies every file under ``static/`` to
+``static/dist/`` with a content hash in its name (CSS is minified first) and
+writes ``.gz`` and, when the optional ``brotli`` package is installed,
+``.br`` siblings next to it, plus a ``manifest.json`` mapping original to
+fingerprinted names.
+
+When a manifest exists, ``url_for('static', filename='style.css')`` points at
+the fingerprinted file, which is served with the best encoding the client
+accepts and ``Cache-Control: immutable``. Without a manifest the default
+static handling is unchanged.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+
+from flask import current_app, request, send_file
+from werkzeug.exceptions import NotFound
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+DIST_DIR = "dist"
+MANIFEST = "manifest.json"
+ONE_YEAR = 365 * 24 * 3600
+# encodings we precompress for, in order of preference
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+COMPRESSIBLE = (".css", ".js", ".svg", ".json", ".txt", ".html")
+
+
+def minify_css(css):
+    """Strip comments and redundant whitespace from a stylesheet."""
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r"\s*([{};,>])\s*", r"\1", css)
+    css = re.sub(r":\s+", ":", css)
+    css = css.replace(";}", "}")
+    return css.strip()
+
+
+def _fingerprinted(name, digest):
+    root, ext = os.path.splitext(name)
+    return f"{root}.{digest}{ext}"
+
+
+def build_assets(static_folder, compress_level=9):
+    """Fingerprint, minify and precompress every static file.
+
+    Args:
+        static_folder (str): The application's static directory.
+        compress_level (int): gzip level (brotli always uses its maximum).
+
+    Returns:
+        dict: The manifest, original name mapped to fingerprinted name.
+    """
+    dist = os.path.join(static_folder, DIST_DIR)
+    os.makedirs(dist, exist_ok=True)
+    manifest = {}
+    for root, dirs, files in os.walk(static_folder):
+        # never fingerprint our own output
+        dirs[:] = [d for d in dirs if os.path.join(root, d) != dist]
+        for filename in sorted(files):
+            source = os.path.join(root, filename)
+            name = os.path.relpath(source, static_folder).replace(os.sep, "/")
+            with open(source, "rb") as fh:
+                data = fh.read()
+            if name.endswith(".css"):
+                data = minify_css(data.decode("utf-8")).encode("utf-8")
+            digest = hashlib.sha256(data).hexdigest()[:12]
+            target_name = _fingerprinted(name, digest)
+            target = os.path.join(dist, target_name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, "wb") as fh:
+                fh.write(data)
+            if name.endswith(COMPRESSIBLE):
+                # mtime=0 keeps rebuilds byte-for-byte identical
+                with open(target + ".gz", "wb") as fh:
+                    fh.write(gzip.compress(data, compress_level, mtime=0))
+                if brotli is not None:
+                    with open(target + ".br", "wb") as fh:
+                        fh.write(brotli.compress(data, quality=11))
+            manifest[name] = f"{DIST_DIR}/{target_name}"
+    with open(os.path.join(dist, MANIFEST), "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh, indent=2, sort_keys=True)
+    return manifest
+
+
+def load_manifest(static_folder):
+    """Return the asset manifest, or an empty dict if assets were not built."""
+    try:
+        with open(os.path.join(static_folder, DIST_DIR, MANIFEST), encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def _accepted(encoding):
+    return request.accept_encodings[encoding] > 0
+
+
+def serve_static(filename):
+    """Static view that serves fingerprinted files precompressed and immutable."""
+    app = current_app
+    fingerprinted = filename.startswith(f"{DIST_DIR}/")
+    if not fingerprinted:
+        return app.send_static_file(filename)
+    path = safe_join(app.static_folder, filename)
+    if path is None or not os.path.isfile(path):
+        raise NotFound()
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    served, encoding = path, None
+    for name, suffix in ENCODINGS:
+        if os.path.isfile(path + suffix) and _accepted(name):
+            served, encoding = path + suffix, name
+            break
+    response = send_file(served, mimetype=mimetype, max_age=ONE_YEAR, conditional=True)
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+def init_app(app):
+    """Serve built assets under fingerprinted URLs when a manifest exists."""
+    manifest = load_manifest(app.static_folder)
+    app.extensions["asset_manifest"] = manifest
+    if not manifest:
+        return
+
+    @app.url_defaults
+    def fingerprint_static_urls(endpoint, values):
+        if endpoint == "static":
+            values["filename"] = manifest.get(values.get("filename"), values.get("filename"))
+
+    app.view_functions["static"] = serve_static
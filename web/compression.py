@@ -0,0 +1,122 @@
+"""Transparent gzip/brotli compression of dynamic responses.
+
+Text responses larger than ``COMPRESS_MIN_SIZE`` bytes are compressed with
+the best encoding the client accepts (brotli when the optional ``brotli``
+package is installed, otherwise gzip). Streamed responses are compressed
+chunk by chunk and flushed after every chunk, so clients still see data as
+it is produced. Responses that are already encoded (precompressed static
+assets), file responses and bodiless statuses are left alone.
+"""
+import gzip
+import zlib
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+DEFAULT_MIMETYPES = (
+    "text/html",
+    "text/css",
+    "text/plain",
+    "text/csv",
+    "text/event-stream",
+    "application/json",
+    "application/javascript",
+    "image/svg+xml",
+)
+
+
+def _choose_encoding(app):
+    accepted = request.accept_encodings
+    if brotli is not None and app.config["COMPRESS_BR_QUALITY"] is not None and accepted["br"] > 0:
+        return "br"
+    if accepted["gzip"] > 0:
+        return "gzip"
+    return None
+
+
+def _compressor(encoding, app):
+    """Return ``(compress, flush, finish)`` callables for a streaming compressor."""
+    if encoding == "br":
+        comp = brotli.Compressor(quality=app.config["COMPRESS_BR_QUALITY"])
+        return comp.process, comp.flush, comp.finish
+    # wbits=31 selects the gzip container
+    comp = zlib.compressobj(app.config["COMPRESS_LEVEL"], zlib.DEFLATED, 31)
+    return comp.compress, lambda: comp.flush(zlib.Z_SYNC_FLUSH), comp.flush
+
+
+def _stream(chunks, encoding, app):
+    compress, flush, finish = _compressor(encoding, app)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            data = compress(chunk) + flush()
+            if data:
+                yield data
+        yield finish()
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+
+def compress_response(response, app):
+    """Compress ``response`` in place if it is eligible.
+
+    Args:
+        response (Response): Outgoing response.
+        app (Flask): Application holding the COMPRESS_* settings.
+
+    Returns:
+        Response: The same response object.
+    """
+    if (
+        not app.config["COMPRESS_ENABLED"]
+        or response.status_code < 200
+        or response.status_code in (204, 206, 304)
+        or request.method == "HEAD"
+        or response.direct_passthrough
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in app.config["COMPRESS_MIMETYPES"]
+    ):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = _choose_encoding(app)
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = _stream(response.response, encoding, app)
+        response.headers.pop("Content-Length", None)
+    else:
+        data = response.get_data()
+        if len(data) < app.config["COMPRESS_MIN_SIZE"]:
+            return response
+        if encoding == "br":
+            data = brotli.compress(data, quality=app.config["COMPRESS_BR_QUALITY"])
+        else:
+            data = gzip.compress(data, app.config["COMPRESS_LEVEL"], mtime=0)
+        response.set_data(data)
+    response.headers["Content-Encoding"] = encoding
+    # a strong validator must change with the encoding; a weak one may not
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_app(app):
+    """Register the compression hook and its configuration defaults."""
+    app.config.setdefault("COMPRESS_ENABLED", True)
+    app.config.setdefault("COMPRESS_MIN_SIZE", 500)
+    app.config.setdefault("COMPRESS_LEVEL", 6)
+    # set to None to never use brotli even when it is installed
+    app.config.setdefault("COMPRESS_BR_QUALITY", 4)
+    app.config.setdefault("COMPRESS_MIMETYPES", DEFAULT_MIMETYPES)
+
+    @app.after_request
+    def compress(response):
+        return compress_response(response, app)
@@ -0,0 +1,81 @@
+"""Weak ETags from data version counters, checked before a view runs.
+
+:func:`conditional` tags a view with the data scopes it renders (see
+:class:`models.DataVersion`). The ETag is derived from those scopes'
+version counters plus the request URL and the signed-in user, so it costs
+one indexed query instead of rendering and hashing the body. A matching
+``If-None-Match`` is answered with 304 before the view is called.
+
+Pages carrying pending flash messages are never tagged: the flash is shown
+once, so that rendering must not be revalidated later.
+"""
+import datetime
+import functools
+import hashlib
+
+from flask import current_app, make_response, request, session
+
+from models import current_tenant, data_versions
+
+
+def compute_etag(scopes, view_args):
+    """Return the weak ETag value for the current request.
+
+    Args:
+        scopes (tuple): Scope templates; ``{session_user}`` and any view
+            argument (e.g. ``{user_id}``) are substituted.
+        view_args (dict): Arguments the view is called with.
+    """
+    session_user = session.get("user_id")
+    names = [s.format(session_user=session_user, **view_args) for s in scopes]
+    versions = data_versions(names)
+    key = repr((
+        request.full_path,
+        # user ids and versions are per tenant
+        current_tenant(),
+        session_user,
+        sorted(versions.items()),
+        # the footer shows the year
+        datetime.date.today().year,
+    ))
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:24]
+
+
+def _tag(response, etag):
+    response.set_etag(etag, weak=True)
+    # responses depend on the session cookie: cache privately, revalidate
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+def conditional(*scopes):
+    """Decorate a GET view with version-based ETags and early 304s.
+
+    Example::
+
+        @app.route("/my-movies")
+        @conditional("user:{session_user}", "catalogue", "users")
+        def list_my_movies(): ...
+    """
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if (
+                not current_app.config.get("CONDITIONAL_GET", True)
+                or request.method not in ("GET", "HEAD")
+                or session.get("_flashes")
+            ):
+                return view(*args, **kwargs)
+            etag = compute_etag(scopes, kwargs)
+            if request.if_none_match.contains_weak(etag):
+                return _tag(current_app.response_class(status=304), etag)
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200 and not session.get("_flashes"):
+                _tag(response, etag)
+            return response
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,170 @@
+"""Per-request memory profiling and session cleanup after read-only requests.
+
+With ``MEMORY_PROFILING`` enabled (``WEBFLIX_MEMORY_PROFILING=1``), requests
+are traced with :mod:`tracemalloc`: the peak of memory allocated while
+handling the request is sent back in an ``X-Memory-Peak`` header (bytes),
+logged, and aggregated per endpoint together with the source lines that
+allocated the memory still held when the view returned, typically ORM
+objects in the session's identity map (see :func:`memory_profile`,
+``GET /api/debug/memory``). Tracing slows every allocation down and
+tracemalloc counts the whole process, so only one request at a time is
+profiled; run a single worker thread to profile every request.
+
+``READONLY_SESSION_POLICY = "close"`` (the default) closes ``db.session``
+as soon as a GET or HEAD request without pending changes has its response,
+instead of at app context teardown, so the loaded object graph is released
+before the response is compressed and sent. ``READONLY_GC_GENERATION``
+(0-2, default off) also collects that garbage generation afterwards, for
+object graphs held together by reference cycles.
+"""
+import gc
+import os
+import threading
+import tracemalloc
+
+from flask import g, request
+
+from models import db
+
+_profiling = threading.Lock()
+_lock = threading.Lock()
+# endpoint -> [count, total peak, max peak, {site: bytes}]
+_totals = {}
+_IGNORED = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+def _site(stat):
+    frame = stat.traceback[0]
+    return f"{frame.filename}:{frame.lineno}"
+
+
+def _record(endpoint, peak, stats, top):
+    with _lock:
+        entry = _totals.setdefault(endpoint, [0, 0, 0, {}])
+        entry[0] += 1
+        entry[1] += peak
+        entry[2] = max(entry[2], peak)
+        sites = entry[3]
+        for stat in stats[:top]:
+            site = _site(stat)
+            sites[site] = sites.get(site, 0) + stat.size_diff
+
+
+def memory_profile(top=10):
+    """Return the profiles aggregated by this process, largest peak first.
+
+    Args:
+        top (int): Allocation sites listed per endpoint.
+
+    Returns:
+        list: Dicts with endpoint, count, avg_peak_kib, max_peak_kib and
+        sites: ``{"site": "file:line", "kib": ...}``, the lines that
+        allocated most of the memory still held at the end of the view,
+        summed over the profiled requests.
+    """
+    with _lock:
+        items = [(e, c, t, p, dict(s)) for e, (c, t, p, s) in _totals.items()]
+    rows = [
+        {
+            "endpoint": endpoint,
+            "count": count,
+            "avg_peak_kib": round(total / count / 1024, 1),
+            "max_peak_kib": round(peak / 1024, 1),
+            "sites": [
+                {"site": site, "kib": round(size / 1024, 1)}
+                for site, size in sorted(
+                    sites.items(), key=lambda item: item[1], reverse=True
+                )[:top]
+                if size > 0
+            ],
+        }
+        for endpoint, count, total, peak, sites in items
+    ]
+    return sorted(rows, key=lambda row: row["max_peak_kib"], reverse=True)
+
+
+def _read_only():
+    session = db.session
+    return request.method in ("GET", "HEAD") and not (
+        session.new or session.dirty or session.deleted
+    )
+
+
+def init_app(app):
+    """Register memory profiling and the read-only session policy."""
+    app.config.setdefault(
+        "MEMORY_PROFILING", os.environ.get("WEBFLIX_MEMORY_PROFILING") == "1"
+    )
+    # stack frames kept per allocation; sites are reported by their top frame
+    app.config.setdefault("MEMORY_PROFILING_FRAMES", 1)
+    app.config.setdefault("MEMORY_PROFILING_TOP", 10)
+    app.config.setdefault("READONLY_SESSION_POLICY", "close")
+    app.config.setdefault("READONLY_GC_GENERATION", None)
+
+    if app.config["READONLY_SESSION_POLICY"] == "close":
+
+        @app.after_request
+        def close_read_only_session(response):
+            # streamed bodies may still load from the session
+            if not response.is_streamed and _read_only():
+                db.session.close()
+                generation = app.config["READONLY_GC_GENERATION"]
+                if generation is not None:
+                    gc.collect(generation)
+            return response
+
+    # registered last so that it runs first: sites are taken before cleanup
+    if app.config["MEMORY_PROFILING"]:
+
+        @app.before_request
+        def start_memory_profile():
+            if not _profiling.acquire(blocking=False):
+                return
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(app.config["MEMORY_PROFILING_FRAMES"])
+            g.memory_profile = (
+                tracemalloc.take_snapshot().filter_traces(_IGNORED),
+                tracemalloc.get_traced_memory()[0],
+            )
+            tracemalloc.reset_peak()
+
+        @app.after_request
+        def report_memory_profile(response):
+            start = g.pop("memory_profile", None)
+            if start is None:
+                return response
+            try:
+                snapshot, baseline = start
+                peak = max(tracemalloc.get_traced_memory()[1] - baseline, 0)
+                stats = (
+                    tracemalloc.take_snapshot()
+                    .filter_traces(_IGNORED)
+                    .compare_to(snapshot, "lineno")
+                )
+                stats = [stat for stat in stats if stat.size_diff > 0]
+            finally:
+                _profiling.release()
+            top = app.config["MEMORY_PROFILING_TOP"]
+            _record(request.endpoint, peak, stats, top)
+            response.headers["X-Memory-Peak"] = str(peak)
+            app.logger.info(
+                "memory: %s peak %.1f KiB; top sites: %s",
+                request.endpoint,
+                peak / 1024,
+                ", ".join(
+                    f"{_site(stat)}={stat.size_diff / 1024:.1f}KiB"
+                    for stat in stats[:3]
+                ),
+            )
+            return response
+
+        @app.teardown_request
+        def abandon_memory_profile(exc):
+            # an error before after_request ran must not keep the lock
+            if g.pop("memory_profile", None) is not None:
+                _profiling.release()
@@ -0,0 +1,38 @@
+"""JSON answers to form posts made from scripts.
+
+The form actions (toggle watched, remove from a list, edit genres, add from
+OMDb) answer a plain form post with a redirect, so the browser re-requests
+and re-renders the whole page. ``static/live.js`` posts the same forms with
+``fetch`` and ``Accept: application/json``; :func:`action_response` then
+returns the flash messages, the URL the form would have redirected to and
+a few action-specific fields (often an HTML fragment to swap in) instead.
+"""
+from flask import get_flashed_messages, jsonify, redirect, request
+
+
+def wants_partial():
+    """Return True if the client prefers JSON to a redirect."""
+    best = request.accept_mimetypes.best_match(("text/html", "application/json"))
+    return best == "application/json"
+
+
+def action_response(redirect_url, status=200, **fields):
+    """Finish a form action.
+
+    Args:
+        redirect_url (str): Where a plain form post is redirected.
+        status (int): Status of the JSON answer (the redirect is always 302).
+        **fields: Extra members of the JSON answer.
+
+    Returns:
+        Response: A redirect, or for script requests a JSON object with the
+        flashed ``messages`` (taken out of the session, so they are not
+        shown again on the next page), ``redirect`` and ``fields``.
+    """
+    if not wants_partial():
+        return redirect(redirect_url)
+    messages = [
+        {"category": category, "message": message}
+        for category, message in get_flashed_messages(with_categories=True)
+    ]
+    return jsonify(messages=messages, redirect=redirect_url, **fields), status
@@ -0,0 +1,54 @@
+"""Server-Sent Events responses.
+
+:func:`sse_response` streams the events produced by a generator. A
+generator yields :func:`format_event` strings, or ``None`` when it has
+nothing to send; after ``SSE_HEARTBEAT`` seconds without an event a comment
+line is sent so proxies keep the connection open. Clients (``EventSource``)
+reconnect on their own and resume with the ``Last-Event-ID`` header.
+
+Each open stream occupies a worker thread, so serve them from a threaded
+or async worker class, not from a small pool of sync workers.
+"""
+import json
+import time
+
+from flask import Response, current_app, stream_with_context
+
+
+def format_event(data, event=None, id=None, retry=None):
+    """Encode one event; ``data`` that is not a string is sent as JSON."""
+    lines = []
+    if event:
+        lines.append(f"event: {event}")
+    if id is not None:
+        lines.append(f"id: {id}")
+    if retry is not None:
+        lines.append(f"retry: {int(retry * 1000)}")
+    if not isinstance(data, str):
+        data = json.dumps(data, separators=(",", ":"))
+    lines.extend(f"data: {line}" for line in data.splitlines() or [""])
+    return "\n".join(lines) + "\n\n"
+
+
+def sse_response(events):
+    """Return a streaming ``text/event-stream`` response for ``events``."""
+    heartbeat = current_app.config.get("SSE_HEARTBEAT", 15.0)
+
+    def stream():
+        last_sent = time.monotonic()
+        # flush the headers so EventSource fires "open" straight away
+        yield ": connected\n\n"
+        for chunk in events:
+            now = time.monotonic()
+            if chunk:
+                last_sent = now
+                yield chunk
+            elif now - last_sent >= heartbeat:
+                last_sent = now
+                yield ": keep-alive\n\n"
+
+    return Response(
+        stream_with_context(stream()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
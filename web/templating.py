@@ -0,0 +1,147 @@
+"""Jinja bytecode caching, template precompilation and render profiling.
+
+Compiled templates are stored in ``TEMPLATE_CACHE_DIR`` (default
+``data/jinja_cache``) so every worker process, and every restart, loads
+bytecode instead of parsing and compiling template source. Jinja validates
+entries against a checksum of the source, so edited templates are simply
+recompiled. ``flask compile-templates`` fills the cache ahead of time.
+
+With ``TEMPLATE_PROFILING`` enabled, the render time of every template and
+of every ``{% block %}`` is recorded per request, sent back in a
+``Server-Timing`` header, logged, and aggregated per process (see
+:func:`template_timings`). Times are inclusive: a layout's time contains the
+blocks it renders.
+"""
+import os
+import threading
+import time
+
+from flask import g, has_app_context
+from jinja2 import FileSystemBytecodeCache, Template
+
+ROOT = "<root>"
+
+_lock = threading.Lock()
+# (template, block) -> [count, total seconds, max seconds]
+_totals = {}
+
+
+def _record(template, block, elapsed):
+    key = (template, block)
+    with _lock:
+        entry = _totals.setdefault(key, [0, 0.0, 0.0])
+        entry[0] += 1
+        entry[1] += elapsed
+        entry[2] = max(entry[2], elapsed)
+    if has_app_context():
+        timings = g.setdefault("template_timings", {})
+        timings[key] = timings.get(key, 0.0) + elapsed
+
+
+def _timed(template, block, render_func):
+    def timed_render(context):
+        start = time.perf_counter()
+        try:
+            yield from render_func(context)
+        finally:
+            _record(template, block, time.perf_counter() - start)
+
+    return timed_render
+
+
+class ProfilingTemplate(Template):
+    """Template whose root render function and blocks record their timing."""
+
+    @classmethod
+    def _from_namespace(cls, environment, namespace, globals):
+        template = super()._from_namespace(environment, namespace, globals)
+        name = template.name
+        template.root_render_func = _timed(name, ROOT, template.root_render_func)
+        template.blocks = {
+            block: _timed(name, block, func) for block, func in template.blocks.items()
+        }
+        return template
+
+
+def template_timings():
+    """Return the timings aggregated by this process, slowest total first.
+
+    Returns:
+        list: Dicts with template, block, count, total_ms, avg_ms and max_ms.
+    """
+    with _lock:
+        items = list(_totals.items())
+    rows = [
+        {
+            "template": template,
+            "block": block,
+            "count": count,
+            "total_ms": round(total * 1000, 3),
+            "avg_ms": round(total / count * 1000, 3),
+            "max_ms": round(peak * 1000, 3),
+        }
+        for (template, block), (count, total, peak) in items
+    ]
+    return sorted(rows, key=lambda row: row["total_ms"], reverse=True)
+
+
+def _server_timing(timings):
+    metrics = []
+    for i, ((template, block), elapsed) in enumerate(
+        sorted(timings.items(), key=lambda item: item[1], reverse=True)
+    ):
+        label = template if block == ROOT else f"{template}#{block}"
+        metrics.append(f'tpl{i};desc="{label}";dur={elapsed * 1000:.2f}')
+    return ", ".join(metrics)
+
+
+def compile_templates(app):
+    """Compile every template into the bytecode cache.
+
+    Returns:
+        tuple: ``(compiled, failed)`` lists of template names.
+    """
+    env = app.jinja_env
+    compiled, failed = [], []
+    for name in env.list_templates():
+        try:
+            env.get_template(name)
+        except Exception as e:  # report every broken template, not just the first
+            failed.append(f"{name}: {e}")
+        else:
+            compiled.append(name)
+    return compiled, failed
+
+
+def init_app(app):
+    """Enable the bytecode cache and, if configured, render profiling."""
+    app.config.setdefault(
+        "TEMPLATE_CACHE_DIR", os.path.join(app.root_path, "data", "jinja_cache")
+    )
+    app.config.setdefault(
+        "TEMPLATE_PROFILING", os.environ.get("TEMPLATE_PROFILING") == "1"
+    )
+
+    cache_dir = app.config["TEMPLATE_CACHE_DIR"]
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+
+    if not app.config["TEMPLATE_PROFILING"]:
+        return
+    app.jinja_env.template_class = ProfilingTemplate
+    # templates compiled before profiling was switched on keep their class
+    app.jinja_env.cache.clear()
+
+    @app.after_request
+    def report_template_timings(response):
+        timings = g.pop("template_timings", None)
+        if timings:
+            response.headers.add("Server-Timing", _server_timing(timings))
+            app.logger.info(
+                "template timings: %s",
+                ", ".join(
+                    f"{t}#{b}={s * 1000:.2f}ms" for (t, b), s in timings.items()
+                ),
+            )
+        return response
@@ -0,0 +1,453 @@
+"""Warming a freshly started process before it takes traffic.
+
+After a deploy the first visitors of ``/all-movies``, the genre filters and
+popular movie pages pay for cold caches: SQLite pages not yet in the OS
+cache, templates not yet compiled, in-memory indexes not yet built and OMDb
+details not yet fetched. :func:`warm_up` does that work up front:
+
+* replays the hot routes (``WARMUP_ROUTES``, or the most-requested pages of
+  an access log, or a default set: the catalogue, its most common genre
+  filters and the most-listed movies) through the app, once cold and once
+  warm, and reports both latencies;
+* reads the database files and scans every table and index, so their pages
+  are in the OS cache and the connection's page cache;
+* compiles every template into the bytecode cache;
+* builds the genre and title indexes and the catalogue snapshot;
+* fetches OMDb details of the most-listed movies into the shared cache and
+  caches the avatar variants served locally (posters are hot-linked from
+  the image host, so there is nothing local to prime for them).
+
+``flask warmup`` runs it from the command line, which warms what is shared
+between processes (OS page cache, template bytecode, OMDb and avatar
+caches). With ``WARMUP_ON_START`` (``WEBFLIX_WARMUP=1``) ``wsgi.py`` runs it
+in the serving process itself, and in gunicorn's preload mode in the master,
+so the in-memory indexes are forked into every worker already built.
+
+Under ``TENANT_SHARDING`` the routes are replayed as ``TENANT_DEFAULT``;
+without a default, once as every tenant (named by ``TENANT_HEADER`` or
+``TENANT_DOMAIN``), since an anonymous request belongs to no tenant.
+"""
+import contextlib
+import contextvars
+import os
+import re
+import time
+from collections import Counter
+
+from flask import current_app
+from sqlalchemy import Float, cast, func, select, text
+
+from indexes import get_genre_index, get_snapshot, get_suggest_index
+from media import AVATAR_VARIANTS, cached_variant, get_uploader, user_variant_url
+from models import db, Movie, User, UserMovie, get_tenants, movie_genre, use_tenant
+from omdb import OMDbError, get_client
+
+from .templating import compile_templates
+
+# a request line and status in the common/combined log format (and gunicorn's)
+_LOG_LINE = re.compile(r'"(?:GET|HEAD) (?P<path>\S+) HTTP/[\d.]+" (?P<status>\d{3}) ')
+# routes that stream, wait for changes or change state even on GET
+DEFAULT_EXCLUDE = (
+    "/static/",
+    "/api/changes",
+    "/api/debug/",
+    "/my-movies/events",
+    "/set_user/",
+    "/logout",
+)
+_CHUNK = 1 << 20
+
+
+def _popular_movies(limit):
+    """Return IDs of the movies on the most user lists, then by rating."""
+    listed = func.count(UserMovie.user_id)
+    return list(
+        db.session.scalars(
+            select(Movie.id)
+            .outerjoin(UserMovie, UserMovie.movie_id == Movie.id)
+            .group_by(Movie.id)
+            .order_by(listed.desc(), cast(Movie.imdb_rating, Float).desc(), Movie.id)
+            .limit(limit)
+        )
+    )
+
+
+def _common_genres(limit):
+    """Return IDs of the genres with the most movies."""
+    return list(
+        db.session.scalars(
+            select(movie_genre.c.genre_id)
+            .group_by(movie_genre.c.genre_id)
+            .order_by(func.count().desc(), movie_genre.c.genre_id)
+            .limit(limit)
+        )
+    )
+
+
+def logged_routes(path, top=20, exclude=DEFAULT_EXCLUDE):
+    """Return the ``top`` most requested pages of an access log.
+
+    Only successful GET and HEAD requests (``200``, ``304``) are counted.
+
+    Args:
+        path (str): Access log in the common or combined format.
+        top (int): Number of routes to return.
+        exclude (tuple): Path prefixes never returned.
+
+    Returns:
+        list: Paths with their query strings, most requested first.
+    """
+    hits = Counter()
+    with open(path, encoding="utf-8", errors="replace") as fh:
+        for line in fh:
+            match = _LOG_LINE.search(line)
+            if match and match["status"] in ("200", "304"):
+                route = match["path"]
+                if not route.startswith(exclude):
+                    hits[route] += 1
+    return [route for route, _ in hits.most_common(top)]
+
+
+def _replay_tenants(app):
+    """Return the tenants to replay the routes as; ``[None]``: unnamed.
+
+    Empty under sharding when no request could name a tenant (no
+    ``TENANT_DEFAULT``, header or domain).
+    """
+    config = app.config
+    if not config.get("TENANT_SHARDING") or config["TENANT_DEFAULT"]:
+        return [None]
+    if not (config["TENANT_HEADER"] or config["TENANT_DOMAIN"]):
+        return []
+    with app.app_context():
+        return get_tenants().keys()
+
+
+@contextlib.contextmanager
+def _tenant_context(app, tenant):
+    """Push an app context reading ``tenant``'s database (None: the default)."""
+    with app.app_context():
+        if tenant is None:
+            yield
+        else:
+            with use_tenant(tenant):
+                yield
+
+
+def _request_args(app, tenant):
+    """Return the test client arguments that name ``tenant``."""
+    if tenant is None:
+        return {}
+    if app.config["TENANT_HEADER"]:
+        return {"headers": {app.config["TENANT_HEADER"]: tenant}}
+    return {"base_url": f"http://{tenant}.{app.config['TENANT_DOMAIN']}/"}
+
+
+def hot_routes(app, access_log=None, top=None, tenant=None):
+    """Return the routes to warm, in order.
+
+    ``WARMUP_ROUTES`` if set, else the most requested pages of
+    ``access_log`` (or ``WARMUP_ACCESS_LOG``), else the home page, the
+    catalogue with and without its most common genre filters, the
+    statistics and the detail pages of the most-listed movies.
+
+    Args:
+        app (Flask): The application.
+        access_log (str): Access log to read the routes from.
+        top (int): Routes taken from the log, and movie pages in the
+            default set (default ``WARMUP_TOP``).
+        tenant (str): Tenant whose lists pick the most-listed movies.
+    """
+    config = app.config
+    top = top or config["WARMUP_TOP"]
+    if config["WARMUP_ROUTES"]:
+        return list(config["WARMUP_ROUTES"])
+    access_log = access_log or config["WARMUP_ACCESS_LOG"]
+    if access_log:
+        return logged_routes(access_log, top, tuple(config["WARMUP_EXCLUDE"]))
+    routes = ["/"]
+    with _tenant_context(app, tenant):
+        if "catalogue.list_all_movies" in app.view_functions:
+            routes.append("/all-movies")
+            routes += [
+                f"/all-movies?filter_genre_id={genre_id}"
+                for genre_id in _common_genres(config["WARMUP_TOP_GENRES"])
+            ]
+            routes.append("/stats")
+            routes += [f"/movie/{movie_id}" for movie_id in _popular_movies(top)]
+    if "ingest.add_movie_search_page" in app.view_functions:
+        routes.append("/add-movie-search")
+    return routes
+
+
+def replay(app, routes, tenant=None):
+    """Request each route once and return ``{route: (status, ms)}``.
+
+    Requests are anonymous and carry no validators, so every page is built
+    in full. Streamed bodies are not read.
+
+    Args:
+        app (Flask): The application.
+        routes (list): Routes to request.
+        tenant (str): Tenant to name in each request (default: none).
+    """
+    # in an empty context: `flask` commands run with an app context pushed,
+    # and requests would share its g and database session
+    return contextvars.Context().run(_replay, app, routes, tenant)
+
+
+def _replay(app, routes, tenant):
+    client = app.test_client()
+    kwargs = _request_args(app, tenant)
+    results = {}
+    for route in routes:
+        started = time.perf_counter()
+        response = client.get(route, **kwargs)
+        if not response.is_streamed:
+            response.get_data()
+        elapsed = (time.perf_counter() - started) * 1000
+        response.close()
+        results[route] = (response.status_code, elapsed)
+    return results
+
+
+def _database_files():
+    files = [db.engine.url.database]
+    registry = get_tenants()
+    if registry is not None:
+        files += [registry.path(key) for key in registry.keys()]
+    return [path for path in files if path and os.path.exists(path)]
+
+
+def touch_database():
+    """Read the SQLite files and scan every table and index.
+
+    Reading the files puts their pages in the OS cache, which every process
+    shares; the scans (``NOT INDEXED``/``INDEXED BY``) load the b-trees
+    through SQLite, into this process's connection as far as its page
+    cache allows.
+
+    Returns:
+        dict: files, bytes read, tables and indexes scanned.
+    """
+    if db.engine.dialect.name != "sqlite":
+        return {"files": 0, "bytes": 0, "tables": 0, "indexes": 0}
+    read = 0
+    files = _database_files()
+    for path in files:
+        with open(path, "rb") as fh:
+            while chunk := fh.read(_CHUNK):
+                read += len(chunk)
+    tables = indexes = 0
+    with db.engine.connect() as conn:
+        rows = conn.execute(
+            text(
+                "SELECT type, name, tbl_name FROM sqlite_master "
+                "WHERE type IN ('table', 'index') AND name NOT LIKE 'sqlite_%'"
+            )
+        ).all()
+        for kind, name, table in rows:
+            if kind == "table":
+                conn.execute(text(f'SELECT count(*) FROM "{name}" NOT INDEXED'))
+                tables += 1
+            else:
+                conn.execute(
+                    text(f'SELECT count(*) FROM "{table}" INDEXED BY "{name}"')
+                )
+                indexes += 1
+    return {"files": len(files), "bytes": read, "tables": tables, "indexes": indexes}
+
+
+def build_indexes():
+    """Build (or bring up to date) the in-memory catalogue indexes.
+
+    Returns:
+        dict: ``{index name: "rebuilt" | "patched" | "current"}``.
+    """
+    built = {
+        "genres": get_genre_index().refresh(force=True),
+        "suggest": get_suggest_index().refresh(force=True),
+    }
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        built["snapshot"] = snapshot.refresh(force=True)
+    return built
+
+
+def prime_omdb(limit):
+    """Fetch OMDb details of the most-listed movies into the shared cache.
+
+    Does nothing without an OMDb client (its blueprints are disabled) or
+    API key. Lookups use the ``prefetch`` share of the quota.
+
+    Returns:
+        dict: Movies already cached, fetched and failed.
+    """
+    counts = {"cached": 0, "fetched": 0, "failed": 0}
+    app = current_app
+    if not limit or "omdb" not in app.extensions or not app.config["OMDB_API_KEY"]:
+        return counts
+    client = get_client()
+    imdb_ids = db.session.scalars(
+        select(Movie.omdb_id).where(
+            Movie.id.in_(_popular_movies(limit)), Movie.omdb_id.isnot(None)
+        )
+    )
+    for imdb_id in imdb_ids:
+        if client.is_cached(imdb_id):
+            counts["cached"] += 1
+            continue
+        try:
+            client.details(imdb_id, priority="prefetch")
+        except OMDbError as e:
+            print(f"Warning: Could not prefetch OMDb details for {imdb_id}: {e}")
+            counts["failed"] += 1
+        else:
+            counts["fetched"] += 1
+    return counts
+
+
+def prime_avatars(limit):
+    """Cache the avatar variants served by this process (``/avatars/...``).
+
+    Returns:
+        dict: Variants cached and failed.
+    """
+    counts = {"cached": 0, "failed": 0}
+    if not limit or "users.avatar" not in current_app.view_functions:
+        return counts
+    users = db.session.scalars(
+        select(User).where(User.profile_pic_url.isnot(None)).limit(limit)
+    ).all()
+    if not users:
+        return counts
+    uploader = get_uploader()
+    for user in users:
+        for variant in AVATAR_VARIANTS:
+            url = user_variant_url(user, variant)
+            try:
+                cached_variant(url, uploader)
+            except Exception as e:  # a broken picture must not stop the warm-up
+                print(f"Warning: Could not cache avatar {url}: {e}")
+                counts["failed"] += 1
+            else:
+                counts["cached"] += 1
+    return counts
+
+
+def _compiled(app):
+    compiled, failed = compile_templates(app)
+    for problem in failed:
+        print(f"Warning: Could not compile template {problem}")
+    return {"compiled": len(compiled), "failed": len(failed)}
+
+
+def warm_up(app, routes=None, access_log=None, top=None, omdb=True):
+    """Warm ``app``'s caches and time its hot routes before and after.
+
+    The routes are replayed first, as the first visitors would find them;
+    then the database, templates, indexes, OMDb and avatar caches are
+    primed; then the routes are replayed again.
+
+    Args:
+        app (Flask): The application.
+        routes (list): Routes to replay (default :func:`hot_routes`).
+        access_log (str): Access log to take the routes from.
+        top (int): See :func:`hot_routes`.
+        omdb (bool): Prime the OMDb cache (it spends API quota).
+
+    Returns:
+        dict: ``routes``: ``{route: {"status", "before_ms", "after_ms"}}``,
+        routes replayed as a named tenant labelled ``"<tenant> <route>"``;
+        ``steps``: ``{step: {"ms": ..., **details}}``; the totals
+        ``before_ms`` and ``after_ms``; ``elapsed_ms``.
+    """
+    started = time.perf_counter()
+    tenants = _replay_tenants(app)
+    if not tenants:
+        print(
+            "Warning: Not replaying routes: sharding with no TENANT_DEFAULT, "
+            "TENANT_HEADER or TENANT_DOMAIN to name a tenant"
+        )
+    planned = {
+        tenant: routes or hot_routes(app, access_log, top, tenant) for tenant in tenants
+    }
+    before = _replay_all(app, planned)
+
+    steps = {}
+
+    def step(name, work):
+        step_started = time.perf_counter()
+        result = work()
+        steps[name] = {"ms": (time.perf_counter() - step_started) * 1000, **result}
+
+    def avatars():
+        counts = Counter()
+        for tenant in tenants or [None]:
+            with _tenant_context(app, tenant):
+                counts.update(prime_avatars(config["WARMUP_AVATAR_LIMIT"]))
+        return dict(counts)
+
+    config = app.config
+    with _tenant_context(app, tenants[0] if tenants else None):
+        step("database", touch_database)
+        step("templates", lambda: _compiled(app))
+        step("indexes", build_indexes)
+        if omdb:
+            step("omdb", lambda: prime_omdb(config["WARMUP_OMDB_LIMIT"]))
+    step("avatars", avatars)
+
+    after = _replay_all(app, planned)
+    return {
+        "routes": {
+            route: {
+                "status": after[route][0],
+                "before_ms": before[route][1],
+                "after_ms": after[route][1],
+            }
+            for route in after
+        },
+        "steps": steps,
+        "before_ms": sum(elapsed for _, elapsed in before.values()),
+        "after_ms": sum(elapsed for _, elapsed in after.values()),
+        "elapsed_ms": (time.perf_counter() - started) * 1000,
+    }
+
+
+def _replay_all(app, planned):
+    """Replay ``{tenant: routes}``; label named tenants' routes with the key."""
+    results = {}
+    for tenant, routes in planned.items():
+        for route, result in replay(app, routes, tenant).items():
+            results[route if tenant is None else f"{tenant} {route}"] = result
+    return results
+
+
+def warm_up_on_start(app):
+    """Run :func:`warm_up` if ``WARMUP_ON_START`` is set; log the result."""
+    if not app.config["WARMUP_ON_START"]:
+        return None
+    report = warm_up(app, omdb=app.config["WARMUP_OMDB"])
+    print(
+        f"ℹ️ Warmed up {len(report['routes'])} routes in "
+        f"{report['elapsed_ms'] / 1000:.1f}s: {report['before_ms']:.0f} ms "
+        f"cold, {report['after_ms']:.0f} ms warm"
+    )
+    return report
+
+
+def init_app(app):
+    """Read the warm-up settings."""
+    app.config.setdefault("WARMUP_ON_START", os.environ.get("WEBFLIX_WARMUP") == "1")
+    # explicit routes to replay; empty: from WARMUP_ACCESS_LOG or the defaults
+    app.config.setdefault("WARMUP_ROUTES", [])
+    app.config.setdefault(
+        "WARMUP_ACCESS_LOG", os.environ.get("WEBFLIX_WARMUP_ACCESS_LOG")
+    )
+    app.config.setdefault("WARMUP_EXCLUDE", list(DEFAULT_EXCLUDE))
+    app.config.setdefault("WARMUP_TOP", 20)
+    app.config.setdefault("WARMUP_TOP_GENRES", 5)
+    # the startup hook spends no OMDb quota unless asked to
+    app.config.setdefault("WARMUP_OMDB", False)
+    app.config.setdefault("WARMUP_OMDB_LIMIT", 50)
+    app.config.setdefault("WARMUP_AVATAR_LIMIT", 100)
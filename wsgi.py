@@ -0,0 +1,8 @@
+"""WSGI entry point: ``gunicorn -c gunicorn.conf.py wsgi:app``."""
+from app import create_app
+from web import warm_up_on_start
+
+app = create_app()
+# With WEBFLIX_WARMUP=1, replay the hot routes before taking traffic (in
+# preload mode once in the master, so the workers inherit warm indexes)
+warm_up_on_start(app)